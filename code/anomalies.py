@@ -0,0 +1,137 @@
+# anomalies.py
+#
+# Flags unusual quarters in every (market, class, metric) series at once.
+#
+# The PAD rows are scattered into one 2-D array, a row per series and a column
+# per quarter, and two checks run over the whole array with NumPy:
+#
+#   rolling   modified z-score of each quarter-over-quarter change against the
+#             median and MAD (median absolute deviation) of the previous
+#             `window` changes, so steady trends aren't flagged but jumps are
+#   seasonal  the series is split into a centered 2x4 moving-average trend, an
+#             average effect per quarter of the year, and a residual; the
+#             residual is scored against the series' own residual MAD
+#
+# Both are robust to the outliers they're looking for, and the cost is linear
+# in series x quarters (x window), so adding markets or metrics adds rows, not
+# passes. Results come back as one tidy frame of flagged (series, quarter) rows.
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+METRICS = ['internal_class_rent', 'availability_proportion', 'leasing']
+
+# 0.6745 is the 75th percentile of the standard normal, so MAD / 0.6745 estimates
+# the standard deviation and 3.5 is the usual modified z-score cut-off
+MAD_SCALE = 0.6745
+THRESHOLD = 3.5
+
+def _as_list(cols):
+    return [cols] if isinstance(cols, str) else list(cols)
+
+def series_matrix(df, metrics=METRICS, by=('market', 'internal_class'), time=('year', 'quarter')):
+    """Scatter rows into a (series, period) array with one series per group and metric
+
+    Returns (keys, periods, values): keys has the group columns plus 'metric' for
+    each row of values, periods has the time columns for each column.
+    """
+    by, time, metrics = _as_list(by), _as_list(time), _as_list(metrics)
+    groups = df[by].drop_duplicates().sort_values(by).reset_index(drop=True)
+    periods = df[time].drop_duplicates().sort_values(time).reset_index(drop=True)
+
+    group_codes = pd.MultiIndex.from_frame(groups).get_indexer(pd.MultiIndex.from_frame(df[by]))
+    period_codes = pd.MultiIndex.from_frame(periods).get_indexer(pd.MultiIndex.from_frame(df[time]))
+
+    values = np.full((len(groups), len(metrics), len(periods)), np.nan)
+    values[group_codes, :, period_codes] = df[metrics].to_numpy(dtype=float)
+
+    keys = groups.loc[groups.index.repeat(len(metrics))].reset_index(drop=True)
+    keys['metric'] = np.tile(metrics, len(groups))
+    return keys, periods, values.reshape(len(groups) * len(metrics), len(periods))
+
+def _nanmedian(values, axis):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(values, axis=axis)
+
+def rolling_scores(values, window=8, min_periods=4):
+    """Modified z-score of each point against the median/MAD of the preceding window
+
+    Returns (scores, expected) with expected the rolling median. Points with
+    fewer than min_periods earlier values, or a zero MAD, get NaN.
+    """
+    padded = np.concatenate([np.full((values.shape[0], window), np.nan), values[:, :-1]], axis=1)
+    history = sliding_window_view(padded, window, axis=1)[:, :values.shape[1]]
+
+    median = _nanmedian(history, axis=2)
+    mad = _nanmedian(np.abs(history - median[:, :, np.newaxis]), axis=2)
+    enough = np.sum(~np.isnan(history), axis=2) >= min_periods
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = MAD_SCALE * (values - median) / mad
+    scores[~enough | (mad == 0)] = np.nan
+    return scores, median
+
+def seasonal_scores(values, season, period=4):
+    """Robust z-score of the residual after removing a moving-average trend and seasonal means
+
+    season gives each column's position in the cycle (0..period-1).
+    """
+    # Centered 2x4 moving average; NaN where the window isn't full
+    weights = np.r_[0.5, np.ones(period - 1), 0.5] / period
+    half = period // 2
+    padded = np.pad(values, ((0, 0), (half, half)), constant_values=np.nan)
+    trend = sliding_window_view(padded, period + 1, axis=1) @ weights
+
+    detrended = values - trend
+    effects = np.full((values.shape[0], period), np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for position in range(period):
+            effects[:, position] = np.nanmean(detrended[:, season == position], axis=1)
+        effects -= np.nanmean(effects, axis=1, keepdims=True)
+
+    expected = trend + effects[:, season]
+    residual = values - expected
+    center = _nanmedian(residual, axis=1)[:, np.newaxis]
+    mad = _nanmedian(np.abs(residual - center), axis=1)[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = MAD_SCALE * (residual - center) / mad
+    scores[np.broadcast_to(mad == 0, scores.shape)] = np.nan
+    return scores, expected
+
+def _quarter_number(quarters):
+    quarters = pd.Series(quarters)
+    if quarters.dtype == object:
+        quarters = quarters.str.lstrip('Q')
+    return pd.to_numeric(quarters).to_numpy(dtype=int)
+
+def detect_anomalies(df, metrics=METRICS, by=('market', 'internal_class'), window=8,
+                     threshold=THRESHOLD, methods=('rolling', 'seasonal')):
+    """Flagged (series, quarter) rows with |score| above threshold, most extreme first"""
+    keys, periods, values = series_matrix(df, metrics, by)
+
+    results = []
+    for method in methods:
+        if method == 'rolling':
+            previous = np.concatenate([np.full((len(values), 1), np.nan), values[:, :-1]], axis=1)
+            scores, expected_change = rolling_scores(values - previous, window)
+            expected = previous + expected_change
+        elif method == 'seasonal':
+            scores, expected = seasonal_scores(values, _quarter_number(periods['quarter']) - 1)
+        else:
+            raise ValueError(f"unknown method {method!r}; use 'rolling' or 'seasonal'")
+
+        with np.errstate(invalid='ignore'):
+            rows, cols = np.nonzero(np.abs(scores) > threshold)
+        flagged = keys.iloc[rows].reset_index(drop=True)
+        flagged[list(periods.columns)] = periods.iloc[cols].to_numpy()
+        flagged['value'] = values[rows, cols]
+        flagged['expected'] = expected[rows, cols]
+        flagged['score'] = scores[rows, cols]
+        flagged['method'] = method
+        results.append(flagged)
+
+    flagged = pd.concat(results, ignore_index=True)
+    order = np.argsort(-np.abs(flagged['score'].to_numpy()), kind='stable')
+    return flagged.iloc[order].reset_index(drop=True)
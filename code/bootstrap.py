@@ -0,0 +1,241 @@
+# bootstrap.py
+#
+# Confidence intervals for the COVID recovery metrics of
+# market_analysis.analyze_covid_recovery() and the leased SF growth rates in
+# growth_rates.csv:
+#
+#     python code/cli.py bootstrap covid -n 5000
+#     python code/cli.py bootstrap growth --unit quarters -j 4 --output data/growth_intervals.csv
+#     table = bootstrap_growth_rates(2018, 2024, replicates=2000)
+#
+# Both metrics are built from per-group sums and means (a market in a period or a
+# year), so a bootstrap replicate is: resample the rows of every group with
+# replacement, recompute the group sums and non-missing counts, and recompute
+# the metrics from those. Rows are laid out sorted by group, and a batch of
+# replicates is one index matrix, replicates x rows, where each row's draw falls
+# inside its own group's range; gathering the values through it and summing
+# with np.add.reduceat over the group starts gives every group of every
+# replicate at once. Batches hold about BATCH_VALUES gathered values, get their
+# own seed spawned from the base seed (so results don't depend on jobs), and
+# run in worker processes with jobs > 1. Each worker is sent the values once,
+# when it starts, and then only batch sizes and seeds.
+#
+# What gets resampled:
+#   covid   PAD rows (one per internal class) of each market in each of the
+#           three COVID quarters
+#   growth  leases of each market in the start and end years, or with
+#           unit='quarters' the market's quarterly totals within each year
+# Intervals are percentile intervals over the replicates; the estimate is the
+# metric of the original data, the same number the analysis reports.
+import warnings
+import numpy as np
+import pandas as pd
+import loaders
+from concurrent.futures import ProcessPoolExecutor
+from engine import groupby_agg
+from memory_budget import read_frames
+from instrumentation import stage, instrument
+
+# Values gathered per batch (replicates x rows x columns), about 160 MB of floats
+BATCH_VALUES = 20_000_000
+
+COVID_PERIODS = {'Pre-COVID': (2019, 'Q4'), 'During COVID': (2020, 'Q2'), 'Recent': (2023, 'Q4')}
+RECOVERY_METRICS = ['leasing_drop', 'leasing_recovery', 'availability_increase',
+                    'recent_availability_change', 'rent_growth']
+GROWTH_METRICS = ['growth_rate', 'cagr']
+
+def _group_sums(values, present, index, sizes):
+    """Sums and non-missing counts per group of the rows picked by index (replicates x rows)"""
+    shape = (index.shape[0], len(sizes), values.shape[1])
+    sums, counts = np.zeros(shape), np.zeros(shape, dtype=np.int64)
+    nonempty = sizes > 0
+    if nonempty.any():
+        starts = (np.cumsum(sizes) - sizes)[nonempty]
+        sums[:, nonempty] = np.add.reduceat(values[index], starts, axis=1)
+        if present is None:
+            # Nothing missing: every draw counts
+            counts[:, nonempty] = sizes[nonempty, np.newaxis]
+        else:
+            counts[:, nonempty] = np.add.reduceat(present[index], starts, axis=1)
+    return sums, counts
+
+def _replicate_batch(values, sizes, replicates, seed):
+    """Group sums and counts of a batch of bootstrap replicates"""
+    rng = np.random.default_rng(seed)
+    starts = np.cumsum(sizes) - sizes
+    # Each row draws a row of its own group: group start + a uniform offset below the group size
+    row_start, row_size = np.repeat(starts, sizes), np.repeat(sizes, sizes)
+    offset = (rng.random((replicates, len(row_size))) * row_size).astype(np.int64)
+    index = row_start + np.minimum(offset, row_size - 1)
+    present = ~np.isnan(values)
+    return _group_sums(np.where(present, values, 0.0), None if present.all() else present.astype(np.int64),
+                       index, sizes)
+
+# The values and group sizes of the current resample_groups call, in a worker process
+_worker_data = {}
+
+def _init_worker(values, sizes):
+    _worker_data['values'], _worker_data['sizes'] = values, sizes
+
+def _worker_batch(replicates, seed):
+    return _replicate_batch(_worker_data['values'], _worker_data['sizes'], replicates, seed)
+
+def resample_groups(values, group, n_groups, replicates=2000, seed=0, jobs=1):
+    """Bootstrap sums and non-missing counts of every column per group
+
+    values is rows x columns (NaN is missing), group each row's group number.
+    Rows are resampled with replacement within their group. Returns a dict of
+    sums and counts, each replicates x groups x columns, and point_sums and
+    point_counts of the original rows (groups x columns).
+    """
+    values = np.asarray(values, dtype=float).reshape(len(group), -1)
+    order = np.argsort(group, kind='stable')
+    values = values[order]
+    sizes = np.bincount(group, minlength=n_groups)
+
+    present = ~np.isnan(values)
+    point_sums, point_counts = _group_sums(np.where(present, values, 0.0),
+                                           None if present.all() else present.astype(np.int64),
+                                           np.arange(len(values))[np.newaxis, :], sizes)
+
+    batch = max(1, min(replicates, BATCH_VALUES // max(values.size, 1)))
+    batches = [min(batch, replicates - start) for start in range(0, replicates, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    with stage(f"{replicates:,} bootstrap replicates of {n_groups:,} groups", "aggregate"):
+        if jobs and jobs > 1 and len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(batches)), initializer=_init_worker,
+                                     initargs=(values, sizes)) as pool:
+                results = list(pool.map(_worker_batch, batches, seeds))
+        else:
+            results = [_replicate_batch(values, sizes, n, s) for n, s in zip(batches, seeds)]
+    return {'sums': np.concatenate([sums for sums, _ in results]),
+            'counts': np.concatenate([counts for _, counts in results]),
+            'point_sums': point_sums[0], 'point_counts': point_counts[0]}
+
+def intervals(replicates, confidence=0.95):
+    """Percentile interval and standard error over the first axis"""
+    tail = 100 * (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # Metrics that are NaN in every replicate stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lower, upper = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+        std_error = np.nanstd(replicates, axis=0, ddof=1)
+    return lower, upper, std_error
+
+def interval_table(keys, estimates, replicates, confidence=0.95):
+    """keys plus <metric>, <metric>_lower, <metric>_upper and <metric>_se for each metric"""
+    table = keys.copy()
+    for name, estimate in estimates.items():
+        lower, upper, std_error = intervals(replicates[name], confidence)
+        table[name] = estimate
+        table[f"{name}_lower"] = lower
+        table[f"{name}_upper"] = upper
+        table[f"{name}_se"] = std_error
+    table.attrs['confidence'] = confidence
+    table.attrs['replicates'] = len(next(iter(replicates.values())))
+    return table
+
+def _mean(sums, counts):
+    return sums / np.where(counts > 0, counts, np.nan)
+
+def _change(new, old):
+    """(new - old) / old, or 0 where old isn't positive, as analyze_covid_recovery has it"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(old > 0, (new - old) / old, 0.0)
+
+def recovery_metrics(sums, counts):
+    """COVID recovery metrics from sums and counts shaped (..., markets, periods, [leasing, rent, availability])"""
+    leasing = sums[..., 0]
+    rent = _mean(sums[..., 1], counts[..., 1])
+    availability = _mean(sums[..., 2], counts[..., 2])
+    pre, during, recent = 0, 1, 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rent_growth = (rent[..., recent] - rent[..., pre]) / rent[..., pre]
+    return {
+        'leasing_drop': _change(leasing[..., during], leasing[..., pre]),
+        'leasing_recovery': _change(leasing[..., recent], leasing[..., during]),
+        'availability_increase': availability[..., during] - availability[..., pre],
+        'recent_availability_change': availability[..., recent] - availability[..., during],
+        'rent_growth': rent_growth,
+    }
+
+@instrument("analysis")
+def bootstrap_covid_recovery(replicates=2000, confidence=0.95, seed=0, jobs=1, df=None):
+    """Recovery metrics per market with bootstrap intervals
+
+    Markets need PAD rows in all three COVID_PERIODS, as in analyze_covid_recovery().
+    """
+    if df is None:
+        df = loaders.load_price_availability()
+    with stage("select COVID periods", "transform"):
+        period = np.full(len(df), -1)
+        for i, (year, quarter) in enumerate(COVID_PERIODS.values()):
+            period[((df['year'] == year) & (df['quarter'] == quarter)).to_numpy()] = i
+        df = df[period >= 0]
+        period = period[period >= 0]
+        market, markets = pd.factorize(df['market'], sort=True)
+        values = df[['leasing', 'internal_class_rent', 'availability_proportion']].apply(
+            pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+    periods = len(COVID_PERIODS)
+    result = resample_groups(values, market * periods + period, len(markets) * periods, replicates, seed, jobs)
+    complete = (result['point_counts'][:, 0] > 0).reshape(len(markets), periods).all(axis=1)
+    shape = (len(markets), periods, values.shape[1])
+
+    estimates = recovery_metrics(result['point_sums'].reshape(shape), result['point_counts'].reshape(shape))
+    draws = recovery_metrics(result['sums'].reshape((replicates,) + shape),
+                             result['counts'].reshape((replicates,) + shape))
+    table = interval_table(pd.DataFrame({'market': markets}), estimates, draws, confidence)
+    return table[complete].reset_index(drop=True)
+
+def _growth_units(start_year, end_year, unit, value):
+    """Rows to resample for growth between two years: leases, or quarterly totals per market"""
+    years = [start_year, end_year]
+    columns = ['market', 'year', value] + (['quarter'] if unit == 'quarters' else [])
+    with stage(f"leases of {start_year} and {end_year}", "transform"):
+        leases = pd.concat([frame[frame['year'].isin(years)] for frame in read_frames('leases', usecols=columns)],
+                           ignore_index=True)
+        if unit == 'quarters':
+            leases = groupby_agg(leases, ['market', 'year', 'quarter'], {value: 'sum'})
+    return leases
+
+@instrument("analysis")
+def bootstrap_growth_rates(start_year=2018, end_year=2024, unit='leases', replicates=2000, confidence=0.95,
+                           seed=0, jobs=1, value='leasedSF'):
+    """Leased SF growth rate and CAGR per market between two years, with bootstrap intervals
+
+    unit is 'leases' (resample lease records within each market and year) or
+    'quarters' (resample a market's quarterly totals within each year).
+    """
+    if unit not in ('leases', 'quarters'):
+        raise ValueError(f"unit must be 'leases' or 'quarters', not {unit!r}")
+    if end_year <= start_year:
+        raise ValueError(f"end year {end_year} must be after start year {start_year}")
+    units = _growth_units(start_year, end_year, unit, value)
+    market, markets = pd.factorize(units['market'], sort=True)
+    year = (units['year'].to_numpy() == end_year).astype(int)
+    result = resample_groups(units[value].to_numpy(dtype=float), market * 2 + year, len(markets) * 2,
+                             replicates, seed, jobs)
+
+    def growth(sums, counts):
+        # Markets without rows in a year have no total, as in growth.growth_matrix()
+        totals = np.where(counts > 0, sums, np.nan)[..., 0].reshape(sums.shape[:-2] + (len(markets), 2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = totals[..., 1] / totals[..., 0]
+            return {'growth_rate': ratio - 1, 'cagr': ratio ** (1 / (end_year - start_year)) - 1}
+
+    estimates = growth(result['point_sums'], result['point_counts'])
+    table = interval_table(pd.DataFrame({'market': markets}), estimates,
+                           growth(result['sums'], result['counts']), confidence)
+    table.attrs['years'] = (start_year, end_year)
+    return table
+
+def print_intervals(table, metrics, title):
+    """One line per market and metric: estimate [lower, upper]"""
+    confidence = table.attrs.get('confidence', 0.95)
+    print(f"\n===== {title} ({confidence:.0%} intervals, {table.attrs.get('replicates', 0):,} replicates) =====")
+    width = max(len(str(market)) for market in table['market']) if len(table) else 0
+    for _, row in table.iterrows():
+        cells = [f"{metric} {row[metric]:+.1%} [{row[f'{metric}_lower']:+.1%}, {row[f'{metric}_upper']:+.1%}]"
+                 for metric in metrics]
+        print(f"{row['market']:{width}}  " + "  ".join(cells))
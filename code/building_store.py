@@ -0,0 +1,203 @@
+# building_store.py
+#
+# Leases sorted by building and time, with the row range of every building kept
+# in an offsets array, so a building's lease history is a slice instead of a
+# scan and groupby over all of Leases:
+#
+#     store = open_building_store()               # builds data/columns/building_timeline/ if needed
+#     history = store.history("Austin_CBD 1_Austin_...")          # dict of column -> array
+#     rows = store.histories(ids)                 # several buildings, concatenated
+#     totals = store.building_totals('leasedSF')  # one value per building
+#
+# The store is a column store (see column_store.py) written from the Leases
+# column store in building order: buildings are numbered by their sorted
+# building_id, rows within a building by year, quarter and month signed. Row
+# range of building i is offsets[i]:offsets[i + 1]. String columns stay as
+# codes into the Leases dictionaries, so building the timeline is one lexsort
+# and a gather per column; nothing is parsed again. Looking a building up is a
+# binary search over the sorted ids, and the columns are memory-mapped, so a
+# history costs microseconds and only touches that building's pages.
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import loaders
+from column_store import ColumnStore, open_store, store_dir
+from resample import quarter_number
+from instrumentation import stage
+
+timeline_dir = os.path.join(store_dir, "building_timeline")
+
+# Columns copied into the timeline, in this order, when Leases has them
+TIMELINE_COLUMNS = ['year', 'quarter', 'monthsigned', 'leasedSF', 'company_name', 'internal_industry',
+                    'transaction_type', 'space_type', 'internal_class', 'market', 'internal_submarket']
+
+def _time_keys(leases):
+    """(year, quarter number, month) arrays of the Leases store, for sorting"""
+    year = np.asarray(leases.column('year'))
+    if leases.is_categorical('quarter'):
+        numbers = np.append(quarter_number(leases.dictionary('quarter')), 0)
+        quarter = numbers[np.asarray(leases.column('quarter'))]   # -1 (missing) picks the 0 at the end
+    else:
+        quarter = np.nan_to_num(np.asarray(leases.column('quarter')))
+    month = np.zeros(len(leases))
+    if 'monthsigned' in leases:
+        month = np.nan_to_num(np.asarray(leases.column('monthsigned'), dtype=float))
+    return year, quarter, month
+
+def build_building_store(directory=timeline_dir, leases=None):
+    """Write the building timeline from the Leases column store"""
+    if leases is None:
+        leases = open_store('leases')
+    with stage("order leases by building and time", "transform"):
+        buildings = leases.dictionary('building_id')
+        # Renumber buildings in sorted id order so lookups can binary search
+        by_id = np.argsort(buildings, kind='stable')
+        rank = np.empty(len(buildings) + 1, dtype=np.int64)
+        rank[by_id] = np.arange(len(buildings))
+        rank[-1] = -1
+        building = rank[np.asarray(leases.column('building_id'))]
+        year, quarter, month = _time_keys(leases)
+        order = np.lexsort((month, quarter, year, building))
+        order = order[building[order] >= 0]
+        counts = np.bincount(building[order], minlength=len(buildings))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    columns = []
+    with stage("write building timeline", "save"):
+        entries = {column['name']: column for column in leases.meta['columns']}
+        for name in [col for col in TIMELINE_COLUMNS if col in entries]:
+            entry = dict(entries[name])
+            np.save(os.path.join(directory, entry['file']), np.asarray(leases.column(name))[order])
+            if entry['kind'] == 'categorical':
+                np.save(os.path.join(directory, entry['dictionary']), leases.dictionary(name))
+            columns.append(entry)
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        np.save(os.path.join(directory, "buildings.npy"), buildings[by_id])
+        meta = {'n_rows': len(order), 'columns': columns, 'n_buildings': len(buildings),
+                'source': leases.meta.get('source'), 'signature': leases.meta.get('signature')}
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+    print(f"Stored {len(order):,} leases of {len(buildings):,} buildings in {directory}")
+    return BuildingStore(directory)
+
+class BuildingStore:
+    """Lease rows grouped by building: offsets into memory-mapped, building-ordered columns"""
+
+    def __init__(self, directory=timeline_dir):
+        self.directory = directory
+        self.columns = ColumnStore(directory)
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        self.buildings = np.load(os.path.join(directory, "buildings.npy"))
+        self._arrays = {}
+        self._labels = {}
+
+    def __len__(self):
+        return len(self.buildings)
+
+    def is_stale(self):
+        return self.columns.is_stale()
+
+    def _array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = self.columns.column(name)
+        return self._arrays[name]
+
+    def _names(self, columns):
+        if columns is None:
+            return self.columns.columns
+        return [columns] if isinstance(columns, str) else list(columns)
+
+    def _decode(self, name, values, decode):
+        if not decode or not self.columns.is_categorical(name):
+            return values
+        if name not in self._labels:
+            self._labels[name] = np.append(self.columns.dictionary(name), '')   # -1 (missing) -> ''
+        return self._labels[name][values]
+
+    def index_of(self, building_ids):
+        """Building numbers of ids (-1 for ids with no leases)"""
+        ids = np.atleast_1d(np.asarray(building_ids, dtype=str))
+        positions = np.searchsorted(self.buildings, ids)
+        found = positions < len(self.buildings)
+        found[found] = self.buildings[positions[found]] == ids[found]
+        return np.where(found, positions, -1)
+
+    def rows(self, building_id):
+        """Row range of one building in the timeline (empty if it has no leases)"""
+        i = self.index_of(building_id)[0]
+        if i < 0:
+            return slice(0, 0)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def history(self, building_id, columns=None, decode=True):
+        """One building's leases in time order, as column -> array slice
+
+        decode=False leaves string columns as codes into the Leases dictionaries.
+        """
+        rows = self.rows(building_id)
+        return {name: self._decode(name, self._array(name)[rows], decode) for name in self._names(columns)}
+
+    def histories(self, building_ids, columns=None, decode=True):
+        """Several buildings' leases, concatenated in the order given
+
+        Alongside the columns, 'building' holds each row's position in building_ids.
+        """
+        index = self.index_of(building_ids)
+        starts = np.where(index >= 0, self.offsets[index], 0)
+        counts = np.where(index >= 0, self.offsets[index + 1] - starts, 0)
+        # Row numbers of every building's range, back to back
+        owner = np.repeat(np.arange(len(index)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = starts[owner] + within
+        result = {'building': owner}
+        for name in self._names(columns):
+            result[name] = self._decode(name, self._array(name)[rows], decode)
+        return result
+
+    def history_frame(self, building_ids, columns=None):
+        """histories() as a DataFrame with a building_id column"""
+        ids = np.atleast_1d(np.asarray(building_ids, dtype=str))
+        result = self.histories(ids, columns)
+        frame = pd.DataFrame({name: values for name, values in result.items() if name != 'building'})
+        frame.insert(0, 'building_id', ids[result['building']])
+        return frame
+
+    def lease_counts(self):
+        """Leases per building, in building order"""
+        return np.diff(self.offsets)
+
+    def building_totals(self, column='leasedSF'):
+        """Sum of a numeric column per building, in building order"""
+        values = np.asarray(self._array(column))
+        values = values.astype(np.int64) if values.dtype.kind in 'biu' else np.nan_to_num(values.astype(float))
+        if not len(values):
+            return np.zeros(len(self), dtype=values.dtype)
+        sums = np.add.reduceat(values, np.minimum(self.offsets[:-1], len(values) - 1))
+        # reduceat returns the row at the offset for empty ranges; those buildings have no leases
+        return np.where(self.lease_counts() > 0, sums, 0)
+
+    def summary(self, column='leasedSF'):
+        """One row per building: leases, total of a column, first and last year"""
+        counts = self.lease_counts()
+        year = np.asarray(self._array('year'))
+        present = counts > 0
+        first = np.full(len(self), -1)
+        last = np.full(len(self), -1)
+        first[present] = year[self.offsets[:-1][present]]
+        last[present] = year[self.offsets[1:][present] - 1]
+        return pd.DataFrame({'building_id': self.buildings, 'leases': counts,
+                             column: self.building_totals(column), 'first_year': first, 'last_year': last})
+
+def open_building_store(directory=timeline_dir, rebuild=False):
+    """Open the building timeline, building it if missing or older than Leases.csv"""
+    if not rebuild and os.path.exists(os.path.join(directory, "meta.json")):
+        store = BuildingStore(directory)
+        if not store.is_stale():
+            return store
+        print(f"{loaders.dataset_path('leases')} changed since {directory} was written; rebuilding")
+    return build_building_store(directory, open_store('leases', rebuild=rebuild))
@@ -0,0 +1,181 @@
+# catalog.py
+#
+# Row counts, columns, sampled dtypes and year-quarter coverage for every data
+# file, computed once and kept in data/catalog.json:
+#
+#     python code/cli.py catalog                 # scan anything new or changed
+#     entry = catalog.describe_file("data/Leases.csv")
+#     entry['rows'], entry['columns'], entry['time']['min']
+#
+# Scanning a file costs one buffered binary pass plus one pass over the year and
+# quarter columns:
+#   rows     newlines outside quoted fields, counted with NumPy on 8 MB blocks
+#            (the quotes before each newline must be even, so quoted line breaks
+#            don't count); the same pass hashes the bytes
+#   columns  the header line, parsed with the csv module
+#   dtypes   pandas' inference on the first SAMPLE_ROWS rows
+#   time     year and quarter only, through pyarrow's streaming reader when it
+#            is installed (include_columns skips converting everything else),
+#            otherwise pandas usecols chunks; kept as rows per year-quarter
+#
+# Entries are keyed by the content hash. The catalog also remembers each path's
+# (size, mtime) and hash, so a lookup for an unchanged file is a dictionary read,
+# and a file that was only touched is re-hashed but not re-scanned.
+import os
+import csv
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import loaders
+import engine
+from resample import quarter_number
+from instrumentation import stage, instrument
+
+catalog_path = os.path.join(loaders.data_dir, "catalog.json")
+
+BLOCK_SIZE = 8 * 1024 * 1024
+SAMPLE_ROWS = 1000
+
+NEWLINE, QUOTE = ord("\n"), ord('"')
+
+def scan_bytes(path, block_size=BLOCK_SIZE):
+    """(records after the header, content hash) from one buffered pass over a CSV
+
+    A newline ends a record only when an even number of quote characters came
+    before it, which also holds for "" escapes inside quoted fields.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    lines = 0
+    in_quotes = 0
+    last = b"\n"
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            last = block[-1:]
+            if not in_quotes and block.find(b'"') < 0:
+                lines += block.count(b"\n")
+                continue
+            data = np.frombuffer(block, dtype=np.uint8)
+            quotes = np.flatnonzero(data == QUOTE)
+            newlines = np.flatnonzero(data == NEWLINE)
+            # Quotes before each newline, plus one if the block started inside quotes
+            quotes_before = np.searchsorted(quotes, newlines) + in_quotes
+            lines += int(np.count_nonzero(quotes_before % 2 == 0))
+            in_quotes = (len(quotes) + in_quotes) % 2
+    # The last record may not end with a newline
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0), digest.hexdigest()
+
+def read_header(path):
+    """Column names from the first record"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return next(csv.reader(f), [])
+
+def sample_dtypes(path, rows=SAMPLE_ROWS):
+    """pandas dtypes inferred from the first rows"""
+    sample = pd.read_csv(path, nrows=rows)
+    return {str(col): str(dtype) for col, dtype in sample.dtypes.items()}
+
+def _period_counts(path, columns):
+    """Rows per (year, quarter), reading only those two columns"""
+    counts = []
+    if engine.arrow_available():
+        from pyarrow import csv as arrow_csv
+
+        reader = arrow_csv.open_csv(path, convert_options=arrow_csv.ConvertOptions(include_columns=columns))
+        for batch in reader:
+            counts.append(batch.to_pandas().value_counts(columns))
+    else:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=500_000):
+            counts.append(chunk.value_counts(columns))
+    if not counts:
+        return pd.DataFrame(columns=['year', 'quarter', 'rows'])
+    total = pd.concat(counts).groupby(level=[0, 1]).sum()
+    return total.rename('rows').reset_index()
+
+def time_coverage(path, columns):
+    """First and last year-quarter, number of year-quarters and rows in each"""
+    if 'year' not in columns or 'quarter' not in columns:
+        return None
+    periods = _period_counts(path, ['year', 'quarter'])
+    if periods.empty:
+        return None
+    periods['_order'] = periods['year'].astype(int) * 4 + quarter_number(periods['quarter'])
+    periods = periods.sort_values('_order')
+
+    def plain(value):
+        return value.item() if hasattr(value, 'item') else value
+
+    rows = [[plain(year), plain(quarter), int(count)]
+            for year, quarter, count in periods[['year', 'quarter', 'rows']].itertuples(index=False)]
+    return {'min': rows[0][:2], 'max': rows[-1][:2], 'periods': len(rows), 'rows_per_period': rows}
+
+def scan_file(path):
+    """Catalog entry for one CSV"""
+    with stage(f"count records {os.path.basename(path)}", "load"):
+        rows, content_hash = scan_bytes(path)
+    with stage(f"header and dtypes {os.path.basename(path)}", "load"):
+        columns = read_header(path)
+        dtypes = sample_dtypes(path)
+    with stage(f"year-quarter coverage {os.path.basename(path)}", "aggregate"):
+        time = time_coverage(path, columns)
+    return {'hash': content_hash, 'file': os.path.basename(path), 'size': os.path.getsize(path),
+            'rows': rows, 'columns': columns, 'dtypes': dtypes, 'time': time}
+
+def load_catalog(path=catalog_path):
+    if not os.path.exists(path):
+        return {'files': {}, 'paths': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_catalog(catalog, path=catalog_path):
+    with open(path, "w") as f:
+        json.dump(catalog, f, indent=1)
+
+def describe_file(path, catalog=None, save=True):
+    """Catalog entry for a CSV, scanning it only if it's new or its contents changed"""
+    own_catalog = catalog is None
+    catalog = catalog if catalog is not None else load_catalog()
+    key = os.path.normpath(path)
+    signature = list(loaders.source_signature(path))
+
+    known = catalog['paths'].get(key)
+    if known is not None and known['signature'] == signature and known['hash'] in catalog['files']:
+        return catalog['files'][known['hash']]
+
+    if known is not None and known['hash'] in catalog['files']:
+        # Size or mtime changed: hash again, but reuse the entry if the bytes didn't
+        with stage(f"hash {os.path.basename(path)}", "load"):
+            _, content_hash = scan_bytes(path)
+        entry = catalog['files'].get(content_hash) or scan_file(path)
+    else:
+        entry = scan_file(path)
+
+    catalog['files'][entry['hash']] = entry
+    catalog['paths'][key] = {'signature': signature, 'hash': entry['hash']}
+    if save and own_catalog:
+        save_catalog(catalog)
+    return entry
+
+@instrument("analysis")
+def build_catalog(names=None, refresh=False):
+    """Catalog entries for datasets by short name (default: every dataset file present)"""
+    names = names or [name for name in loaders.DATASETS if os.path.exists(loaders.dataset_path(name))]
+    catalog = {'files': {}, 'paths': {}} if refresh else load_catalog()
+    entries = {name: describe_file(loaders.dataset_path(name), catalog, save=False) for name in names}
+    save_catalog(catalog)
+    return entries
+
+def print_catalog(entries):
+    """One line per dataset: rows, columns and time coverage"""
+    print("\n===== DATA CATALOG =====")
+    for name, entry in entries.items():
+        time = entry['time']
+        coverage = (f"{time['min'][0]} {time['min'][1]} to {time['max'][0]} {time['max'][1]} ({time['periods']} quarters)"
+                    if time else "no year/quarter")
+        print(f"- {name}: {entry['rows']:,} rows x {len(entry['columns'])} columns, {coverage}")
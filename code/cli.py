@@ -0,0 +1,522 @@
+# cli.py
+#
+# Single entry point for the analyses, chart batches, geocoding and IRS steps.
+# Run from the repository root:
+#
+#     python code/cli.py --help
+#     python code/cli.py analyze market
+#     python code/cli.py charts stacked-bars --markets Austin Boston
+#     python code/cli.py charts stacked-bars --report market_book.pdf
+#     python code/cli.py --profile analyze relationship
+#
+# Only argparse is imported up front. pandas, matplotlib and geopy are imported
+# inside the subcommand that needs them, so --help and the text-only analyses
+# don't pay for the plotting stack.
+import argparse
+import os
+import sys
+
+code_dir = os.path.dirname(os.path.abspath(__file__))
+visualizations_dir = os.path.join(code_dir, '..', 'visualizations')
+
+ANALYSES = {
+    'market': 'market_analysis',
+    'relationship': 'relationship_analysis',
+    'quality': 'data_quality_analysis',
+    'overview': 'analyze_relationships',
+    'csv-structure': 'explore_csv_structure',
+    'codebook': 'explore_codebook',
+}
+
+def _chart_module(name):
+    """Import a chart module from visualizations/ with a non-interactive backend"""
+    import importlib
+
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    if visualizations_dir not in sys.path:
+        sys.path.insert(0, visualizations_dir)
+    return importlib.import_module(name)
+
+def run_analysis(args):
+    import importlib
+
+    module = importlib.import_module(ANALYSES[args.name])
+    if args.full or args.validate:
+        if args.name != 'quality':
+            sys.exit("--full and --validate only apply to the quality analysis")
+        module.main(full=args.full, run_validation=args.validate)
+    else:
+        module.main()
+
+def run_stacked_bars(args):
+    _chart_module('space_utilization_bar_creator').main(args.markets, args.report)
+
+def run_adj_stacked_bars(args):
+    _chart_module('adj_space_utilization_bar_creator').main(args.markets, args.report)
+
+def run_relative_rents(args):
+    unknown = set(args.kinds) - {'direct', 'sublet'}
+    if unknown:
+        sys.exit(f"relative-rents: choose from direct, sublet (not {', '.join(sorted(unknown))})")
+    for kind in args.kinds or ['direct', 'sublet']:
+        _chart_module(f'relative_{kind}_rents').main(args.highlight)
+
+def run_occupancy(args):
+    _chart_module('occupancy_line_chart').main()
+
+def run_geocode(args):
+    import geocode
+
+    if args.target == 'addresses':
+        geocode.geocode_addresses()
+    elif args.target == 'markets':
+        geocode.geocode_markets()
+    else:
+        geocode.build_growth_rates(args.start_year, args.end_year)
+
+def run_growth(args):
+    import growth
+
+    matrix = growth.growth_matrix(growth.leased_by_year(by=args.by))
+    print(growth.rank_growth(matrix, args.start_year, args.end_year, measure=args.measure,
+                             n=args.n, ascending=args.ascending).to_string(index=False))
+
+def run_anomalies(args):
+    import loaders
+    import anomalies
+
+    flagged = anomalies.detect_anomalies(loaders.load_price_availability(), window=args.window,
+                                         threshold=args.threshold, methods=args.methods)
+    print(f"{len(flagged)} flagged quarters")
+    print(flagged.head(args.n).to_string(index=False))
+
+def run_forecast(args):
+    import forecasting
+
+    if args.backtest:
+        print(forecasting.backtest(args.dataset, args.horizon, args.models).to_string(index=False))
+        return
+    forecasts = forecasting.forecast(args.dataset, args.horizon, args.models)
+    if args.output:
+        forecasts.to_csv(args.output, index=False)
+        print(f"Wrote {len(forecasts):,} forecasts to {args.output}")
+    else:
+        print(forecasts.head(args.n).to_string(index=False))
+
+def run_counties(args):
+    import county_assignment
+
+    county_assignment.build_building_counties(args.output)
+
+def run_resample(args):
+    import resample
+
+    result = resample.resampled(args.dataset, args.grain, by=args.by, how=args.how,
+                                columns=args.columns, weight=args.weight)
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"Wrote {len(result):,} rows to {args.output}")
+    else:
+        print(result.head(args.n).to_string(index=False))
+
+def run_catalog(args):
+    import catalog
+
+    catalog.print_catalog(catalog.build_catalog(args.datasets or None, refresh=args.refresh))
+
+def run_pipeline(args):
+    import pipeline
+
+    if args.list:
+        pipeline.print_tasks()
+        return
+    status = pipeline.run_pipeline(args.tasks or None, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    if any(result in ('failed', 'missing', 'blocked') for result in status.values()):
+        sys.exit(1)
+
+def run_cube(args):
+    import pad_cube
+
+    where = {}
+    for condition in args.where or []:
+        dim, _, value = condition.partition('=')
+        where.setdefault(dim, []).extend(int(v) if v.isdigit() else v for v in value.split(','))
+    cube = pad_cube.load_cube(args.dataset, refresh=args.refresh)
+    result = cube.rollup(args.by, where=where)
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"Wrote {len(result):,} rows to {args.output}")
+    else:
+        print(result.head(args.n).to_string(index=False))
+
+def run_buildings(args):
+    import building_store
+
+    store = building_store.open_building_store(rebuild=args.rebuild)
+    if args.building_ids:
+        print(store.history_frame(args.building_ids).to_string(index=False))
+        return
+    summary = store.summary().sort_values('leasedSF', ascending=False)
+    print(f"\n===== TOP {args.top} BUILDINGS BY LEASED SF ({len(store):,} buildings) =====")
+    print(summary.head(args.top).to_string(index=False))
+
+def run_comps(args):
+    import numpy as np
+    import comps
+
+    index = comps.load_comps_index(rebuild=args.rebuild)
+    if args.buildings:
+        subjects = comps.building_subjects(args.buildings, args.leasedSF, args.year, args.quarter,
+                                           args.transaction_type)
+        result = comps.comps_for(index, subjects, k=args.k)
+        result['subjects'] = subjects['building_id'].to_numpy()
+    else:
+        lease_ids = args.lease_ids
+        if args.sample:
+            lease_ids = np.random.default_rng(0).choice(index.lease_ids, size=min(args.sample, len(index)),
+                                                        replace=False)
+        if not len(lease_ids):
+            sys.exit("give lease ids, --buildings or --sample")
+        result = comps.comps_for_leases(index, lease_ids, k=args.k)
+    frame = comps.comps_frame(result)
+    if args.output:
+        frame.to_csv(args.output, index=False)
+        print(f"Wrote {len(frame):,} comps of {len(result['subjects']):,} subjects to {args.output}")
+    else:
+        print(frame.to_string(index=False))
+
+def run_clusters(args):
+    import clustering
+
+    result = clustering.cluster_markets(args.metrics, k=args.k, distance=args.distance, method=args.linkage)
+    clustering.print_clusters(result)
+    if args.output:
+        import pandas as pd
+
+        representatives = set(result['representatives'])
+        pd.DataFrame({'market': result['markets'], 'cluster': result['labels'] + 1,
+                      'representative': [market in representatives for market in result['markets']]}
+                     ).to_csv(args.output, index=False)
+        print(f"Wrote cluster labels to {args.output}")
+
+def run_scenarios(args):
+    import scenarios
+
+    grid = {'occupancy_shift': args.occupancy_shift, 'missing_occupancy': args.missing_occupancy,
+            'inflation_shift': args.inflation_shift, 'sublet_conversion': args.sublet_conversion}
+    result = scenarios.run_scenarios(grid)
+    scenarios.print_summary(result)
+    if args.output:
+        scenarios.to_frame(result).to_csv(args.output, index=False)
+        print(f"Wrote {len(result['scenarios'])} scenarios by market, quality and quarter to {args.output}")
+
+def run_bootstrap(args):
+    import bootstrap
+
+    if args.metrics == 'covid':
+        table = bootstrap.bootstrap_covid_recovery(args.replicates, args.confidence, args.seed, args.jobs)
+        bootstrap.print_intervals(table.sort_values('leasing_recovery', ascending=False),
+                                  bootstrap.RECOVERY_METRICS, "COVID RECOVERY")
+    else:
+        table = bootstrap.bootstrap_growth_rates(args.start_year, args.end_year, args.unit, args.replicates,
+                                                 args.confidence, args.seed, args.jobs)
+        bootstrap.print_intervals(table.sort_values('growth_rate', ascending=False), bootstrap.GROWTH_METRICS,
+                                  f"LEASED SF GROWTH {args.start_year}-{args.end_year}")
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"Wrote intervals for {len(table)} markets to {args.output}")
+
+def run_irs(args):
+    import population_flow
+
+    for year in args.years:
+        population_flow.geocode_outflow(year)
+
+def run_synth(args):
+    import synthetic_data
+
+    if args.kind == 'leases':
+        synthetic_data.generate_leases(int(args.rows), args.output, seed=args.seed,
+                                       chunk_size=args.chunk_size)
+    else:
+        source = 'Cleaned PAD.csv' if args.kind == 'cleaned-pad' else 'Price and Availability Data.csv'
+        synthetic_data.generate_pad(int(args.rows), args.output, seed=args.seed,
+                                    source_path=os.path.join(synthetic_data.data_dir, source))
+
+def run_index(args):
+    import token_index
+
+    if args.action == 'build':
+        token_index.build_token_index()
+        return
+    index = token_index.open_token_index()
+    for query in args.queries:
+        print(f"{index.count(query):>12,}  {query}")
+
+def run_store(args):
+    import column_store
+
+    for name in args.names:
+        store = column_store.open_store(name, rebuild=args.action == 'build')
+        if args.action == 'info':
+            print(f"{store.directory}: {len(store):,} rows")
+            for column in store.columns:
+                kind = f"{len(store.dictionary(column)):,} categories" if store.is_categorical(column) else ""
+                print(f"  {column:<35} {str(store.column(column).dtype):<8} {kind}")
+
+def run_validate(args):
+    import validation
+
+    report = validation.validate(args.datasets or None, output_path=args.report,
+                                 incremental=not args.full)
+    validation.print_report(report)
+    print(f"\nReport written to {args.report}")
+    if report['summary']['fail']:
+        sys.exit(1)
+
+def run_ingest(args):
+    import ingest
+
+    if args.rebuild:
+        ingest.build_aggregates()
+    elif args.dataset and args.rows:
+        try:
+            ingest.ingest(args.dataset, args.rows, replace=args.replace)
+        except ValueError as e:
+            sys.exit(str(e))
+    else:
+        sys.exit("ingest needs a dataset and a CSV of new rows, or --rebuild")
+
+def run_engines(args):
+    import loaders
+
+    mismatches = loaders.compare_engines(args.datasets)
+    if mismatches:
+        sys.exit(1)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="DataFest 2025 analyses and charts")
+    parser.add_argument('--profile', nargs='?', const='profile_trace.json', metavar='TRACE',
+                        help="record stage timings and write a Chrome trace (default: %(const)s)")
+    parser.add_argument('--engine', choices=['pandas', 'arrow'],
+                        help="dataframe engine for loading and grouping (default: $DATAFEST_ENGINE or pandas)")
+    parser.add_argument('--memory-budget', metavar='SIZE',
+                        help="memory for loading whole datasets, e.g. 2GB; larger files are processed in chunks "
+                             "(default: $DATAFEST_MEMORY_BUDGET or half of RAM)")
+    parser.add_argument('--read-jobs', type=int, metavar='N',
+                        help="processes for parsing large CSVs in byte ranges, 0 for one per core "
+                             "(default: $DATAFEST_READ_JOBS or 1)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    analyze = commands.add_parser('analyze', help="run a text analysis")
+    analyze.add_argument('name', choices=sorted(ANALYSES))
+    analyze.add_argument('--full', action='store_true',
+                         help="profile all of Leases.csv instead of a sample, chunked if over the memory budget (quality)")
+    analyze.add_argument('--validate', action='store_true',
+                         help="also check every dataset against the validation rules, as the validate command "
+                              "does (quality)")
+    analyze.set_defaults(func=run_analysis)
+
+    charts = commands.add_parser('charts', help="render a chart batch")
+    chart_types = charts.add_subparsers(dest='chart', required=True)
+
+    stacked = chart_types.add_parser('stacked-bars', help="space utilization and rent bars per market")
+    stacked.add_argument('--markets', nargs='+', help="markets to draw (default: all)")
+    stacked.add_argument('--report', metavar='PATH', help="write one .pdf or .html report instead of PNGs")
+    stacked.set_defaults(func=run_stacked_bars)
+
+    adj_stacked = chart_types.add_parser('adj-stacked-bars', help="occupancy-adjusted utilization bars")
+    adj_stacked.add_argument('--markets', nargs='+', help="markets to draw (default: Austin)")
+    adj_stacked.add_argument('--report', metavar='PATH', help="write one .pdf or .html report instead of PNGs")
+    adj_stacked.set_defaults(func=run_adj_stacked_bars)
+
+    relative = chart_types.add_parser('relative-rents', help="rent relative to the national average")
+    relative.add_argument('kinds', nargs='*', metavar='{direct,sublet}', help="charts to draw (default: both)")
+    relative.add_argument('--highlight', choices=['clusters'],
+                          help="color one representative market per trajectory cluster instead of the fixed list")
+    relative.set_defaults(func=run_relative_rents)
+
+    occupancy = chart_types.add_parser('occupancy', help="occupancy trend by city")
+    occupancy.set_defaults(func=run_occupancy)
+
+    geocode = commands.add_parser('geocode', help="geocode buildings/markets or rebuild growth rates")
+    geocode.add_argument('target', choices=['addresses', 'markets', 'growth'])
+    geocode.add_argument('--start-year', type=int, default=2018)
+    geocode.add_argument('--end-year', type=int, default=2024)
+    geocode.set_defaults(func=run_geocode)
+
+    growth = commands.add_parser('growth', help="rank markets by leased SF growth between two years")
+    growth.add_argument('start_year', type=int)
+    growth.add_argument('end_year', type=int)
+    growth.add_argument('--by', nargs='+', help="also split by these columns, e.g. internal_class")
+    growth.add_argument('--measure', choices=['growth_rate', 'cagr'], default='cagr')
+    growth.add_argument('-n', type=int, default=10, help="rows to show (default: %(default)s)")
+    growth.add_argument('--ascending', action='store_true', help="show the slowest growth first")
+    growth.set_defaults(func=run_growth)
+
+    anomaly = commands.add_parser('anomalies', help="flag unusual quarters in every market series")
+    anomaly.add_argument('--window', type=int, default=8, help="quarters of history for the rolling check (default: %(default)s)")
+    anomaly.add_argument('--threshold', type=float, default=3.5, help="modified z-score cut-off (default: %(default)s)")
+    anomaly.add_argument('--methods', nargs='+', choices=['rolling', 'seasonal'], default=['rolling', 'seasonal'])
+    anomaly.add_argument('-n', type=int, default=20, help="rows to show (default: %(default)s)")
+    anomaly.set_defaults(func=run_anomalies)
+
+    forecast = commands.add_parser('forecast', help="forecast rent, availability or occupancy for every market")
+    forecast.add_argument('dataset', nargs='?', default='price_availability', choices=['price_availability', 'occupancy'])
+    forecast.add_argument('--horizon', type=int, default=4, help="quarters ahead (default: %(default)s)")
+    forecast.add_argument('--models', nargs='+', choices=['linear', 'holt', 'ar1'], default=['linear', 'holt', 'ar1'])
+    forecast.add_argument('--backtest', action='store_true', help="score the models on the last horizon quarters instead")
+    forecast.add_argument('--output', help="write all forecasts to this CSV")
+    forecast.add_argument('-n', type=int, default=20, help="rows to show (default: %(default)s)")
+    forecast.set_defaults(func=run_forecast)
+
+    counties = commands.add_parser('counties', help="tag every building with its nearest county FIPS code")
+    counties.add_argument('--output', default='data/building_counties.csv')
+    counties.set_defaults(func=run_counties)
+
+    resample_parser = commands.add_parser('resample', help="view a dataset at monthly, quarterly or annual grain")
+    resample_parser.add_argument('dataset', help="dataset short name, e.g. unemployment")
+    resample_parser.add_argument('grain', choices=['month', 'quarter', 'year'])
+    resample_parser.add_argument('--by', nargs='+', help="group columns kept alongside time, e.g. state")
+    resample_parser.add_argument('--how', choices=['mean', 'sum', 'last', 'first', 'weighted'], default='mean')
+    resample_parser.add_argument('--columns', nargs='+', help="value columns (default: all numeric)")
+    resample_parser.add_argument('--weight', help="weight column for --how weighted")
+    resample_parser.add_argument('--output', help="write the result to this CSV")
+    resample_parser.add_argument('-n', type=int, default=20, help="rows to show (default: %(default)s)")
+    resample_parser.set_defaults(func=run_resample)
+
+    catalog = commands.add_parser('catalog', help="row counts, columns and time coverage of every data file")
+    catalog.add_argument('datasets', nargs='*', help="dataset short names (default: all present)")
+    catalog.add_argument('--refresh', action='store_true', help="rescan every file instead of using data/catalog.json")
+    catalog.set_defaults(func=run_catalog)
+
+    pipeline = commands.add_parser('pipeline', help="rebuild every output whose inputs changed, in dependency order")
+    pipeline.add_argument('tasks', nargs='*', help="tasks to bring up to date, with their upstream tasks (default: all)")
+    pipeline.add_argument('-j', '--jobs', type=int, help="tasks to run at once (default: CPU count)")
+    pipeline.add_argument('--force', action='store_true', help="run the selected tasks even if they look current")
+    pipeline.add_argument('--dry-run', action='store_true', help="show what would run without running it")
+    pipeline.add_argument('--list', action='store_true', help="show each task's inputs, outputs and dependencies")
+    pipeline.set_defaults(func=run_pipeline)
+
+    cube = commands.add_parser('cube', help="PAD totals, space-weighted rents and ratios rolled up from the cube")
+    cube.add_argument('dataset', nargs='?', default='price_availability', choices=['price_availability', 'cleaned_pad'])
+    cube.add_argument('--by', nargs='*', default=[], help="dimensions to keep, e.g. market internal_class (default: national)")
+    cube.add_argument('--where', nargs='+', help="filters as dim=value[,value], e.g. year=2023,2024")
+    cube.add_argument('--refresh', action='store_true', help="rebuild the cube instead of using data/cubes/")
+    cube.add_argument('--output', help="write the rollup to this CSV")
+    cube.add_argument('-n', type=int, default=20, help="rows to show (default: %(default)s)")
+    cube.set_defaults(func=run_cube)
+
+    buildings = commands.add_parser('buildings', help="lease history of buildings from the building timeline store")
+    buildings.add_argument('building_ids', nargs='*', help="building_id values (default: list the top buildings)")
+    buildings.add_argument('--top', type=int, default=20, help="buildings to list by total leased SF (default: %(default)s)")
+    buildings.add_argument('--rebuild', action='store_true', help="rebuild the store from Leases.csv")
+    buildings.set_defaults(func=run_buildings)
+
+    comps = commands.add_parser('comps', help="nearest comparable leases for leases or buildings")
+    comps.add_argument('lease_ids', nargs='*', type=int, help="row numbers of subject leases in Leases.csv")
+    comps.add_argument('--buildings', nargs='+', help="building_id values to find comps for a new lease in")
+    comps.add_argument('--sample', type=int, help="find comps for this many random leases")
+    comps.add_argument('-k', type=int, default=10, help="comps per subject (default: %(default)s)")
+    comps.add_argument('--leasedSF', type=float, help="buildings: lease size (default: the building's median)")
+    comps.add_argument('--year', type=int, help="buildings: year (default: the building's latest lease)")
+    comps.add_argument('--quarter', help="buildings: quarter, e.g. Q2")
+    comps.add_argument('--transaction-type', default='New', help="buildings: transaction type (default: %(default)s)")
+    comps.add_argument('--rebuild', action='store_true', help="rebuild the comps index")
+    comps.add_argument('--output', help="write subject, rank, lease_id, distance and lease details to this CSV")
+    comps.set_defaults(func=run_comps)
+
+    clusters = commands.add_parser('clusters', help="cluster markets by their quarterly trajectories")
+    clusters.add_argument('--metrics', nargs='+', default=['relative_direct_rent'],
+                          choices=['relative_direct_rent', 'relative_sublet_rent', 'availability', 'sublet_share', 'occupancy'])
+    clusters.add_argument('-k', type=int, default=5, help="number of clusters (default: %(default)s)")
+    clusters.add_argument('--distance', choices=['euclidean', 'correlation', 'dtw'], default='euclidean')
+    clusters.add_argument('--linkage', choices=['average', 'complete', 'single'], default='average')
+    clusters.add_argument('--output', help="write market, cluster and representative flag to this CSV")
+    clusters.set_defaults(func=run_clusters)
+
+    what_if = commands.add_parser('scenarios', help="what-if grid of adjusted space utilization and real rents")
+    what_if.add_argument('--occupancy-shift', nargs='+', type=float, default=[0.0],
+                         help="added to starting occupancy, e.g. 0 -0.05 -0.1")
+    what_if.add_argument('--missing-occupancy', nargs='+', type=float, default=[1.0],
+                         help="occupancy of markets without occupancy data (default: 1.0)")
+    what_if.add_argument('--inflation-shift', nargs='+', type=float, default=[0.0],
+                         help="percentage points added to every quarter's inflation rate")
+    what_if.add_argument('--sublet-conversion', nargs='+', type=float, default=[0.0],
+                         help="share of sublet availability counted as used space")
+    what_if.add_argument('--output', help="write every scenario, market, quality and quarter to this CSV")
+    what_if.set_defaults(func=run_scenarios)
+
+    boot = commands.add_parser('bootstrap', help="bootstrap confidence intervals for COVID recovery or growth rates")
+    boot.add_argument('metrics', choices=['covid', 'growth'])
+    boot.add_argument('-n', '--replicates', type=int, default=2000, help="bootstrap replicates (default: %(default)s)")
+    boot.add_argument('--confidence', type=float, default=0.95, help="interval coverage (default: %(default)s)")
+    boot.add_argument('--seed', type=int, default=0)
+    boot.add_argument('-j', '--jobs', type=int, default=1, help="worker processes for the replicate batches")
+    boot.add_argument('--unit', choices=['leases', 'quarters'], default='leases',
+                      help="growth: resample lease records or quarterly totals within each year")
+    boot.add_argument('--start-year', type=int, default=2018)
+    boot.add_argument('--end-year', type=int, default=2024)
+    boot.add_argument('--output', help="write estimates, intervals and standard errors to this CSV")
+    boot.set_defaults(func=run_bootstrap)
+
+    irs = commands.add_parser('irs', help="geocode Los Angeles county outflows from IRS migration files")
+    irs.add_argument('years', nargs='+', help="tax-year pairs, e.g. 1819 2122")
+    irs.set_defaults(func=run_irs)
+
+    synth = commands.add_parser('synth', help="generate synthetic Leases/PAD files")
+    synth.add_argument('kind', choices=['leases', 'pad', 'cleaned-pad'])
+    synth.add_argument('rows', type=float, help="number of rows, e.g. 5e6")
+    synth.add_argument('output')
+    synth.add_argument('--seed', type=int, default=2025)
+    synth.add_argument('--chunk-size', type=int, default=250000)
+    synth.set_defaults(func=run_synth)
+
+    index = commands.add_parser('index', help="build or query the industry/tenant token index")
+    index.add_argument('action', choices=['build', 'query'])
+    index.add_argument('queries', nargs='*', help='e.g. "Technology AND NOT Media" or tenant:amazon')
+    index.set_defaults(func=run_index)
+
+    store = commands.add_parser('store', help="build or inspect memory-mapped column stores")
+    store.add_argument('action', choices=['build', 'info'])
+    store.add_argument('names', nargs='+', help="dataset short names (e.g. leases price_availability) or CSV paths")
+    store.set_defaults(func=run_store)
+
+    ingest = commands.add_parser('ingest', help="append a new quarter and update the stored aggregates")
+    ingest.add_argument('dataset', nargs='?',
+                        choices=['price_availability', 'cleaned_pad', 'occupancy', 'unemployment', 'inflation'])
+    ingest.add_argument('rows', nargs='?', help="CSV with the new rows, same columns as the dataset")
+    ingest.add_argument('--replace', action='store_true', help="overwrite periods that are already stored")
+    ingest.add_argument('--rebuild', action='store_true', help="recompute every aggregate from scratch")
+    ingest.set_defaults(func=run_ingest)
+
+    validate = commands.add_parser('validate', help="check every dataset against the validation rules")
+    validate.add_argument('datasets', nargs='*', help="dataset short names (default: all)")
+    validate.add_argument('--report', default='data/validation_report.json')
+    validate.add_argument('--full', action='store_true', help="re-check every dataset and row, not just new or changed ones")
+    validate.set_defaults(func=run_validate)
+
+    engines = commands.add_parser('engines', help="check the pandas and arrow engines give the same results")
+    engines.add_argument('datasets', nargs='*', help="dataset short names (default: all present)")
+    engines.set_defaults(func=run_engines)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        import instrumentation
+        instrumentation.enable(args.profile)
+    if args.engine:
+        import engine
+        engine.set_engine(args.engine)
+    if args.memory_budget:
+        import memory_budget
+        memory_budget.set_budget(args.memory_budget)
+    if args.read_jobs is not None:
+        import parallel_csv
+        parallel_csv.set_jobs(args.read_jobs)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
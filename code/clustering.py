@@ -0,0 +1,268 @@
+# clustering.py
+#
+# Groups markets by how their quarterly trajectories move, so the markets
+# highlighted in the relative-rent charts can be picked from the data:
+#
+#     python code/cli.py clusters --metrics relative_direct_rent sublet_share -k 5
+#     result = cluster_markets(['relative_direct_rent'], k=5)
+#     result['representatives']          # one market per cluster, largest first
+#
+# Each metric becomes a markets x quarters matrix (METRICS says where it comes
+# from); each matrix is standardized by its overall mean and spread so metrics on
+# different scales weigh the same. Distances between every pair of markets are
+# computed per metric with broadcasting over (market, market, quarter) arrays
+# and averaged over the metrics both markets have:
+#   euclidean    root mean squared difference over the quarters both have
+#   correlation  1 - Pearson correlation, i.e. shape regardless of level
+#   dtw          dynamic time warping within a band of DTW_WINDOW quarters, so a
+#                market that moves a quarter or two later still counts as close;
+#                the recursion runs over the band once for all pairs at a time
+# Markets are then merged bottom-up (average, complete or single linkage) and the
+# tree is cut into k clusters. A cluster's representative is its medoid, the
+# member with the smallest total distance to the others.
+import numpy as np
+import pandas as pd
+import loaders
+from pad_cube import load_cube
+from ingest import AGGREGATES, summarize, finalize
+from resample import quarter_number
+from instrumentation import stage, instrument
+
+DISTANCES = ['euclidean', 'correlation', 'dtw']
+LINKAGES = ['average', 'complete', 'single']
+
+# Quarters a DTW path may shift one series against the other
+DTW_WINDOW = 2
+
+# Aggregates, not markets
+EXCLUDED_MARKETS = ['US National']
+
+# Occupancy data names some markets differently from PAD
+OCCUPANCY_MARKETS = {
+    'Chicago': 'Downtown Chicago',
+    'Dallas/Ft Worth': 'Dallas-Ft. Worth',
+    'South Bay/San Jose': 'South Bay',
+    'Washington D.C.': 'Washington DC',
+}
+
+def _relative_rent(kind):
+    """Premium direct/sublet rent over the space-weighted national average, as in the relative-rent charts"""
+    df = loaders.load_cleaned_pad()
+    national = finalize(summarize(df, AGGREGATES['national_rents']), AGGREGATES['national_rents']).reset_index()
+    national = national[national['is_premium_quality'] == 1][['year', 'quarter', f'avg_national_{kind}_internal_class_rent']]
+    premium = df[df['is_premium_quality'] == 1].merge(national, on=['year', 'quarter'])
+    value = premium[f'{kind}_internal_class_rent'] / premium[f'avg_national_{kind}_internal_class_rent']
+    return premium[['market', 'year', 'quarter']].assign(value=value)
+
+def _cube_ratio(name):
+    """A ratio from the Cleaned PAD cube per market and quarter, all qualities together"""
+    table = load_cube('cleaned_pad').rollup(['market', 'year', 'quarter'])
+    return table[['market', 'year', 'quarter']].assign(value=table[name])
+
+def _occupancy():
+    df = loaders.load_occupancy()
+    return pd.DataFrame({'market': df['market'].replace(OCCUPANCY_MARKETS), 'year': df['year'],
+                         'quarter': df['quarter'], 'value': df['occupancy_proportion']})
+
+# metric -> function returning a long frame of market, year, quarter, value
+METRICS = {
+    'relative_direct_rent': lambda: _relative_rent('direct'),
+    'relative_sublet_rent': lambda: _relative_rent('sublet'),
+    'availability': lambda: _cube_ratio('availability_proportion'),
+    'sublet_share': lambda: _cube_ratio('sublet_share'),
+    'occupancy': _occupancy,
+}
+
+def market_matrix(metric):
+    """(markets, periods as (year, quarter), markets x periods array) for one metric; NaN where missing"""
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {sorted(METRICS)}, not {metric!r}")
+    frame = METRICS[metric]()
+    frame = frame[~frame['market'].isin(EXCLUDED_MARKETS)]
+    frame = frame.assign(_period=frame['year'].to_numpy(dtype=int) * 4 + quarter_number(frame['quarter']) - 1)
+    wide = frame.pivot_table(index='market', columns='_period', values='value', aggfunc='mean')
+    periods = [(int(period) // 4, f"Q{int(period) % 4 + 1}") for period in wide.columns]
+    return list(wide.index), periods, wide.to_numpy(dtype=float)
+
+def standardize(values):
+    """Scale a whole matrix to mean 0 and standard deviation 1"""
+    spread = np.nanstd(values)
+    return (values - np.nanmean(values)) / (spread if spread > 0 else 1)
+
+def _fill_gaps(values):
+    """Interpolate missing quarters inside each row and carry the ends outward (all-NaN rows stay NaN)"""
+    filled = values.copy()
+    columns = np.arange(values.shape[1])
+    for row in range(len(values)):
+        present = ~np.isnan(values[row])
+        if present.any():
+            filled[row] = np.interp(columns, columns[present], values[row, present])
+    return filled
+
+def euclidean_distances(values):
+    """Root mean squared difference of every pair of rows over the columns both have"""
+    diff = values[:, np.newaxis, :] - values[np.newaxis, :, :]
+    shared = ~np.isnan(diff)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(np.where(shared, diff ** 2, 0).sum(axis=2) / shared.sum(axis=2))
+
+def correlation_distances(values):
+    """1 - Pearson correlation of every pair of rows over the columns both have"""
+    a = values[:, np.newaxis, :]
+    b = values[np.newaxis, :, :]
+    shared = ~np.isnan(a) & ~np.isnan(b)
+    n = shared.sum(axis=2)
+    a = np.where(shared, a, 0.0)
+    b = np.where(shared, b, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_a = a.sum(axis=2) / n
+        mean_b = b.sum(axis=2) / n
+        da = np.where(shared, a - mean_a[..., np.newaxis], 0.0)
+        db = np.where(shared, b - mean_b[..., np.newaxis], 0.0)
+        correlation = (da * db).sum(axis=2) / np.sqrt((da ** 2).sum(axis=2) * (db ** 2).sum(axis=2))
+    return np.where(n > 2, 1 - correlation, np.nan)
+
+def dtw_distances(values, window=DTW_WINDOW):
+    """Banded dynamic time warping distance of every pair of rows, all pairs per step"""
+    values = _fill_gaps(values)
+    n, length = values.shape
+    a = values[:, np.newaxis, :]
+    b = values[np.newaxis, :, :]
+    # Only the previous row of the cost table is kept: (length + 1) x pairs at a time
+    previous = np.full((length + 1, n, n), np.inf)
+    previous[0] = 0
+    for i in range(1, length + 1):
+        cost = np.full((length + 1, n, n), np.inf)
+        for j in range(max(1, i - window), min(length, i + window) + 1):
+            step = (a[:, :, i - 1] - b[:, :, j - 1]) ** 2
+            cost[j] = step + np.minimum(np.minimum(previous[j], cost[j - 1]), previous[j - 1])
+        previous = cost
+    return np.sqrt(previous[length] / length)
+
+def pairwise_distances(matrices, distance='euclidean'):
+    """Distances between markets averaged over the metric matrices (rows aligned)
+
+    A pair is compared on the metrics both have; pairs with nothing in common
+    get the largest distance seen.
+    """
+    if distance not in DISTANCES:
+        raise ValueError(f"distance must be one of {DISTANCES}, not {distance!r}")
+    function = {'euclidean': euclidean_distances, 'correlation': correlation_distances,
+                'dtw': dtw_distances}[distance]
+    with stage(f"{distance} distances", "aggregate"):
+        per_metric = np.stack([function(standardize(values)) for values in matrices])
+        present = np.isfinite(per_metric)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            distances = np.where(present, per_metric, 0).sum(axis=0) / present.sum(axis=0)
+    largest = np.nanmax(distances) if np.isfinite(distances).any() else 1.0
+    distances = np.where(np.isnan(distances), largest, distances)
+    np.fill_diagonal(distances, 0)
+    return (distances + distances.T) / 2
+
+def linkage(distances, method='average'):
+    """Agglomerative merges as rows of (cluster a, cluster b, distance, size), like scipy's linkage
+
+    Clusters 0..n-1 are the markets; the cluster made by merge i is n + i.
+    Distances to a merged cluster follow the Lance-Williams update for the method.
+    """
+    if method not in LINKAGES:
+        raise ValueError(f"linkage must be one of {LINKAGES}, not {method!r}")
+    n = len(distances)
+    distances = distances.astype(float).copy()
+    np.fill_diagonal(distances, np.inf)
+    size = np.ones(n)
+    ids = np.arange(n)
+    active = np.ones(n, dtype=bool)
+    merges = []
+    for step in range(n - 1):
+        masked = np.where(active[:, np.newaxis] & active[np.newaxis, :], distances, np.inf)
+        i, j = sorted(np.unravel_index(np.argmin(masked), masked.shape))
+        merges.append([ids[i], ids[j], distances[i, j], size[i] + size[j]])
+        if method == 'single':
+            merged = np.minimum(distances[i], distances[j])
+        elif method == 'complete':
+            merged = np.maximum(distances[i], distances[j])
+        else:
+            merged = (size[i] * distances[i] + size[j] * distances[j]) / (size[i] + size[j])
+        distances[i, :] = distances[:, i] = merged
+        distances[i, i] = np.inf
+        active[j] = False
+        size[i] += size[j]
+        ids[i] = n + step
+    return np.array(merges).reshape(-1, 4)
+
+def cut(merges, k):
+    """Cluster label (0..k-1) of every market after undoing the last k - 1 merges
+
+    Labels are numbered by cluster size, largest first.
+    """
+    n = len(merges) + 1
+    k = min(max(k, 1), n)
+    parent = np.arange(2 * n - 1)
+
+    def root(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for step, (a, b, _, _) in enumerate(merges[:n - k]):
+        parent[root(int(a))] = parent[root(int(b))] = n + step
+    roots = np.array([root(i) for i in range(n)])
+    unique, first, counts = np.unique(roots, return_index=True, return_counts=True)
+    # Largest cluster first, ties by the first market in it
+    order = np.lexsort((first, -counts))
+    labels = np.empty(len(unique), dtype=int)
+    labels[order] = np.arange(len(unique))
+    return labels[np.searchsorted(unique, roots)]
+
+def medoids(distances, labels):
+    """The member of each cluster with the smallest total distance to the rest, by label"""
+    result = []
+    for label in range(labels.max() + 1):
+        members = np.flatnonzero(labels == label)
+        within = distances[np.ix_(members, members)].sum(axis=1)
+        result.append(int(members[np.argmin(within)]))
+    return result
+
+@instrument("analysis")
+def cluster_markets(metrics=('relative_direct_rent',), k=5, distance='euclidean', method='average', markets=None):
+    """Cluster markets on their quarterly trajectories of one or more metrics
+
+    markets limits the clustering to those markets (default: every market in
+    the metrics). Returns a dict with markets, labels (aligned with markets), representatives
+    (one market per cluster, largest cluster first), the distance matrix and the
+    merges from linkage().
+    """
+    with stage("market x quarter matrices", "transform"):
+        matrices = {metric: market_matrix(metric) for metric in metrics}
+        found = set().union(*(set(rows) for rows, _, _ in matrices.values()))
+        markets = sorted(found if markets is None else found & set(markets))
+        aligned = []
+        for rows, _, values in matrices.values():
+            position = {market: i for i, market in enumerate(rows)}
+            block = np.full((len(markets), values.shape[1]), np.nan)
+            for i, market in enumerate(markets):
+                if market in position:
+                    block[i] = values[position[market]]
+            aligned.append(block)
+
+    distances = pairwise_distances(aligned, distance)
+    with stage(f"{method} linkage", "aggregate"):
+        merges = linkage(distances, method)
+        labels = cut(merges, k)
+        representatives = [markets[i] for i in medoids(distances, labels)]
+    return {'markets': markets, 'labels': labels, 'representatives': representatives,
+            'distances': distances, 'merges': merges, 'metrics': list(metrics)}
+
+def representative_markets(metrics=('relative_direct_rent',), k=5, distance='euclidean', method='average',
+                           markets=None):
+    """One market per cluster, largest cluster first; used to pick chart highlights"""
+    return cluster_markets(metrics, k, distance, method, markets)['representatives']
+
+def print_clusters(result):
+    """Members of each cluster, representative first"""
+    print(f"\n===== MARKET CLUSTERS ({', '.join(result['metrics'])}) =====")
+    markets = np.array(result['markets'])
+    for label, representative in enumerate(result['representatives']):
+        members = [market for market in markets[result['labels'] == label] if market != representative]
+        print(f"{label + 1}. {representative}" + (f" (with {', '.join(members)})" if members else ""))
@@ -0,0 +1,167 @@
+# column_store.py
+#
+# On-disk column store so worker processes can share the PAD, Leases and IRS
+# data without each one re-parsing the CSVs or being sent pickled DataFrames.
+#
+# A store is a directory with one fixed-width .npy file per column plus
+# meta.json. Numeric columns are stored as-is. String columns are stored as
+# integer codes (-1 = missing) with a fixed-width unicode dictionary, like a
+# pandas Categorical. Opening a column maps the file read-only (np.load with
+# mmap_mode='r'), so any number of processes reading the same store share one
+# copy in the page cache. Pass workers the store directory, not the data:
+#
+#     store = open_store('leases')               # builds data/columns/leases/ if needed
+#     sizes = store.column('leasedSF')           # np.memmap, nothing copied
+#     markets = store.categorical('market')      # codes + dictionary
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+import loaders
+import engine
+from instrumentation import stage
+
+store_dir = os.path.join(loaders.data_dir, "columns")
+
+def _code_dtype(n_categories):
+    """Smallest signed integer type that holds the codes and -1 for missing"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def _file_name(i, column):
+    return f"{i:03d}_{re.sub(r'[^A-Za-z0-9_]+', '_', column)}"
+
+def write_column_store(df, directory, source=None):
+    """Write a DataFrame as a column store directory"""
+    df = engine.to_numpy_backed(df)
+    os.makedirs(directory, exist_ok=True)
+    # Drop columns left over from an older version of the store
+    for old_file in os.listdir(directory):
+        if old_file.endswith(".npy"):
+            os.remove(os.path.join(directory, old_file))
+    columns = []
+
+    with stage(f"write column store {os.path.basename(directory)}", "save"):
+        for i, name in enumerate(df.columns):
+            file_name = _file_name(i, name)
+            values = df[name]
+            if values.dtype.kind in 'biuf':
+                np.save(os.path.join(directory, file_name + ".npy"), values.to_numpy())
+                columns.append({'name': name, 'kind': 'numeric', 'file': file_name + ".npy"})
+            else:
+                codes, uniques = pd.factorize(values)
+                dictionary = np.asarray([str(value) for value in uniques], dtype=str)
+                np.save(os.path.join(directory, file_name + ".npy"),
+                        codes.astype(_code_dtype(len(uniques))))
+                np.save(os.path.join(directory, file_name + ".dict.npy"), dictionary)
+                columns.append({'name': name, 'kind': 'categorical', 'file': file_name + ".npy",
+                                'dictionary': file_name + ".dict.npy"})
+
+        meta = {'n_rows': len(df), 'columns': columns}
+        if source is not None:
+            # Absolute, so staleness checks work from any working directory
+            meta['source'] = os.path.abspath(source)
+            meta['signature'] = loaders.source_signature(source)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+    return ColumnStore(directory)
+
+class ColumnStore:
+    """Read-only, memory-mapped view of a column store directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._columns = {column['name']: column for column in self.meta['columns']}
+        self._dictionaries = {}
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    @property
+    def columns(self):
+        return [column['name'] for column in self.meta['columns']]
+
+    def _entry(self, name):
+        if name not in self._columns:
+            raise KeyError(f"{name!r} is not in the column store at {self.directory}")
+        return self._columns[name]
+
+    def is_categorical(self, name):
+        return self._entry(name)['kind'] == 'categorical'
+
+    def column(self, name):
+        """Memory-mapped values of a numeric column, or the codes of a string column"""
+        return np.load(os.path.join(self.directory, self._entry(name)['file']), mmap_mode='r')
+
+    def dictionary(self, name):
+        """Strings behind a categorical column's codes"""
+        if name not in self._dictionaries:
+            entry = self._entry(name)
+            if entry['kind'] != 'categorical':
+                raise ValueError(f"{name!r} is numeric and has no dictionary")
+            self._dictionaries[name] = np.load(os.path.join(self.directory, entry['dictionary']))
+        return self._dictionaries[name]
+
+    def categorical(self, name):
+        """A string column as a pandas Categorical over the mapped codes"""
+        return pd.Categorical.from_codes(self.column(name), categories=self.dictionary(name))
+
+    def code_of(self, name, value):
+        """Code of one string value in a categorical column (-1 if it never occurs)"""
+        positions = np.flatnonzero(self.dictionary(name) == value)
+        return int(positions[0]) if len(positions) else -1
+
+    def to_frame(self, columns=None, categorical=False):
+        """Materialize columns as a DataFrame; strings come back as objects unless categorical=True"""
+        data = {}
+        for name in columns or self.columns:
+            if self.is_categorical(name):
+                values = self.categorical(name)
+                data[name] = values if categorical else np.asarray(values, dtype=object)
+            else:
+                data[name] = np.asarray(self.column(name))
+        return pd.DataFrame(data)
+
+    def is_stale(self):
+        """Whether the source CSV changed, moved or disappeared since the store was written"""
+        source = self.meta.get('source')
+        if source is None:
+            # Written from a frame, nothing to compare against
+            return False
+        if not os.path.exists(source):
+            return True
+        return list(loaders.source_signature(source)) != self.meta.get('signature')
+
+def build_column_store(path, directory=None, **read_kwargs):
+    """Parse a CSV once and write it as a column store (default: data/columns/<file name>)"""
+    if directory is None:
+        directory = os.path.join(store_dir, os.path.splitext(os.path.basename(path))[0])
+    with stage(f"read {os.path.basename(path)}", "load"):
+        df = engine.read_csv(path, **read_kwargs)
+    store = write_column_store(df, directory, source=path)
+    print(f"Stored {len(store):,} rows x {len(store.columns)} columns of {path} in {directory}")
+    return store
+
+def open_store(name, directory=None, rebuild=False):
+    """Open the store for a dataset short name (see loaders.DATASETS) or CSV path, building it if missing or stale"""
+    path = loaders.dataset_path(name) if name in loaders.DATASETS else name
+    if directory is None:
+        directory = os.path.join(store_dir, name if name in loaders.DATASETS
+                                 else os.path.splitext(os.path.basename(path))[0])
+
+    if not rebuild and os.path.exists(os.path.join(directory, "meta.json")):
+        store = ColumnStore(directory)
+        if not store.is_stale():
+            return store
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} is missing, so {directory} can't be checked or rebuilt")
+        print(f"{path} changed since {directory} was written; rebuilding")
+    return build_column_store(path, directory)
@@ -0,0 +1,311 @@
+# comps.py
+#
+# Comparable leases: for each subject lease (or a hypothetical lease in a
+# building), the k most similar leases in the same market:
+#
+#     python code/cli.py comps 1203 88710 -k 10
+#     python code/cli.py comps --buildings "Austin_CBD 1_Austin_..." --leasedSF 12000
+#     index = load_comps_index()
+#     result = comps_for_leases(index, lease_ids, k=10)    # thousands of subjects at once
+#     comps_frame(result)                                   # one row per subject and comp
+#
+# A lease id is its row number in Leases.csv (0-based, after the header), which
+# is also its row in the Leases column store.
+#
+# Every lease becomes a point in a small feature space where a distance of 1
+# means "one standard difference" on a feature, scaled by WEIGHTS:
+#   size              log leasedSF, standardized
+#   time              year * 4 + quarter, standardized
+#   class             1 for class A, 0 otherwise
+#   location          km east and north of the market centre, from the building's
+#                     coordinates in address_info.csv, standardized by the spread
+#                     within markets; buildings without coordinates sit at the centre
+#   transaction_type  one-hot over the types, scaled so two different types are 1 apart
+# The index holds those points sorted by market, with the row range of each
+# market (offsets) and the standardization needed to encode new subjects. A
+# query groups the subjects by market and computes squared distances to every
+# lease of that market as |q|^2 + |x|^2 - 2 q.x, one matrix product per block of
+# subjects (about BLOCK_VALUES distances), then keeps the k smallest with
+# argpartition. The index is cached in data/comps/index.npz with the signatures
+# of Leases.csv and address_info.csv and rebuilt when either (or WEIGHTS) changes.
+import os
+import json
+import numpy as np
+import pandas as pd
+import loaders
+from column_store import open_store
+from resample import quarter_number
+from instrumentation import stage, instrument
+
+cache_dir = os.path.join(loaders.data_dir, "comps")
+index_path = os.path.join(cache_dir, "index.npz")
+
+WEIGHTS = {'size': 1.0, 'time': 1.0, 'class': 1.0, 'location': 1.0, 'transaction_type': 0.5}
+
+# Distances computed per query block (subjects x market leases), about 80 MB of float64
+BLOCK_VALUES = 10_000_000
+
+# Lease columns shown next to each comp in comps_frame()
+DETAIL_COLUMNS = ['market', 'building_id', 'year', 'quarter', 'leasedSF', 'internal_class', 'transaction_type',
+                  'company_name']
+
+KM_PER_DEGREE = 111.2
+
+def _codes(leases, name):
+    """Codes and dictionary of a string column of the Leases store"""
+    return np.asarray(leases.column(name)), leases.dictionary(name)
+
+def _periods(year, quarter):
+    return np.asarray(year, dtype=float) * 4 + np.asarray(quarter, dtype=float) - 1
+
+def building_locations(building_ids):
+    """Latitude and longitude of buildings from address_info.csv (NaN where not geocoded)"""
+    latitude = np.full(len(building_ids), np.nan)
+    longitude = np.full(len(building_ids), np.nan)
+    if not os.path.exists(loaders.dataset_path('address_info')):
+        return latitude, longitude
+    addresses = loaders.load_dataset('address_info', usecols=['id', 'latitude', 'longitude'])
+    addresses = addresses.drop_duplicates('id').set_index('id')
+    found = addresses.reindex(pd.Index(building_ids))
+    return found['latitude'].to_numpy(dtype=float), found['longitude'].to_numpy(dtype=float)
+
+class CompsIndex:
+    """Standardized lease features sorted by market, plus what's needed to encode new subjects"""
+
+    def __init__(self, features, lease_ids, offsets, markets, params):
+        self.features = features
+        self.lease_ids = lease_ids
+        self.offsets = offsets
+        self.markets = list(markets)
+        self.params = params
+        self._positions = None
+        self._norms = (features.astype(float) ** 2).sum(axis=1)
+
+    def __len__(self):
+        return len(self.lease_ids)
+
+    def positions(self, lease_ids):
+        """Rows of leases in the index (-1 for ids it doesn't have)"""
+        if self._positions is None:
+            self._positions = np.full(int(self.lease_ids.max()) + 1 if len(self) else 0, -1)
+            self._positions[self.lease_ids] = np.arange(len(self))
+        lease_ids = np.asarray(lease_ids, dtype=np.int64)
+        valid = (lease_ids >= 0) & (lease_ids < len(self._positions))
+        return np.where(valid, self._positions[np.where(valid, lease_ids, 0)], -1)
+
+    def market_of(self, positions):
+        """Market number of index rows"""
+        return np.searchsorted(self.offsets, positions, side='right') - 1
+
+    def encode(self, subjects):
+        """Feature rows for a frame of subjects with market, leasedSF, internal_class, year,
+        quarter, transaction_type and latitude/longitude (missing values fall back as in the index)"""
+        p = self.params
+        market = pd.Index(self.markets).get_indexer(subjects['market'])
+        size = np.log(pd.to_numeric(subjects['leasedSF'], errors='coerce').clip(lower=1).to_numpy(dtype=float))
+        size = np.where(np.isnan(size), p['size_median'], size)
+        # A missing quarter counts as 0 and a missing year as the mean period, as in build_comps_index
+        quarters = subjects['quarter']
+        quarter = np.zeros(len(subjects))
+        quarter[quarters.notna().to_numpy()] = quarter_number(quarters[quarters.notna()])
+        time = _periods(pd.to_numeric(subjects['year'], errors='coerce'), quarter)
+        time = np.where(np.isnan(time), p['time_mean'], time)
+        premium = (subjects['internal_class'].astype(str) == 'A').to_numpy(dtype=float)
+        types = pd.Index(p['transaction_types']).get_indexer(subjects['transaction_type'])
+        centre = np.array(p['centres'], dtype=float).reshape(-1, 2)[np.maximum(market, 0)]
+        latitude = pd.to_numeric(subjects.get('latitude', pd.Series(np.nan, index=subjects.index)),
+                                 errors='coerce').to_numpy(dtype=float)
+        longitude = pd.to_numeric(subjects.get('longitude', pd.Series(np.nan, index=subjects.index)),
+                                  errors='coerce').to_numpy(dtype=float)
+        features = _features(size, time, premium, latitude, longitude, centre, types, p)
+        return features, market
+
+def _features(size, time, premium, latitude, longitude, centre, types, p):
+    """Weighted, standardized feature matrix (rows x features)"""
+    weights = p['weights']
+    east = (longitude - centre[:, 1]) * KM_PER_DEGREE * np.cos(np.radians(centre[:, 0]))
+    north = (latitude - centre[:, 0]) * KM_PER_DEGREE
+    located = ~np.isnan(east) & ~np.isnan(north)
+    one_hot = np.zeros((len(size), len(p['transaction_types'])))
+    known = types >= 0
+    one_hot[np.flatnonzero(known), types[known]] = 1 / np.sqrt(2)
+    columns = [
+        weights['size'] * (size - p['size_mean']) / p['size_std'],
+        weights['time'] * (time - p['time_mean']) / p['time_std'],
+        weights['class'] * premium,
+        weights['location'] * np.where(located, east, 0) / p['location_std'],
+        weights['location'] * np.where(located, north, 0) / p['location_std'],
+    ]
+    return np.column_stack(columns + [weights['transaction_type'] * one_hot]).astype(np.float32)
+
+def _spread(values):
+    spread = np.nanstd(values)
+    return float(spread) if spread > 0 else 1.0
+
+def build_comps_index(leases=None, weights=None):
+    """Index of every lease with a market, from the Leases column store"""
+    weights = dict(weights or WEIGHTS)
+    if leases is None:
+        leases = open_store('leases')
+    with stage("lease features", "transform"):
+        market, markets = _codes(leases, 'market')
+        klass, classes = _codes(leases, 'internal_class')
+        ttype, transaction_types = _codes(leases, 'transaction_type')
+        building, buildings = _codes(leases, 'building_id')
+        year = np.asarray(leases.column('year'), dtype=float)
+        if leases.is_categorical('quarter'):
+            quarter_codes, quarters = _codes(leases, 'quarter')
+            quarter = np.append(quarter_number(quarters), 0).astype(float)[quarter_codes]
+        else:
+            quarter = np.asarray(leases.column('quarter'), dtype=float)
+
+        size = np.log(np.clip(np.asarray(leases.column('leasedSF'), dtype=float), 1, None))
+        time = _periods(year, quarter)
+        premium = np.append(classes == 'A', False).astype(float)[klass]
+
+        latitude, longitude = building_locations(buildings)
+        latitude = np.append(latitude, np.nan)[building]
+        longitude = np.append(longitude, np.nan)[building]
+        # Market centre: mean position of its located leases
+        centres = np.full((len(markets), 2), np.nan)
+        located = ~np.isnan(latitude) & (market >= 0)
+        for coordinate, values in enumerate([latitude, longitude]):
+            total = np.bincount(market[located], weights=values[located], minlength=len(markets))
+            count = np.bincount(market[located], minlength=len(markets))
+            centres[:, coordinate] = total / np.where(count > 0, count, np.nan)
+        centre = np.append(centres, [[np.nan, np.nan]], axis=0)[market]
+        east = (longitude - centre[:, 1]) * KM_PER_DEGREE * np.cos(np.radians(centre[:, 0]))
+        north = (latitude - centre[:, 0]) * KM_PER_DEGREE
+
+        params = {
+            'weights': weights, 'transaction_types': [str(t) for t in transaction_types],
+            'size_mean': float(np.nanmean(size)), 'size_std': _spread(size), 'size_median': float(np.nanmedian(size)),
+            'time_mean': float(np.nanmean(time)), 'time_std': _spread(time),
+            'location_std': _spread(np.concatenate([east, north])) if located.any() else 1.0,
+            'centres': centres.tolist(),
+        }
+        size = np.where(np.isnan(size), params['size_median'], size)
+        time = np.where(np.isnan(time), params['time_mean'], time)
+        features = _features(size, time, premium, latitude, longitude, centre, ttype, params)
+
+    with stage("sort leases by market", "transform"):
+        order = np.argsort(market, kind='stable')
+        order = order[market[order] >= 0]
+        counts = np.bincount(market[order], minlength=len(markets))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    print(f"Indexed {len(order):,} leases in {len(markets)} markets for comps")
+    return CompsIndex(features[order], order.astype(np.int64), offsets, [str(m) for m in markets], params)
+
+def _signature():
+    paths = [loaders.dataset_path('leases'), loaders.dataset_path('address_info')]
+    return [list(loaders.source_signature(path)) if os.path.exists(path) else None for path in paths]
+
+def save_comps_index(index, signature):
+    os.makedirs(cache_dir, exist_ok=True)
+    meta = {'markets': index.markets, 'params': index.params, 'signature': signature}
+    with stage("write comps index", "save"):
+        np.savez(index_path, features=index.features, lease_ids=index.lease_ids, offsets=index.offsets,
+                 meta=np.array(json.dumps(meta)))
+
+def load_comps_index(rebuild=False):
+    """The comps index from data/comps/, rebuilt if Leases, address_info or WEIGHTS changed"""
+    signature = _signature()
+    if not rebuild and os.path.exists(index_path):
+        with np.load(index_path) as stored:
+            meta = json.loads(str(stored['meta']))
+            if meta['signature'] == signature and meta['params']['weights'] == WEIGHTS:
+                return CompsIndex(stored['features'], stored['lease_ids'], stored['offsets'],
+                                  meta['markets'], meta['params'])
+    index = build_comps_index()
+    save_comps_index(index, signature)
+    return index
+
+def nearest(index, features, market, k=10, exclude=None):
+    """k nearest index leases in the same market for each subject row
+
+    market is each subject's market number (-1: no comps); exclude optionally
+    gives an index row per subject to leave out (the subject itself). Returns
+    (lease ids, distances), subjects x k, padded with -1 / NaN when a market has
+    fewer than k other leases.
+    """
+    comps = np.full((len(features), k), -1, dtype=np.int64)
+    distances = np.full((len(features), k), np.nan)
+    exclude = np.full(len(features), -1) if exclude is None else np.asarray(exclude)
+    with stage(f"{k} nearest comps of {len(features):,} subjects", "aggregate"):
+        for m in np.unique(market[market >= 0]):
+            start, end = index.offsets[m], index.offsets[m + 1]
+            if end == start:
+                continue
+            points, norms = index.features[start:end].astype(float), index._norms[start:end]
+            subjects = np.flatnonzero(market == m)
+            block = max(1, BLOCK_VALUES // (end - start))
+            for first in range(0, len(subjects), block):
+                rows = subjects[first:first + block]
+                query = features[rows].astype(float)
+                squared = (query ** 2).sum(axis=1)[:, np.newaxis] + norms[np.newaxis, :] - 2 * query @ points.T
+                own = exclude[rows] - start
+                mine = (exclude[rows] >= start) & (exclude[rows] < end)
+                squared[np.flatnonzero(mine), own[mine]] = np.inf
+                n = min(k, end - start)
+                nearest_rows = np.argpartition(squared, n - 1, axis=1)[:, :n]
+                nearest_squared = np.take_along_axis(squared, nearest_rows, axis=1)
+                ranked = np.argsort(nearest_squared, axis=1, kind='stable')
+                nearest_rows = np.take_along_axis(nearest_rows, ranked, axis=1)
+                nearest_squared = np.take_along_axis(nearest_squared, ranked, axis=1)
+                found = np.isfinite(nearest_squared)
+                comps[rows, :n] = np.where(found, index.lease_ids[start + nearest_rows], -1)
+                distances[rows, :n] = np.where(found, np.sqrt(np.clip(nearest_squared, 0, None)), np.nan)
+    return comps, distances
+
+@instrument("analysis")
+def comps_for_leases(index, lease_ids, k=10):
+    """Comparable leases for existing leases (never the subject itself)"""
+    lease_ids = np.atleast_1d(np.asarray(lease_ids, dtype=np.int64))
+    positions = index.positions(lease_ids)
+    market = np.where(positions >= 0, index.market_of(positions), -1)
+    features = index.features[np.maximum(positions, 0)]
+    comps, distances = nearest(index, features, market, k, exclude=positions)
+    return {'subjects': lease_ids, 'comps': comps, 'distances': distances}
+
+@instrument("analysis")
+def comps_for(index, subjects, k=10):
+    """Comparable leases for a frame of hypothetical subject leases (see CompsIndex.encode)"""
+    features, market = index.encode(subjects.reset_index(drop=True))
+    comps, distances = nearest(index, features, market, k)
+    return {'subjects': np.arange(len(subjects)), 'comps': comps, 'distances': distances}
+
+def building_subjects(building_ids, leasedSF=None, year=None, quarter=None, transaction_type='New'):
+    """One hypothetical lease per building: its market, class and location, its median lease
+    size and latest quarter unless given"""
+    from building_store import open_building_store
+
+    history = open_building_store().history_frame(building_ids, ['year', 'quarter', 'leasedSF', 'market',
+                                                                 'internal_class'])
+    missing = sorted(set(np.atleast_1d(building_ids)) - set(history['building_id']))
+    if missing:
+        raise ValueError(f"no leases for buildings {missing}")
+    grouped = history.groupby('building_id', sort=False)
+    subjects = grouped[['year', 'quarter', 'market', 'internal_class']].last()
+    subjects['leasedSF'] = grouped['leasedSF'].median()
+    for name, value in [('leasedSF', leasedSF), ('year', year), ('quarter', quarter)]:
+        if value is not None:
+            subjects[name] = value
+    subjects['transaction_type'] = transaction_type
+    subjects['latitude'], subjects['longitude'] = building_locations(subjects.index.to_numpy())
+    return subjects.loc[list(dict.fromkeys(np.atleast_1d(building_ids)))].reset_index()
+
+def comps_frame(result, columns=DETAIL_COLUMNS):
+    """One row per subject and comp: subject, rank, lease_id, distance and the comp's lease columns"""
+    k = result['comps'].shape[1]
+    frame = pd.DataFrame({'subject': np.repeat(result['subjects'], k),
+                          'rank': np.tile(np.arange(1, k + 1), len(result['subjects'])),
+                          'lease_id': result['comps'].ravel(), 'distance': result['distances'].ravel()})
+    frame = frame[frame['lease_id'] >= 0].reset_index(drop=True)
+    leases = open_store('leases')
+    rows = frame['lease_id'].to_numpy()
+    for name in [col for col in columns if col in leases]:
+        values = np.asarray(leases.column(name))[rows]
+        if leases.is_categorical(name):
+            values = np.append(leases.dictionary(name), '')[values]   # -1 (missing) -> ''
+        frame[name] = values
+    return frame
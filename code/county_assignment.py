@@ -0,0 +1,199 @@
+# county_assignment.py
+#
+# Tags every geocoded building in address_info.csv with the FIPS code of its
+# nearest county centroid (data/irs/us_county_latlng.csv), so lease activity can
+# be joined to the IRS county migration flows on an integer key:
+#
+#     python code/cli.py counties
+#     leases = attach_counties(loaders.load_leases())     # adds county_fips etc.
+#
+# The ~3.2k centroids are bucketed into a grid of 1 degree cells. Each building
+# is only compared with the centroids in its own and the 8 surrounding cells,
+# as one (buildings x candidates) haversine array. The answer is exact whenever
+# the second-nearest candidate is closer than the edge of that 3x3 block; the
+# few buildings where it isn't (sparse areas, far from any centroid) are checked
+# against every centroid instead.
+#
+# A centroid is not a boundary, so the nearest centroid is not always the
+# county that contains the building. county_confidence flags the doubtful ones:
+#   high       nearest centroid within FAR_KM and clearly closer than the next
+#   ambiguous  the second-nearest centroid is nearly as close
+#   far        no centroid within FAR_KM (large counties, offshore coordinates)
+#   missing    the building has no coordinates
+import os
+import numpy as np
+import pandas as pd
+import loaders
+from instrumentation import stage, instrument
+
+building_counties_path = os.path.join(loaders.data_dir, "building_counties.csv")
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+FAR_KM = 80.0
+AMBIGUOUS_RATIO = 1.25
+
+def _unit_vectors(lat, lng):
+    """Points on the unit sphere, last axis (x, y, z)"""
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km; arguments broadcast like NumPy arrays"""
+    lat1, lng1, lat2, lng2 = (np.radians(value) for value in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class CountyGrid:
+    """County centroids bucketed by grid cell for nearest-centroid lookups"""
+
+    def __init__(self, counties, cell_degrees=1.0):
+        self.fips = counties['fips_code'].to_numpy()
+        self.names = counties['name'].to_numpy()
+        self.lat = counties['lat'].to_numpy(dtype=float)
+        self.lng = counties['lng'].to_numpy(dtype=float)
+        self.xyz = _unit_vectors(self.lat, self.lng)
+        self.cell_degrees = cell_degrees
+        self.n_cols = int(np.ceil(360 / cell_degrees))
+
+        # Centroid positions sorted by cell; self.cells[i]'s centroids are
+        # self.order[self.starts[i]:self.starts[i] + self.counts[i]]
+        cells = self._cell(*self._grid_position(self.lat, self.lng))
+        self.order = np.argsort(cells, kind='stable')
+        self.cells, self.starts, self.counts = np.unique(cells[self.order], return_index=True, return_counts=True)
+
+    def _grid_position(self, lat, lng):
+        row = np.floor((lat + 90) / self.cell_degrees).astype(int)
+        col = np.floor((lng + 180) / self.cell_degrees).astype(int)
+        return row, col
+
+    def _cell(self, row, col):
+        return row * self.n_cols + col % self.n_cols
+
+    def _candidates(self, row, col):
+        """Centroid positions in the 3x3 block of cells around one cell"""
+        block = self._cell(row + np.repeat([-1, 0, 1], 3), col + np.tile([-1, 0, 1], 3))
+        found = np.searchsorted(self.cells, block)
+        found = found[(found < len(self.cells)) & (self.cells[np.minimum(found, len(self.cells) - 1)] == block)]
+        if len(found) == 0:
+            return np.array([], dtype=int)
+        return np.concatenate([self.order[start:start + count]
+                               for start, count in zip(self.starts[found], self.counts[found])])
+
+    def _block_radius(self, lat):
+        """Distance from a point to the nearest edge of its 3x3 block, a lower bound in km"""
+        cell = self.cell_degrees
+        lat_edge = np.minimum(np.mod(lat + 90, cell), cell - np.mod(lat + 90, cell)) + cell
+        lng_scale = np.cos(np.radians(np.minimum(np.abs(lat) + 2 * cell, 90)))
+        return KM_PER_DEGREE * np.minimum(lat_edge, cell * lng_scale)
+
+    def _two_nearest(self, lat, lng, candidates):
+        """Positions and distances (km) of the two nearest of the candidate centroids for each point"""
+        if len(candidates) < 2:
+            candidates = np.arange(len(self.lat))
+        # Rank by the dot product of unit vectors (cheaper than haversine and in
+        # the same order), then convert just the two winners to km
+        closeness = _unit_vectors(lat, lng) @ self.xyz[candidates].T
+        best = np.argpartition(-closeness, 1, axis=1)[:, :2]
+        top = np.take_along_axis(closeness, best, axis=1)
+        swap = top[:, 1] > top[:, 0]
+        best[swap] = best[swap, ::-1]
+        best = candidates[best]
+        return best, haversine_km(lat[:, np.newaxis], lng[:, np.newaxis], self.lat[best], self.lng[best])
+
+    def nearest(self, lat, lng):
+        """(position, distance km, second-nearest distance km) of the nearest centroid for each point
+
+        Points are grouped by grid cell and each group is compared with its 3x3
+        block of centroids in one matrix product.
+        """
+        lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+        position = np.zeros(len(lat), dtype=int)
+        distance = np.full((len(lat), 2), np.inf)
+
+        row, col = self._grid_position(lat, lng)
+        cells = self._cell(row, col)
+        order = np.argsort(cells, kind='stable')
+        point_cells, starts = np.unique(cells[order], return_index=True)
+        for cell, points in zip(point_cells, np.split(order, starts[1:])):
+            found, found_distance = self._two_nearest(
+                lat[points], lng[points], self._candidates(row[points[0]], col[points[0]]))
+            position[points], distance[points] = found[:, 0], found_distance
+
+        # Anything beyond the block edge might be beaten by a centroid outside it
+        unsure = np.flatnonzero(distance[:, 1] > self._block_radius(lat))
+        if len(unsure):
+            found, found_distance = self._two_nearest(lat[unsure], lng[unsure], np.arange(len(self.lat)))
+            position[unsure], distance[unsure] = found[:, 0], found_distance
+        return position, distance[:, 0], distance[:, 1]
+
+def load_counties():
+    """County centroids with integer 5-digit FIPS codes"""
+    return loaders.load_dataset('county_latlng')
+
+def confidence(distance, second_distance):
+    """high / ambiguous / far / missing for each nearest-centroid match"""
+    with np.errstate(invalid='ignore'):
+        flag = np.where(second_distance < AMBIGUOUS_RATIO * distance, 'ambiguous', 'high')
+        flag = np.where(distance > FAR_KM, 'far', flag)
+    return np.where(np.isnan(distance), 'missing', flag)
+
+def assign_counties(buildings, counties=None, grid=None):
+    """county_fips, county_name, county_distance_km and county_confidence for each building
+
+    buildings needs latitude and longitude columns; rows without them get a
+    missing county_fips.
+    """
+    if grid is None:
+        grid = CountyGrid(load_counties() if counties is None else counties)
+    located = (buildings['latitude'].notna() & buildings['longitude'].notna()).to_numpy()
+    lat = buildings['latitude'].to_numpy(dtype=float)[located]
+    lng = buildings['longitude'].to_numpy(dtype=float)[located]
+
+    with stage(f"nearest county for {located.sum():,} buildings", "transform"):
+        position, distance, second = grid.nearest(lat, lng)
+
+    assigned = buildings.copy()
+    assigned['county_fips'] = pd.Series(pd.NA, index=buildings.index, dtype='Int64')
+    assigned['county_name'] = None
+    assigned['county_distance_km'] = np.nan
+    assigned.loc[located, 'county_fips'] = grid.fips[position]
+    assigned.loc[located, 'county_name'] = grid.names[position]
+    assigned.loc[located, 'county_distance_km'] = distance
+    second_distance = np.full(len(buildings), np.nan)
+    second_distance[located] = second
+    assigned['county_confidence'] = confidence(assigned['county_distance_km'].to_numpy(), second_distance)
+    return assigned
+
+@instrument("analysis")
+def build_building_counties(output_path=building_counties_path):
+    """Assign every building in address_info.csv to a county and write building_counties.csv"""
+    buildings = loaders.load_dataset('address_info', index_col=0)
+    assigned = assign_counties(buildings)
+    columns = ['id', 'county_fips', 'county_name', 'county_distance_km', 'county_confidence']
+
+    with stage("write building_counties.csv", "save"):
+        assigned[columns].to_csv(output_path, index=False)
+    counts = assigned['county_confidence'].value_counts()
+    print(f"Wrote counties for {len(assigned):,} buildings to {output_path} "
+          f"({', '.join(f'{count:,} {flag}' for flag, count in counts.items())})")
+    return assigned
+
+def load_building_counties():
+    """building id -> county columns, (re)building the file if it's missing or older than address_info.csv"""
+    source = loaders.dataset_path('address_info')
+    if (not os.path.exists(building_counties_path)
+            or os.path.getmtime(source) > os.path.getmtime(building_counties_path)):
+        build_building_counties()
+    return loaders.load_dataset('building_counties', dtype={'county_fips': 'Int64'})
+
+def attach_counties(leases, building_column='building_id'):
+    """Add the county columns to lease rows by building id"""
+    counties = load_building_counties().rename(columns={'id': building_column})
+    return leases.merge(counties, on=building_column, how='left')
+
+if __name__ == "__main__":
+    build_building_counties()
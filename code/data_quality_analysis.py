@@ -1,62 +1,93 @@
 # data_quality_analysis.py
 import pandas as pd
 import numpy as np
-import os
 from datetime import datetime
+from instrumentation import stage, instrument
+from engine import describe
+from loaders import load_leases, load_occupancy, load_price_availability, load_unemployment
+from validation import validate, print_report
+from resample import resample
+from memory_budget import map_reduce
 
-data_dir = "data"
+def lease_profile(df):
+    """Missing values, category counts and lease sizes of a frame of leases (combinable per chunk)"""
+    with stage("lease profile", "aggregate"):
+        return {
+            'rows': len(df),
+            'missing': df.isnull().sum(),
+            'market': df['market'].value_counts(),
+            'internal_class': df['internal_class'].value_counts(),
+            'transaction_type': df['transaction_type'].value_counts(),
+            'leasedSF': df['leasedSF'].to_numpy(),
+        }
 
+def combine_lease_profiles(profiles):
+    """One profile from per-chunk profiles; counts are summed and ties ordered by name"""
+    combined = {'rows': sum(profile['rows'] for profile in profiles),
+                'missing': pd.concat([profile['missing'] for profile in profiles]).groupby(level=0, sort=False).sum(),
+                'leasedSF': pd.Series(np.concatenate([profile['leasedSF'] for profile in profiles]), name='leasedSF')}
+    for col in ['market', 'internal_class', 'transaction_type']:
+        counts = pd.concat([profile[col] for profile in profiles]).groupby(level=0).sum()
+        combined[col] = counts.sort_values(ascending=False, kind='stable')
+    return combined
+
+@instrument("analysis")
 def analyze_leases_sample(sample_size=10000):
-    """Analyze a sample of the leases dataset"""
+    """Analyze a sample of the leases dataset (sample_size=None: all of it, within the memory budget)"""
     print("\n===== LEASES DATASET ANALYSIS =====")
     
-    filepath = os.path.join(data_dir, "Leases.csv")
-    # Read a random sample to get a representative view
-    df = pd.read_csv(filepath, nrows=sample_size)
+    if sample_size is None:
+        # Whole file: in memory if it fits the budget, otherwise chunk by chunk
+        profile = map_reduce('leases', lease_profile, combine_lease_profiles)
+    else:
+        # Read a random sample to get a representative view
+        profile = combine_lease_profiles([lease_profile(load_leases(nrows=sample_size))])
+    rows = profile['rows']
     
     # Basic stats
-    print(f"Sample size: {len(df):,} rows")
+    print(f"Sample size: {rows:,} rows")
     
     # Check for missing values
-    missing = df.isnull().sum()
+    missing = profile['missing']
     print("\nColumns with missing values:")
     for col in missing[missing > 0].index.sort_values():
-        print(f"- {col}: {missing[col]:,} missing values ({missing[col]/len(df):.1%})")
+        print(f"- {col}: {missing[col]:,} missing values ({missing[col]/rows:.1%})")
     
     # Markets distribution
     print("\nTop 10 markets by number of leases:")
-    market_counts = df['market'].value_counts().head(10)
+    market_counts = profile['market'].head(10)
     for market, count in market_counts.items():
-        print(f"- {market}: {count:,} leases ({count/len(df):.1%})")
+        print(f"- {market}: {count:,} leases ({count/rows:.1%})")
     
     # Building class distribution
     print("\nDistribution by building class:")
-    class_counts = df['internal_class'].value_counts()
+    class_counts = profile['internal_class']
     for cls, count in class_counts.items():
-        print(f"- Class {cls}: {count:,} leases ({count/len(df):.1%})")
+        print(f"- Class {cls}: {count:,} leases ({count/rows:.1%})")
     
     # Lease size distribution
     print("\nLease size statistics (square feet):")
-    print(df['leasedSF'].describe())
+    print(describe(profile['leasedSF']))
     
     # Transaction type distribution
     print("\nTransaction types:")
-    type_counts = df['transaction_type'].value_counts()
+    type_counts = profile['transaction_type']
     for typ, count in type_counts.items():
-        print(f"- {typ}: {count:,} ({count/len(df):.1%})")
+        print(f"- {typ}: {count:,} ({count/rows:.1%})")
 
+@instrument("analysis")
 def analyze_market_occupancy():
     """Analyze the market occupancy dataset"""
     print("\n===== MARKET OCCUPANCY DATASET ANALYSIS =====")
     
-    filepath = os.path.join(data_dir, "Major Market Occupancy Data.csv")
-    df = pd.read_csv(filepath)
+    df = load_occupancy()
     
     # Basic stats
     print(f"Total rows: {len(df):,}")
     
     # Check for missing values
-    missing = df.isnull().sum()
+    with stage("missing value counts", "aggregate"):
+        missing = df.isnull().sum()
     print("\nColumns with missing values:")
     for col in missing[missing > 0].index.sort_values():
         print(f"- {col}: {missing[col]:,} missing values ({missing[col]/len(df):.1%})")
@@ -69,20 +100,21 @@ def analyze_market_occupancy():
     
     # Occupancy statistics
     print("\nOccupancy proportion statistics:")
-    print(df['occupancy_proportion'].describe())
+    print(describe(df['occupancy_proportion']))
 
+@instrument("analysis")
 def analyze_price_availability():
     """Analyze the price and availability dataset"""
     print("\n===== PRICE AND AVAILABILITY DATASET ANALYSIS =====")
     
-    filepath = os.path.join(data_dir, "Price and Availability Data.csv")
-    df = pd.read_csv(filepath)
+    df = load_price_availability()
     
     # Basic stats
     print(f"Total rows: {len(df):,}")
     
     # Check for missing values
-    missing = df.isnull().sum()
+    with stage("missing value counts", "aggregate"):
+        missing = df.isnull().sum()
     print("\nColumns with missing values:")
     for col in missing[missing > 0].index.sort_values():
         print(f"- {col}: {missing[col]:,} missing values ({missing[col]/len(df):.1%})")
@@ -109,18 +141,19 @@ def analyze_price_availability():
         print(f"- Min: ${rent_stats['min']:.2f}")
         print(f"- Max: ${rent_stats['max']:.2f}")
 
+@instrument("analysis")
 def analyze_unemployment():
     """Analyze the unemployment dataset"""
     print("\n===== UNEMPLOYMENT DATASET ANALYSIS =====")
     
-    filepath = os.path.join(data_dir, "Unemployment.csv")
-    df = pd.read_csv(filepath)
+    df = load_unemployment()
     
     # Basic stats
     print(f"Total rows: {len(df):,}")
     
     # Check for missing values
-    missing = df.isnull().sum()
+    with stage("missing value counts", "aggregate"):
+        missing = df.isnull().sum()
     print("\nColumns with missing values:")
     for col in missing[missing > 0].index.sort_values():
         print(f"- {col}: {missing[col]:,} missing values ({missing[col]/len(df):.1%})")
@@ -133,18 +166,25 @@ def analyze_unemployment():
     
     # Unemployment rate statistics
     print("\nUnemployment rate statistics:")
-    print(df['unemployment_rate'].describe())
+    print(describe(df['unemployment_rate']))
     
     # Evolution over time (yearly averages)
     print("\nYearly average unemployment rates:")
-    yearly_avg = df.groupby('year')['unemployment_rate'].mean()
-    for year, rate in yearly_avg.items():
+    with stage("yearly unemployment averages", "aggregate"):
+        yearly_avg = resample(df, 'year', columns=['unemployment_rate'])
+    for year, rate in yearly_avg.itertuples(index=False):
         print(f"- {year}: {rate:.2f}%")
 
-if __name__ == "__main__":
+def main(full=False, run_validation=False):
+    """Profile the datasets; run_validation also checks every dataset in full against validation.RULES"""
     print(f"Starting data quality analysis at {datetime.now()}")
-    analyze_leases_sample()
+    analyze_leases_sample(None if full else 10000)
     analyze_market_occupancy()
     analyze_price_availability()
     analyze_unemployment()
-    print(f"\nCompleted analysis at {datetime.now()}")
\ No newline at end of file
+    if run_validation:
+        print_report(validate())
+    print(f"\nCompleted analysis at {datetime.now()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# engine.py
+#
+# Dataframe engine used by the loaders and the core aggregations.
+#
+#   pandas  (default) NumPy-backed columns, C CSV parser, pandas groupby
+#   arrow   pyarrow CSV parser, Arrow-backed dtypes (string[pyarrow] etc.) so
+#           string ops run in Arrow compute, and groupbys through pyarrow
+#
+# Pick the engine with DATAFEST_ENGINE=arrow or set_engine("arrow"). The arrow
+# engine needs pyarrow; if DATAFEST_ENGINE asks for it and pyarrow is missing we
+# fall back to pandas. Aggregation results come back NumPy-backed either way, so
+# downstream code and output are the same whichever engine produced them.
+import os
+import importlib.util
+import pandas as pd
+import numpy as np
+
+ENGINES = ("pandas", "arrow")
+
+# read_csv options the pyarrow parser doesn't support; these fall back to the C parser
+_ARROW_UNSUPPORTED = {"nrows", "chunksize", "iterator", "skipfooter", "low_memory", "memory_map"}
+
+# pandas aggregation name -> pyarrow hash aggregation
+_ARROW_AGGREGATIONS = {
+    "sum": "sum",
+    "mean": "mean",
+    "min": "min",
+    "max": "max",
+    "count": "count",
+    "std": "stddev",
+    "var": "variance",
+    "nunique": "count_distinct",
+}
+
+def arrow_available():
+    """Whether pyarrow is installed"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+def _default_engine():
+    name = os.environ.get("DATAFEST_ENGINE", "pandas").lower()
+    if name not in ENGINES:
+        raise ValueError(f"DATAFEST_ENGINE must be one of {ENGINES}, got {name!r}")
+    if name == "arrow" and not arrow_available():
+        print("DATAFEST_ENGINE=arrow but pyarrow is not installed; using pandas")
+        return "pandas"
+    return name
+
+_engine = _default_engine()
+
+def set_engine(name):
+    """Switch the engine used when functions are called without engine="""
+    global _engine
+    if name not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}, got {name!r}")
+    if name == "arrow" and not arrow_available():
+        raise ImportError("the arrow engine needs pyarrow (pip install pyarrow)")
+    _engine = name
+
+def get_engine():
+    """Name of the engine currently in use"""
+    return _engine
+
+def _resolve(engine):
+    return engine or _engine
+
+def read_csv(path, engine=None, **kwargs):
+    """pd.read_csv through the selected engine"""
+    if _resolve(engine) == "pandas":
+        return pd.read_csv(path, **kwargs)
+
+    if _ARROW_UNSUPPORTED & kwargs.keys():
+        # Chunked/partial reads still get Arrow-backed dtypes from the C parser
+        for key in ("low_memory", "memory_map"):
+            kwargs.pop(key, None)
+        return pd.read_csv(path, dtype_backend="pyarrow", **kwargs)
+    df = pd.read_csv(path, engine="pyarrow", dtype_backend="pyarrow", **kwargs)
+    # The C parser names blank headers (e.g. a saved index) "Unnamed: <i>"; pyarrow leaves them empty
+    return df.rename(columns={col: f"Unnamed: {i}" for i, col in enumerate(df.columns) if col == ""})
+
+def to_numpy_backed(df):
+    """Convert Arrow-backed columns to the dtypes the pandas engine would produce"""
+    arrow_columns = [col for col in df.columns if isinstance(df[col].dtype, pd.ArrowDtype)]
+    if not arrow_columns:
+        return df
+
+    import pyarrow as pa
+    df = df.copy()
+    for col in arrow_columns:
+        arrow_type = df[col].dtype.pyarrow_dtype
+        if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+            df[col] = df[col].astype(object).where(df[col].notna(), np.nan)
+        elif pa.types.is_integer(arrow_type) and not df[col].hasnans:
+            df[col] = df[col].astype(arrow_type.to_pandas_dtype())
+        elif pa.types.is_boolean(arrow_type) and not df[col].hasnans:
+            df[col] = df[col].astype(bool)
+        else:
+            df[col] = df[col].astype("float64")
+    return df
+
+def _normalize_aggs(agg):
+    """Turn {'col': 'mean'} / {'col': ['mean', 'std']} into [(col, func), ...]"""
+    pairs = []
+    for col, funcs in agg.items():
+        for func in ([funcs] if isinstance(funcs, str) else funcs):
+            pairs.append((col, func))
+    return pairs
+
+def _arrow_groupby_agg(df, by, pairs):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    columns = list(dict.fromkeys(list(by) + [col for col, _ in pairs]))
+    table = pa.Table.from_pandas(df[columns], preserve_index=False)
+    # pandas drops rows with a missing key by default
+    for key in by:
+        table = table.filter(pc.is_valid(table[key]))
+
+    specs = []
+    for col, func in pairs:
+        if func == "sum":
+            specs.append((col, "sum", pc.ScalarAggregateOptions(min_count=0)))
+        elif func in ("std", "var"):
+            specs.append((col, _ARROW_AGGREGATIONS[func], pc.VarianceOptions(ddof=1)))
+        elif func == "nunique":
+            specs.append((col, "count_distinct", pc.CountOptions(mode="only_valid")))
+        else:
+            specs.append((col, _ARROW_AGGREGATIONS[func]))
+    result = table.group_by(list(by)).aggregate(specs).to_pandas(types_mapper=pd.ArrowDtype)
+
+    # pyarrow names outputs "<col>_<func>"; match pandas' column layout
+    result = result.rename(columns={f"{col}_{_ARROW_AGGREGATIONS[func]}": (col, func) for col, func in pairs})
+    result = result.sort_values(list(by), kind="stable").reset_index(drop=True)
+    return result[list(by) + pairs]
+
+def groupby_agg(df, by, agg, engine=None):
+    """Grouped aggregation returned as a flat, NumPy-backed frame (like .agg(...).reset_index())
+
+    agg maps column -> function name or list of names. With a list for any
+    column the value columns are (column, function) tuples, as in pandas.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    pairs = _normalize_aggs(agg)
+    multi = any(not isinstance(funcs, str) for funcs in agg.values())
+
+    use_arrow = (_resolve(engine) == "arrow"
+                 and all(func in _ARROW_AGGREGATIONS for _, func in pairs)
+                 and len(set(pairs)) == len(pairs))
+    if use_arrow:
+        result = _arrow_groupby_agg(df, by, pairs)
+        if multi:
+            result.columns = pd.MultiIndex.from_tuples([(key, '') for key in by] + pairs)
+        else:
+            result.columns = by + [col for col, _ in pairs]
+    else:
+        result = df.groupby(by, sort=True).agg(agg).reset_index()
+    return to_numpy_backed(result)
+
+def describe(series):
+    """Series.describe() with the same dtypes and formatting under both engines"""
+    return to_numpy_backed(series.to_frame())[series.name].describe()
+
+def contains(series, pattern, regex=False, case=True):
+    """Substring match that treats missing values as no match
+
+    On Arrow-backed strings this runs in Arrow compute rather than a Python loop.
+    """
+    return series.str.contains(pattern, regex=regex, case=case, na=False).astype(bool)
+
+def frames_equal(left, right, rtol=1e-9):
+    """Compare two results after normalizing dtypes; returns (equal, message)"""
+    left = to_numpy_backed(left).reset_index(drop=True)
+    right = to_numpy_backed(right).reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, check_exact=False, rtol=rtol)
+    except AssertionError as e:
+        return False, str(e)
+    return True, ""
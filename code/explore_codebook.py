@@ -1,22 +1,29 @@
 # explore_codebook.py
 import pandas as pd
 import os
+from instrumentation import stage
 
 data_dir = "data"
 codebook_path = os.path.join(data_dir, "Data Set and Variable Codebook.xlsx")
 
-print(f"Exploring Excel codebook: {codebook_path}")
+def main():
+    print(f"Exploring Excel codebook: {codebook_path}")
 
-# List all sheets in the Excel file
-xlsx = pd.ExcelFile(codebook_path)
-print(f"Available sheets: {xlsx.sheet_names}")
+    # List all sheets in the Excel file
+    with stage("open codebook", "load"):
+        xlsx = pd.ExcelFile(codebook_path)
+    print(f"Available sheets: {xlsx.sheet_names}")
 
-# Examine each sheet
-for sheet in xlsx.sheet_names:
-    print(f"\n===== Sheet: {sheet} =====")
-    df = pd.read_excel(codebook_path, sheet_name=sheet, nrows=5)
-    print(f"Shape: {df.shape}")
-    print("Columns:")
-    print(df.columns.tolist())
-    print("\nSample data:")
-    print(df.head())
\ No newline at end of file
+    # Examine each sheet
+    for sheet in xlsx.sheet_names:
+        print(f"\n===== Sheet: {sheet} =====")
+        with stage(f"read sheet {sheet}", "load"):
+            df = pd.read_excel(codebook_path, sheet_name=sheet, nrows=5)
+        print(f"Shape: {df.shape}")
+        print("Columns:")
+        print(df.columns.tolist())
+        print("\nSample data:")
+        print(df.head())
+
+if __name__ == "__main__":
+    main()
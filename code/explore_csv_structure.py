@@ -1,6 +1,7 @@
 # explore_csv_structure.py
 import pandas as pd
 import os
+from instrumentation import stage, instrument
 
 data_dir = "data"
 files = [
@@ -10,13 +11,15 @@ files = [
     "Unemployment.csv"
 ]
 
+@instrument("analysis")
 def examine_csv_structure(filename, nrows=5):
     """Examine the structure of a CSV file"""
     filepath = os.path.join(data_dir, filename)
     print(f"\n===== Examining CSV file: {filename} =====")
     
     # Read just the header to get column names
-    df_header = pd.read_csv(filepath, nrows=0)
+    with stage(f"read header {filename}", "load"):
+        df_header = pd.read_csv(filepath, nrows=0)
     print(f"Number of columns: {len(df_header.columns)}")
     print("Column names:")
     for col in df_header.columns:
@@ -24,7 +27,8 @@ def examine_csv_structure(filename, nrows=5):
     
     # Read a few rows to see the data
     print(f"\nReading {nrows} sample rows...")
-    df_sample = pd.read_csv(filepath, nrows=nrows)
+    with stage(f"read sample {filename}", "load"):
+        df_sample = pd.read_csv(filepath, nrows=nrows)
     print("\nData types:")
     print(df_sample.dtypes)
     print("\nSample data:")
@@ -32,9 +36,13 @@ def examine_csv_structure(filename, nrows=5):
     
     return df_header.columns.tolist()
 
-# Examine each CSV file
-for file in files:
-    try:
-        examine_csv_structure(file)
-    except Exception as e:
-        print(f"Error examining {file}: {e}")
\ No newline at end of file
+def main():
+    # Examine each CSV file
+    for file in files:
+        try:
+            examine_csv_structure(file)
+        except Exception as e:
+            print(f"Error examining {file}: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# forecasting.py
+#
+# Forecasts rent, availability and occupancy for every market (and class) at
+# once.
+#
+# Each dataset is scattered into a (series x quarter) array with
+# anomalies.series_matrix(), one row per (market, class, metric), and every model
+# is fitted to all rows together with array operations:
+#
+#   linear  least-squares trend line through each series
+#   holt    Holt's linear exponential smoothing; the recursion steps through the
+#           quarters once for a grid of (alpha, beta) pairs and every series, and
+#           each series keeps the pair with the smallest one-step-ahead error
+#   ar1     y[t] = c + phi * y[t-1] fitted by least squares on consecutive pairs
+#
+# Gaps (NaN) are skipped by the fits. Intervals assume normal errors. A series
+# with no value in the last quarter gets no forecast. backtest() holds out the
+# last quarters, forecasts them from the rest and scores each model.
+#
+#     python code/cli.py forecast --horizon 4
+#     python code/cli.py forecast --backtest
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+import loaders
+from anomalies import series_matrix, _quarter_number
+from instrumentation import stage, instrument
+
+# What gets forecast: dataset -> series key columns and metrics
+SERIES = {
+    'price_availability': {'by': ['market', 'internal_class'],
+                           'metrics': ['internal_class_rent', 'availability_proportion']},
+    'occupancy': {'by': ['market'], 'metrics': ['starting_occupancy_proportion']},
+}
+
+MODELS = ['linear', 'holt', 'ar1']
+
+# Smoothing parameters tried for every series
+HOLT_ALPHAS = np.arange(0.1, 1.0, 0.1)
+HOLT_BETAS = np.array([0.01, 0.05, 0.1, 0.2, 0.3])
+
+def _last_observed(values):
+    """Mask of series that have a value in the final quarter"""
+    return ~np.isnan(values[:, -1])
+
+def linear_forecast(values, horizon, z=1.96):
+    """Trend-line forecasts for every row of values; returns (point, lower, upper), rows x horizon"""
+    t = np.arange(values.shape[1], dtype=float)
+    observed = ~np.isnan(values)
+    n = observed.sum(axis=1)
+    y = np.where(observed, values, 0)
+    x = np.where(observed, t, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = x.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(observed, t - x_mean[:, np.newaxis], 0)
+        sxx = (dx ** 2).sum(axis=1)
+        slope = (dx * y).sum(axis=1) / sxx
+        intercept = y_mean - slope * x_mean
+
+        residuals = np.where(observed, values - (intercept[:, np.newaxis] + slope[:, np.newaxis] * t), 0)
+        sigma = np.sqrt((residuals ** 2).sum(axis=1) / (n - 2))
+
+        future = values.shape[1] + np.arange(horizon, dtype=float)
+        point = intercept[:, np.newaxis] + slope[:, np.newaxis] * future
+        spread = sigma[:, np.newaxis] * np.sqrt(1 + 1 / n[:, np.newaxis]
+                                               + (future - x_mean[:, np.newaxis]) ** 2 / sxx[:, np.newaxis])
+    return point, point - z * spread, point + z * spread
+
+def _holt_filter(values, alpha, beta):
+    """Run Holt's recursion for all series and parameter pairs at once
+
+    alpha and beta are (pairs, 1) columns; returns the final level, trend, sum of
+    squared one-step errors and number of errors, each pairs x series.
+    """
+    shape = (len(alpha), values.shape[0])
+    level = np.full(shape, np.nan)
+    trend = np.zeros(shape)
+    seen = np.zeros(shape, dtype=int)
+    sse = np.zeros(shape)
+    n_errors = np.zeros(shape, dtype=int)
+
+    for y in values.T:
+        y = np.broadcast_to(y, shape)
+        observed = ~np.isnan(y)
+        first = observed & (seen == 0)
+        second = observed & (seen == 1)
+        update = observed & (seen >= 2)
+
+        # The first two values set the level and trend; after that, smooth
+        predicted = level + trend
+        error = np.where(update, y - predicted, 0)
+        new_level = predicted + alpha * error
+        new_trend = trend + alpha * beta * error
+
+        trend = np.where(second, y - level, np.where(update, new_trend, trend))
+        level = np.where(first | second, y, np.where(seen > 0, new_level, level))
+        sse += error ** 2
+        n_errors += update
+        seen += observed
+    return level, trend, sse, n_errors
+
+def holt_forecast(values, horizon, z=1.96):
+    """Holt exponential smoothing forecasts, parameters chosen per series; returns (point, lower, upper)"""
+    alpha, beta = np.meshgrid(HOLT_ALPHAS, HOLT_BETAS, indexing='ij')
+    alpha, beta = alpha.reshape(-1, 1), beta.reshape(-1, 1)
+    level, trend, sse, n_errors = _holt_filter(values, alpha, beta)
+
+    rows = np.arange(values.shape[0])
+    best = np.argmin(sse, axis=0)
+    level, trend, sse, n_errors = level[best, rows], trend[best, rows], sse[best, rows], n_errors[best, rows]
+    alpha, beta = alpha[best, 0][:, np.newaxis], beta[best, 0][:, np.newaxis]
+
+    steps = np.arange(1, horizon + 1)
+    point = level[:, np.newaxis] + steps * trend[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(sse / np.where(n_errors > 2, n_errors - 2, np.nan))
+    # Var(h) = sigma^2 * (1 + sum over j < h of (alpha * (1 + j * beta))^2)
+    weights = (alpha * (1 + np.arange(horizon) * beta)) ** 2
+    weights[:, 0] = 0
+    spread = sigma[:, np.newaxis] * np.sqrt(1 + np.cumsum(weights, axis=1))
+    return point, point - z * spread, point + z * spread
+
+def ar1_forecast(values, horizon, z=1.96):
+    """AR(1) forecasts from the last quarter; returns (point, lower, upper)"""
+    previous, current = values[:, :-1], values[:, 1:]
+    pairs = ~np.isnan(previous) & ~np.isnan(current)
+    n = pairs.sum(axis=1)
+    x = np.where(pairs, previous, 0)
+    y = np.where(pairs, current, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = x.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(pairs, previous - x_mean[:, np.newaxis], 0)
+        phi = (dx * y).sum(axis=1) / (dx ** 2).sum(axis=1)
+        constant = y_mean - phi * x_mean
+        residuals = np.where(pairs, current - constant[:, np.newaxis] - phi[:, np.newaxis] * previous, 0)
+        sigma = np.sqrt((residuals ** 2).sum(axis=1) / (n - 2))
+
+    point = np.empty((values.shape[0], horizon))
+    variance = np.empty((values.shape[0], horizon))
+    last, spread = values[:, -1], np.zeros(values.shape[0])
+    for step in range(horizon):
+        last = constant + phi * last
+        spread = 1 + phi ** 2 * spread
+        point[:, step], variance[:, step] = last, spread
+    spread = sigma[:, np.newaxis] * np.sqrt(variance)
+    return point, point - z * spread, point + z * spread
+
+FORECASTERS = {'linear': linear_forecast, 'holt': holt_forecast, 'ar1': ar1_forecast}
+
+def future_periods(periods, horizon):
+    """The horizon (year, quarter) pairs after the last period, in the same quarter format"""
+    last = periods.iloc[-1]
+    quarter = _quarter_number([last['quarter']])[0]
+    offsets = np.arange(1, horizon + 1) + quarter - 1
+    years = int(last['year']) + offsets // 4
+    quarters = offsets % 4 + 1
+    if isinstance(last['quarter'], str):
+        quarters = [f"Q{number}" for number in quarters]
+    return pd.DataFrame({'year': years, 'quarter': quarters})
+
+def forecast_matrix(values, horizon, models=MODELS, level=0.95):
+    """{model: (point, lower, upper)} for every row of a (series x quarter) array"""
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    results = {}
+    for model in models:
+        if model not in FORECASTERS:
+            raise ValueError(f"unknown model {model!r}; use one of {MODELS}")
+        with stage(f"{model} forecasts for {len(values)} series", "transform"):
+            point, lower, upper = FORECASTERS[model](values, horizon, z)
+        missing = ~_last_observed(values)
+        for array in (point, lower, upper):
+            array[missing] = np.nan
+        results[model] = (point, lower, upper)
+    return results
+
+def _tidy(keys, future, results):
+    """One row per series, model and future quarter"""
+    frames = []
+    for model, (point, lower, upper) in results.items():
+        rows, steps = np.indices(point.shape).reshape(2, -1)
+        frame = keys.iloc[rows].reset_index(drop=True)
+        frame['model'] = model
+        frame['step'] = steps + 1
+        frame[['year', 'quarter']] = future.iloc[steps].to_numpy()
+        frame['forecast'] = point.ravel()
+        frame['lower'] = lower.ravel()
+        frame['upper'] = upper.ravel()
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def _series(dataset, df=None):
+    spec = SERIES[dataset]
+    if df is None:
+        df = loaders.load_dataset(dataset)
+    return series_matrix(df, spec['metrics'], spec['by'])
+
+@instrument("analysis")
+def forecast(dataset='price_availability', horizon=4, models=MODELS, level=0.95, df=None):
+    """Point forecasts and intervals for the next horizon quarters of every series in a dataset"""
+    keys, periods, values = _series(dataset, df)
+    results = forecast_matrix(values, horizon, models, level)
+    return _tidy(keys, future_periods(periods, horizon), results)
+
+@instrument("analysis")
+def backtest(dataset='price_availability', horizon=4, models=MODELS, level=0.95, df=None):
+    """Forecast the last horizon quarters from the earlier ones and score each model
+
+    Returns one row per (model, metric, step) with the mean absolute error, mean
+    absolute percentage error and the share of actuals inside the interval.
+    """
+    keys, periods, values = _series(dataset, df)
+    if values.shape[1] <= horizon + 2:
+        raise ValueError(f"{dataset} has {values.shape[1]} quarters, too few to hold out {horizon}")
+    train, actual = values[:, :-horizon], values[:, -horizon:]
+    results = forecast_matrix(train, horizon, models, level)
+
+    scores = []
+    for model, (point, lower, upper) in results.items():
+        for metric in keys['metric'].unique():
+            rows = (keys['metric'] == metric).to_numpy()
+            error = point[rows] - actual[rows]
+            scored = ~np.isnan(error)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                for step in range(horizon):
+                    valid = scored[:, step]
+                    truth = actual[rows][valid, step]
+                    inside = (truth >= lower[rows][valid, step]) & (truth <= upper[rows][valid, step])
+                    scores.append({
+                        'model': model, 'metric': metric, 'step': step + 1, 'series': int(valid.sum()),
+                        'mae': np.mean(np.abs(error[valid, step])),
+                        'mape': np.mean(np.abs(error[valid, step] / truth)),
+                        'coverage': np.mean(inside),
+                    })
+    return pd.DataFrame(scores)
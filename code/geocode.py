@@ -0,0 +1,108 @@
+# geocode.py
+#
+# Script version of geocoding.ipynb: builds address_info.csv, market_locations.csv
+# and growth_rates.csv. Geocoding uses MapBox through geopy and needs an API key in
+# the MAPBOX_API_KEY environment variable.
+import pandas as pd
+import os
+from instrumentation import stage, instrument
+import loaders
+from growth import leased_by_year, growth_matrix, growth_between
+
+data_dir = "data"
+address_info_path = os.path.join(data_dir, "address_info.csv")
+market_locations_path = os.path.join(data_dir, "market_locations.csv")
+growth_rates_path = os.path.join(data_dir, "growth_rates.csv")
+
+def load_leases(usecols=None):
+    """Load the lease-level data"""
+    return loaders.load_leases(usecols=usecols)
+
+def build_address_info(leases):
+    """One row per building with its full street address"""
+    full_addresses = (
+        leases["address"]
+        + ", "
+        + leases["city"]
+        + ", "
+        + leases["state"]
+        + " "
+        + leases["zip"].apply(lambda x: str(int(x)) if pd.notna(x) else "")
+    )
+
+    return pd.DataFrame.from_dict(
+        {"id": leases["building_id"], "address": full_addresses}
+    ).drop_duplicates()
+
+def make_geolocator(api_key=None):
+    """MapBox geocoder; geopy is only imported when geocoding is actually run"""
+    from geopy.geocoders import MapBox
+
+    api_key = api_key or os.environ.get("MAPBOX_API_KEY")
+    if not api_key:
+        raise RuntimeError("Set MAPBOX_API_KEY to geocode addresses")
+    return MapBox(api_key=api_key)
+
+def geocode(geolocator, address):
+    """Return (latitude, longitude) for an address, or (None, None) if not found"""
+    location = geolocator.geocode(address, exactly_one=True)
+    if location is None:
+        return pd.Series([None, None])
+
+    return pd.Series([location.latitude, location.longitude])
+
+@instrument("analysis")
+def geocode_addresses(output_path=address_info_path):
+    """Geocode every building address and write address_info.csv"""
+    from tqdm.auto import tqdm
+    tqdm.pandas()
+
+    leases = load_leases(usecols=["building_id", "address", "city", "state", "zip"])
+    with stage("build building addresses", "transform"):
+        address_info = build_address_info(leases)
+
+    geolocator = make_geolocator()
+    with stage("geocode building addresses", "transform"):
+        address_info[['latitude', 'longitude']] = address_info['address'].progress_apply(
+            lambda x: geocode(geolocator, x))
+
+    with stage("write address_info.csv", "save"):
+        address_info.to_csv(output_path)
+    print(f"Wrote {len(address_info):,} buildings to {output_path}")
+    return address_info
+
+@instrument("analysis")
+def geocode_markets(output_path=market_locations_path):
+    """Geocode every lease market and write market_locations.csv"""
+    from tqdm.auto import tqdm
+    tqdm.pandas()
+
+    leases = load_leases(usecols=["market"])
+    market_locations = pd.DataFrame.from_dict({"market": leases['market'].unique() + ", United States"})
+
+    geolocator = make_geolocator()
+    with stage("geocode markets", "transform"):
+        market_locations[['latitude', 'longitude']] = market_locations['market'].progress_apply(
+            lambda x: geocode(geolocator, x))
+
+    with stage("write market_locations.csv", "save"):
+        market_locations.to_csv(output_path)
+    print(f"Wrote {len(market_locations):,} markets to {output_path}")
+    return market_locations
+
+@instrument("analysis")
+def build_growth_rates(start_year=2018, end_year=2024, output_path=growth_rates_path):
+    """Leased square feet growth per market between two years, with market coordinates"""
+    totals = leased_by_year()
+    matrix = growth_matrix(totals)
+    growth_rates = growth_between(matrix, start_year, end_year, how='inner')
+    growth_rates = growth_rates[['market', 'growth_rate', 'latitude', 'longitude']]
+
+    with stage("write growth_rates.csv", "save"):
+        growth_rates.to_csv(output_path)
+    print(f"Wrote growth rates for {len(growth_rates)} markets to {output_path}")
+    return growth_rates
+
+if __name__ == "__main__":
+    geocode_markets()
+    build_growth_rates()
@@ -0,0 +1,117 @@
+# growth.py
+#
+# Leased square feet growth between every pair of years for every market.
+#
+# leased_by_year() scans Leases once: one groupby over (market, [class/industry],
+# year), chunked if Leases is over the memory budget (memory_budget.py).
+# growth_matrix() turns the totals into a groups x years array and broadcasts it
+# against itself to get growth and CAGR for every (start, end) pair as
+# groups x years x years arrays, with market coordinates attached. Any
+# growth map or ranking (2018 -> 2024, 2020 -> 2023, ...) is then a slice of the
+# matrix, so it doesn't need another pass over Leases.
+import json
+import numpy as np
+import pandas as pd
+import loaders
+from engine import groupby_agg
+from memory_budget import grouped
+from instrumentation import stage
+
+def _as_list(cols):
+    if cols is None:
+        return []
+    return [cols] if isinstance(cols, str) else list(cols)
+
+def leased_by_year(leases=None, by=None, value='leasedSF'):
+    """Total leased SF per (market, *by, year), e.g. by='internal_class' or 'internal_industry'"""
+    by = _as_list(by)
+    if leases is None:
+        # All of Leases, read whole or in chunks depending on the memory budget
+        return grouped('leases', ['market'] + by + ['year'], {value: 'sum'})
+
+    with stage(f"{value} by market and year", "aggregate"):
+        return groupby_agg(leases, ['market'] + by + ['year'], {value: 'sum'})
+
+def growth_matrix(totals, value='leasedSF', locations=None):
+    """Growth and CAGR between every pair of years for every group
+
+    totals is the frame from leased_by_year(). Returns a dict with
+      keys       group key columns, one row per group
+      years      the years, in order
+      totals     groups x years
+      growth     groups x start year x end year, end / start - 1
+      cagr       groups x start year x end year, NaN where end <= start
+      locations  market, latitude, longitude (default: market_locations.csv)
+    A group/year with no leases is NaN, and so is any growth involving it.
+    """
+    key_columns = [col for col in totals.columns if col not in ('year', value)]
+
+    with stage("growth and CAGR for all year pairs", "transform"):
+        wide = totals.set_index(key_columns + ['year'])[value].unstack('year').sort_index(axis=1)
+        years = wide.columns.to_numpy()
+        values = wide.to_numpy(dtype=float)
+
+        start = values[:, :, np.newaxis]
+        end = values[:, np.newaxis, :]
+        span = (years[np.newaxis, :] - years[:, np.newaxis]).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = end / start
+            growth = ratio - 1
+            cagr = np.where(span > 0, ratio ** (1 / np.where(span > 0, span, 1)) - 1, np.nan)
+
+    if locations is None:
+        locations = loaders.load_market_locations()
+
+    return {
+        'keys': wide.index.to_frame(index=False),
+        'years': years,
+        'totals': values,
+        'growth': growth,
+        'cagr': cagr,
+        'locations': locations[['market', 'latitude', 'longitude']],
+    }
+
+def _year_position(matrix, year):
+    positions = np.flatnonzero(matrix['years'] == year)
+    if len(positions) == 0:
+        raise ValueError(f"{year} is not in the growth matrix (years {matrix['years'].min()}-{matrix['years'].max()})")
+    return positions[0]
+
+def growth_between(matrix, start_year, end_year, how='left'):
+    """One row per group with growth_rate and cagr from start_year to end_year, plus coordinates
+
+    how is the join with the market locations ('inner' drops markets without coordinates).
+    """
+    i, j = _year_position(matrix, start_year), _year_position(matrix, end_year)
+    frame = matrix['keys'].copy()
+    frame['growth_rate'] = matrix['growth'][:, i, j]
+    frame['cagr'] = matrix['cagr'][:, i, j]
+    return pd.merge(frame, matrix['locations'], on='market', how=how)
+
+def rank_growth(matrix, start_year, end_year, measure='cagr', n=10, ascending=False):
+    """Groups with the highest (or lowest) growth between two years"""
+    frame = growth_between(matrix, start_year, end_year)
+    return frame.dropna(subset=[measure]).sort_values(measure, ascending=ascending).head(n)
+
+def save_growth_matrix(matrix, path):
+    """Save a growth matrix to an .npz so later maps and rankings skip Leases entirely"""
+    with stage(f"write {path}", "save"):
+        np.savez_compressed(path, years=matrix['years'], totals=matrix['totals'],
+                            growth=matrix['growth'], cagr=matrix['cagr'],
+                            keys=json.dumps(matrix['keys'].to_dict(orient='split')),
+                            locations=json.dumps(matrix['locations'].to_dict(orient='split')))
+
+def load_growth_matrix(path):
+    """Growth matrix saved by save_growth_matrix()"""
+    with stage(f"read {path}", "load"):
+        with np.load(path) as data:
+            keys = json.loads(str(data['keys']))
+            locations = json.loads(str(data['locations']))
+            return {
+                'keys': pd.DataFrame(keys['data'], columns=keys['columns']),
+                'years': data['years'],
+                'totals': data['totals'],
+                'growth': data['growth'],
+                'cagr': data['cagr'],
+                'locations': pd.DataFrame(locations['data'], columns=locations['columns']),
+            }
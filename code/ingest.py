@@ -0,0 +1,237 @@
+# ingest.py
+#
+# Append a new period of PAD, Cleaned PAD, occupancy, unemployment or inflation
+# data and update the derived aggregates without recomputing the full history.
+#
+#     python code/cli.py ingest cleaned_pad new_quarter.csv
+#
+# The aggregates live in data/aggregates/ as small CSVs: the space-weighted sums
+# behind the national rent averages of the relative rent charts, and the
+# cumulative inflation deflator of the adjusted space utilization charts.
+# Ingesting a quarter appends its rows to the dataset CSV, summarizes only those
+# rows and adds them to the stored sums, and extends the deflator from its last
+# value, so a refresh costs one quarter of work.
+#
+# Per-market totals and means and the COVID recovery metrics aren't kept here:
+# they come from the PAD cube (pad_cube.py), and occupancy and unemployment by
+# period from resample.py, which cache their own results and rebuild them when
+# the CSV changes. The recovery metrics compare three fixed quarters, so a new
+# quarter doesn't change them.
+#
+# meta.json records each dataset's file signature and the periods it holds. If a
+# CSV was edited by hand the aggregates built from it are rebuilt from scratch
+# the next time they are opened.
+import os
+import json
+import numpy as np
+import pandas as pd
+import loaders
+from instrumentation import stage, instrument
+
+aggregates_dir = os.path.join(loaders.data_dir, "aggregates")
+
+# Running sums: name -> dataset, group columns and space-weighted averages as
+# {value column: weight column}
+AGGREGATES = {
+    'national_rents': {
+        'dataset': 'cleaned_pad', 'by': ['year', 'quarter', 'is_premium_quality'],
+        'weighted': {'direct_internal_class_rent': 'direct_available_space',
+                     'sublet_internal_class_rent': 'sublet_available_space'},
+    },
+}
+
+# The deflator is a running product over the inflation series
+DEFLATOR_BASE = 100.0
+
+# Datasets that can be appended to; those without aggregates only get their CSV extended
+INGESTABLE = ['price_availability', 'cleaned_pad', 'occupancy', 'unemployment', 'inflation']
+
+def _aggregate_path(name):
+    return os.path.join(aggregates_dir, f"{name}.csv")
+
+def _meta_path():
+    return os.path.join(aggregates_dir, "meta.json")
+
+def _periods(df):
+    """Sorted [year, quarter] pairs in a frame"""
+    pairs = df[['year', 'quarter']].drop_duplicates().sort_values(['year', 'quarter'])
+    return [[int(year), quarter if isinstance(quarter, str) else int(quarter)] for year, quarter in pairs.to_numpy()]
+
+def summarize(df, spec):
+    """Weighted sums and weight sums per group for one batch of rows"""
+    by = spec['by']
+    parts = {}
+    for col, weight in spec['weighted'].items():
+        # Same as np.sum(weight * value) / np.sum(weight): missing values count as zero
+        parts[f"{col}_weighted_sum"] = (df[weight] * df[col]).fillna(0)
+        parts[f"{weight}_sum"] = df[weight].fillna(0)
+    frame = pd.DataFrame(parts).join(df[by])
+    return frame.groupby(by, sort=True).sum()
+
+def finalize(table, spec):
+    """Add the weighted averages to a table of running sums"""
+    table = table.copy()
+    for col, weight in spec['weighted'].items():
+        weights = table[f"{weight}_sum"]
+        table[f"avg_national_{col}"] = table[f"{col}_weighted_sum"] / weights.where(weights > 0)
+    return table
+
+def build_deflator(inflation):
+    """Cumulative inflation per quarter, DEFLATOR_BASE in the first quarter"""
+    inflation = inflation.sort_values(['year', 'quarter']).reset_index(drop=True)
+    factors = 1 + inflation['inflation_rate'].fillna(0).to_numpy() / 100.0
+    factors[0] = 1.0
+    return inflation[['year', 'quarter', 'inflation_rate']].assign(
+        cumulative_inflation=DEFLATOR_BASE * np.cumprod(factors))
+
+def extend_deflator(deflator, new_inflation):
+    """Append quarters to the deflator, compounding from its last value"""
+    new_inflation = new_inflation.sort_values(['year', 'quarter']).reset_index(drop=True)
+    factors = 1 + new_inflation['inflation_rate'].fillna(0).to_numpy() / 100.0
+    last = deflator['cumulative_inflation'].iloc[-1] if len(deflator) else DEFLATOR_BASE / factors[0]
+    extension = new_inflation[['year', 'quarter', 'inflation_rate']].assign(
+        cumulative_inflation=last * np.cumprod(factors))
+    return pd.concat([deflator, extension], ignore_index=True)
+
+def _load_meta():
+    if not os.path.exists(_meta_path()):
+        return {'datasets': {}}
+    with open(_meta_path()) as f:
+        return json.load(f)
+
+def _save_meta(meta):
+    with open(_meta_path(), "w") as f:
+        json.dump(meta, f, indent=2)
+
+def _save_table(name, table):
+    table.to_csv(_aggregate_path(name))
+
+def _load_table(name):
+    spec = AGGREGATES[name]
+    return pd.read_csv(_aggregate_path(name), index_col=list(range(len(spec['by']))))
+
+def _dataset_aggregates(dataset):
+    return [name for name, spec in AGGREGATES.items() if spec['dataset'] == dataset]
+
+def rebuild(dataset, meta=None):
+    """Recompute every aggregate of one dataset from the full CSV"""
+    os.makedirs(aggregates_dir, exist_ok=True)
+    save = meta is None
+    meta = meta or _load_meta()
+    df = loaders.load_dataset(dataset)
+
+    with stage(f"aggregate all of {dataset}", "aggregate"):
+        if dataset == 'inflation':
+            build_deflator(df).to_csv(_aggregate_path('deflator'), index=False)
+        for name in _dataset_aggregates(dataset):
+            _save_table(name, summarize(df, AGGREGATES[name]))
+
+    meta['datasets'][dataset] = {'signature': loaders.source_signature(loaders.dataset_path(dataset)),
+                                 'periods': _periods(df)}
+    if save:
+        _save_meta(meta)
+    return meta
+
+@instrument("analysis")
+def build_aggregates(datasets=INGESTABLE):
+    """Compute all aggregates from scratch"""
+    meta = _load_meta()
+    for dataset in datasets:
+        if os.path.exists(loaders.dataset_path(dataset)):
+            rebuild(dataset, meta)
+    _save_meta(meta)
+    print(f"Wrote aggregates for {', '.join(meta['datasets'])} to {aggregates_dir}")
+
+def _refresh(dataset, meta):
+    """Rebuild one dataset's aggregates if its CSV changed outside of ingest()"""
+    entry = meta['datasets'].get(dataset)
+    path = loaders.dataset_path(dataset)
+    if entry is None:
+        print(f"Building aggregates for {path}")
+    elif list(loaders.source_signature(path)) != entry['signature']:
+        print(f"{path} changed since its aggregates were built; rebuilding")
+    else:
+        return
+    rebuild(dataset, meta)
+    _save_meta(meta)
+
+def load_aggregate(name):
+    """One aggregate table (with its weighted averages) or the deflator, as a flat frame"""
+    meta = _load_meta()
+    dataset = 'inflation' if name == 'deflator' else AGGREGATES[name]['dataset']
+    _refresh(dataset, meta)
+    if name == 'deflator':
+        return pd.read_csv(_aggregate_path('deflator'))
+    return finalize(_load_table(name), AGGREGATES[name]).reset_index()
+
+def _append_rows(path, rows):
+    """Append rows to a CSV in its own column order, without rewriting it"""
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        needs_newline = f.read(1) != b"\n"
+    with open(path, 'a', newline='') as f:
+        if needs_newline:
+            f.write("\n")
+        rows.to_csv(f, header=False, index=False)
+
+@instrument("analysis")
+def ingest(dataset, new_rows, replace=False):
+    """Append new periods to a dataset and update its aggregates with just those rows
+
+    new_rows is a CSV path or DataFrame with the dataset's columns. Periods that
+    are already stored raise ValueError unless replace=True, which rewrites the
+    dataset without them and rebuilds its aggregates.
+    """
+    if dataset not in INGESTABLE:
+        raise ValueError(f"can only ingest {INGESTABLE}, not {dataset!r}")
+    path = loaders.dataset_path(dataset)
+    with stage("read new rows", "load"):
+        if isinstance(new_rows, str):
+            new_rows = pd.read_csv(new_rows)
+        header = list(loaders.load_dataset(dataset, nrows=0).columns)
+
+    missing = set(header) - set(new_rows.columns)
+    if missing:
+        raise ValueError(f"new rows are missing columns {sorted(missing)}")
+    new_rows = new_rows[header]
+
+    os.makedirs(aggregates_dir, exist_ok=True)
+    meta = _load_meta()
+    _refresh(dataset, meta)
+
+    new_periods = _periods(new_rows)
+    stored = meta['datasets'][dataset]['periods']
+    overlap = [period for period in new_periods if period in stored]
+    if overlap and not replace:
+        raise ValueError(f"{dataset} already has {overlap}; pass replace=True to overwrite them")
+
+    if overlap:
+        with stage(f"replace {len(overlap)} periods in {dataset}", "save"):
+            old = loaders.load_dataset(dataset)
+            replaced = pd.MultiIndex.from_frame(old[['year', 'quarter']]).isin([tuple(period) for period in overlap])
+            pd.concat([old[~replaced], new_rows]).to_csv(path, index=False)
+        rebuild(dataset, meta)
+        _save_meta(meta)
+        print(f"Replaced {len(overlap)} periods of {dataset}; aggregates rebuilt")
+        return meta
+
+    with stage(f"append {len(new_rows):,} rows to {os.path.basename(path)}", "save"):
+        _append_rows(path, new_rows)
+
+    with stage(f"update {dataset} aggregates", "aggregate"):
+        if dataset == 'inflation':
+            deflator = pd.read_csv(_aggregate_path('deflator'))
+            if stored and new_periods[0] < stored[-1]:
+                deflator = build_deflator(loaders.load_dataset('inflation'))
+            else:
+                deflator = extend_deflator(deflator, new_rows)
+            deflator.to_csv(_aggregate_path('deflator'), index=False)
+        for name in _dataset_aggregates(dataset):
+            table = _load_table(name)
+            _save_table(name, table.add(summarize(new_rows, AGGREGATES[name]), fill_value=0))
+
+    meta['datasets'][dataset] = {'signature': loaders.source_signature(path),
+                                 'periods': sorted(stored + new_periods)}
+    _save_meta(meta)
+    print(f"Ingested {len(new_rows):,} rows ({len(new_periods)} periods) into {dataset}")
+    return meta
@@ -0,0 +1,191 @@
+# instrumentation.py
+#
+# Stage-level timing and memory instrumentation for the analysis and chart scripts.
+#
+# Wrap a step with `with stage("read PAD", "load"):` or decorate a function with
+# `@instrument("aggregate")`. Nothing is recorded unless profiling is enabled, either
+# by calling enable() or by setting DATAFEST_PROFILE (to a trace path, or to 1 for
+# the default path). When enabled, a Chrome trace (open in chrome://tracing or
+# Perfetto) is written and a summary table printed when the process exits.
+import os
+import sys
+import time
+import json
+import atexit
+import functools
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stage categories used across the scripts; whole entry points are recorded as
+# "analysis" or "chart" so the stages nest under them in the trace
+CATEGORIES = ["load", "transform", "aggregate", "render", "save"]
+
+default_trace_path = "profile_trace.json"
+
+_enabled = False
+_trace_path = None
+_records = []
+_stack = []
+_origin = time.perf_counter()
+_null_stage = contextlib.nullcontext()
+
+def _peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def enable(trace_path=None, trace_memory=True):
+    """Start recording stages; the trace and summary are written at exit"""
+    global _enabled, _trace_path
+    if _enabled:
+        return
+    _enabled = True
+    _trace_path = trace_path or default_trace_path
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    atexit.register(_report_at_exit)
+
+def is_enabled():
+    """Whether stages are currently being recorded"""
+    return _enabled
+
+@contextlib.contextmanager
+def _recorded_stage(name, category):
+    """Record wall/CPU time, peak RSS and tracemalloc deltas for one stage"""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        # Keep the enclosing stage's peak before resetting it for this one
+        if _stack:
+            _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+    else:
+        current = 0
+
+    frame = {'peak': current}
+    _stack.append(frame)
+    rss_before = _peak_rss_mb()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_end = time.perf_counter()
+        cpu_end = time.process_time()
+        _stack.pop()
+
+        if tracing:
+            end_current, end_peak = tracemalloc.get_traced_memory()
+            peak = max(frame['peak'], end_peak)
+            if _stack:
+                _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        else:
+            end_current, peak = 0, 0
+
+        rss_after = _peak_rss_mb()
+        _records.append({
+            'name': name,
+            'category': category,
+            'start': wall_start - _origin,
+            'wall': wall_end - wall_start,
+            'cpu': cpu_end - cpu_start,
+            'peak_rss_mb': rss_after,
+            'peak_rss_growth_mb': rss_after - rss_before,
+            'alloc_delta_mb': (end_current - current) / (1024 * 1024),
+            'alloc_peak_mb': (peak - current) / (1024 * 1024),
+            'depth': len(_stack),
+        })
+
+def stage(name, category="transform"):
+    """Context manager timing one stage; a shared no-op when profiling is disabled"""
+    if not _enabled:
+        return _null_stage
+    return _recorded_stage(name, category)
+
+def instrument(category="transform", name=None):
+    """Decorator recording every call of a function as a stage"""
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _recorded_stage(stage_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def records():
+    """Return a copy of the recorded stages"""
+    return list(_records)
+
+def write_trace(path):
+    """Write the recorded stages as a Chrome trace-event JSON file"""
+    pid = os.getpid()
+    events = []
+    for rec in _records:
+        events.append({
+            'name': rec['name'],
+            'cat': rec['category'],
+            'ph': 'X',
+            'ts': rec['start'] * 1e6,
+            'dur': rec['wall'] * 1e6,
+            'pid': pid,
+            'tid': 0,
+            'args': {
+                'cpu_ms': round(rec['cpu'] * 1000, 3),
+                'peak_rss_mb': round(rec['peak_rss_mb'], 2),
+                'peak_rss_growth_mb': round(rec['peak_rss_growth_mb'], 2),
+                'alloc_delta_mb': round(rec['alloc_delta_mb'], 3),
+                'alloc_peak_mb': round(rec['alloc_peak_mb'], 3),
+            },
+        })
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                   'otherData': {'command': ' '.join(sys.argv)}}, f)
+
+def summary_table():
+    """Aggregate the recorded stages by (category, name) into a printable table"""
+    totals = {}
+    for rec in _records:
+        key = (rec['category'], rec['name'])
+        row = totals.setdefault(key, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'alloc_delta_mb': 0.0,
+                                      'alloc_peak_mb': 0.0, 'peak_rss_mb': 0.0})
+        row['calls'] += 1
+        row['wall'] += rec['wall']
+        row['cpu'] += rec['cpu']
+        row['alloc_delta_mb'] += rec['alloc_delta_mb']
+        row['alloc_peak_mb'] = max(row['alloc_peak_mb'], rec['alloc_peak_mb'])
+        row['peak_rss_mb'] = max(row['peak_rss_mb'], rec['peak_rss_mb'])
+
+    lines = [f"{'Category':<10} {'Stage':<40} {'Calls':>5} {'Wall (s)':>9} {'CPU (s)':>8} "
+             f"{'Alloc Δ (MB)':>12} {'Alloc peak (MB)':>15} {'Peak RSS (MB)':>13}",
+             "-" * 120]
+    for (category, name), row in sorted(totals.items(), key=lambda kv: -kv[1]['wall']):
+        lines.append(f"{category:<10} {name[:40]:<40} {row['calls']:>5} {row['wall']:>9.3f} "
+                     f"{row['cpu']:>8.3f} {row['alloc_delta_mb']:>12.2f} "
+                     f"{row['alloc_peak_mb']:>15.2f} {row['peak_rss_mb']:>13.1f}")
+    return "\n".join(lines)
+
+def _report_at_exit():
+    """Write the trace file and print the summary table"""
+    if not _records:
+        return
+    write_trace(_trace_path)
+    print("\n===== STAGE PROFILE =====")
+    print(summary_table())
+    print(f"\nTrace written to {_trace_path}")
+
+# Profiling can be switched on for any script without code changes
+if os.environ.get("DATAFEST_PROFILE"):
+    _env_path = os.environ["DATAFEST_PROFILE"]
+    enable(None if _env_path in ("1", "true", "yes") else _env_path)
@@ -0,0 +1,107 @@
+# loaders.py
+#
+# One loader per dataset, all reading through the engine in engine.py so the
+# analyses can run on either the pandas or the Arrow-backed engine.
+import os
+import engine
+from engine import groupby_agg, frames_equal
+from instrumentation import stage
+
+data_dir = "data"
+
+DATASETS = {
+    'leases': "Leases.csv",
+    'price_availability': "Price and Availability Data.csv",
+    'cleaned_pad': "Cleaned PAD.csv",
+    'occupancy': "Major Market Occupancy Data.csv",
+    'unemployment': "Unemployment.csv",
+    'inflation': "Inflation Q over Q 2019-2024.csv",
+    'address_info': "address_info.csv",
+    'market_locations': "market_locations.csv",
+    'county_latlng': os.path.join("irs", "us_county_latlng.csv"),
+    'building_counties': "building_counties.csv",
+}
+
+def dataset_path(name):
+    """Path of a dataset by its short name"""
+    return os.path.join(data_dir, DATASETS[name])
+
+def source_signature(path):
+    """(size, mtime) of a file, used to notice when a derived file is out of date"""
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def load_dataset(name, engine_name=None, **kwargs):
+    """Read a dataset by its short name with the selected engine
+
+    With read jobs above 1 (parallel_csv.set_jobs), large files are parsed in
+    byte ranges by that many processes.
+    """
+    import parallel_csv
+
+    with stage(f"read {DATASETS[name]}", "load"):
+        if parallel_csv.use_parallel(dataset_path(name), kwargs):
+            usecols = kwargs.pop('usecols', None)
+            return parallel_csv.read_csv_parallel(dataset_path(name), usecols, engine_name=engine_name, **kwargs)
+        return engine.read_csv(dataset_path(name), engine=engine_name, **kwargs)
+
+def load_leases(usecols=None, engine_name=None, **kwargs):
+    return load_dataset('leases', engine_name, usecols=usecols, **kwargs)
+
+def load_price_availability(engine_name=None, **kwargs):
+    return load_dataset('price_availability', engine_name, **kwargs)
+
+def load_cleaned_pad(engine_name=None, **kwargs):
+    return load_dataset('cleaned_pad', engine_name, **kwargs)
+
+def load_occupancy(engine_name=None, **kwargs):
+    return load_dataset('occupancy', engine_name, **kwargs)
+
+def load_unemployment(engine_name=None, **kwargs):
+    return load_dataset('unemployment', engine_name, **kwargs)
+
+def load_inflation(engine_name=None, **kwargs):
+    return load_dataset('inflation', engine_name, **kwargs)
+
+def load_market_locations(engine_name=None, **kwargs):
+    """Market coordinates keyed by the plain lease market name"""
+    market_locations = load_dataset('market_locations', engine_name, index_col=0, **kwargs)
+    market_locations['market'] = market_locations['market'].str.replace(', United States', '', regex=False)
+    return market_locations
+
+# Aggregations used to check that both engines give the same answers
+PARITY_AGGREGATIONS = [
+    ('price_availability', ['year', 'quarter'], {'leasing': 'sum', 'available_space': 'sum', 'RBA': 'sum'}),
+    ('price_availability', 'market', {'internal_class_rent': ['mean', 'std'], 'leasing': ['sum', 'mean']}),
+    ('price_availability', ['market', 'internal_class'], {'direct_internal_class_rent': ['mean', 'count']}),
+    ('unemployment', ['year', 'quarter', 'state'], {'unemployment_rate': 'mean'}),
+    ('occupancy', 'market', {'occupancy_proportion': ['min', 'max', 'mean']}),
+    ('cleaned_pad', ['market', 'is_premium_quality'], {'sublet_available_space': 'sum', 'year': 'nunique'}),
+]
+
+def compare_engines(datasets=None):
+    """Load each dataset and run the parity aggregations with both engines; returns mismatches"""
+    if not engine.arrow_available():
+        print("pyarrow is not installed; only the pandas engine is available")
+        return []
+
+    names = datasets or [name for name in DATASETS if os.path.exists(dataset_path(name))]
+    mismatches = []
+    for name in names:
+        same, message = frames_equal(load_dataset(name, 'pandas'), load_dataset(name, 'arrow'))
+        print(f"{'OK  ' if same else 'DIFF'} load {DATASETS[name]}")
+        if not same:
+            mismatches.append((name, message))
+
+    for name, by, agg in PARITY_AGGREGATIONS:
+        if name not in names:
+            continue
+        results = [groupby_agg(load_dataset(name, e), by, agg, engine=e) for e in engine.ENGINES]
+        same, message = frames_equal(*results)
+        print(f"{'OK  ' if same else 'DIFF'} {DATASETS[name]} by {by}: {agg}")
+        if not same:
+            mismatches.append((f"{name} by {by}", message))
+
+    for label, message in mismatches:
+        print(f"\n{label}:\n{message}")
+    return mismatches
@@ -1,43 +1,40 @@
 # market_analysis.py
 import pandas as pd
 import numpy as np
-import os
 from datetime import datetime
+from instrumentation import stage, instrument
+from engine import groupby_agg
+from loaders import load_price_availability
+from anomalies import detect_anomalies
+from pad_cube import load_cube
 
-data_dir = "data"
-
+@instrument("analysis")
 def analyze_top_markets():
     """Analyze trends in the top markets"""
     print("\n===== TOP MARKET ANALYSIS =====")
     
-    # Load price and availability data
-    filepath = os.path.join(data_dir, "Price and Availability Data.csv")
-    df = pd.read_csv(filepath)
+    # Totals and space-weighted averages come from the PAD cube
+    cube = load_cube('price_availability')
     
     # Identify top markets by total RBA
-    top_markets_by_size = df.groupby('market')['RBA'].sum().sort_values(ascending=False).head(10)
+    market_totals = cube.rollup('market').set_index('market')
+    top_markets_by_size = market_totals['RBA'].sort_values(ascending=False).head(10)
+    top_markets_by_leasing = market_totals['leasing'].sort_values(ascending=False).head(10)
     print("Top 10 markets by size (total RBA):")
     for market, rba in top_markets_by_size.items():
-        print(f"- {market}: {rba:,} sq ft")
+        print(f"- {market}: {rba:,.0f} sq ft")
     
     # Identify top markets by leasing activity
-    top_markets_by_leasing = df.groupby('market')['leasing'].sum().sort_values(ascending=False).head(10)
     print("\nTop 10 markets by leasing activity:")
     for market, leasing in top_markets_by_leasing.items():
-        print(f"- {market}: {leasing:,} sq ft")
+        print(f"- {market}: {leasing:,.0f} sq ft")
     
     # Compare rent and availability in top 5 markets
     top_5_markets = top_markets_by_size.index[:5]
     
-    # Get data for only the top 5 markets
-    top_markets_df = df[df['market'].isin(top_5_markets)]
-    
-    # Analyze these markets over time
-    market_trends = top_markets_df.groupby(['market', 'year']).agg({
-        'internal_class_rent': 'mean',
-        'availability_proportion': 'mean',
-        'leasing': 'sum'
-    }).reset_index()
+    # Analyze these markets over time: rent weighted by available space,
+    # availability as available space over RBA
+    market_trends = cube.rollup(['market', 'year'], where={'market': list(top_5_markets)})
     
     print("\nTrends in top 5 markets:")
     for market in top_5_markets:
@@ -48,67 +45,69 @@ def analyze_top_markets():
         for _, row in market_data.iterrows():
             print(f"{row['year']}  | ${row['internal_class_rent']:.2f}    | {row['availability_proportion']:.1%}         | {row['leasing']/1000000:.1f}")
 
+@instrument("analysis")
 def analyze_covid_recovery():
     """Analyze COVID recovery patterns across markets"""
     print("\n===== COVID RECOVERY ANALYSIS =====")
     
     # Load price and availability data
-    filepath = os.path.join(data_dir, "Price and Availability Data.csv")
-    df = pd.read_csv(filepath)
+    df = load_price_availability()
     
     # Define periods
-    pre_covid = df[(df['year'] == 2019) & (df['quarter'] == 'Q4')].copy()
-    during_covid = df[(df['year'] == 2020) & (df['quarter'] == 'Q2')].copy()
-    recent = df[(df['year'] == 2023) & (df['quarter'] == 'Q4')].copy()
+    with stage("select COVID periods", "transform"):
+        pre_covid = df[(df['year'] == 2019) & (df['quarter'] == 'Q4')].copy()
+        during_covid = df[(df['year'] == 2020) & (df['quarter'] == 'Q2')].copy()
+        recent = df[(df['year'] == 2023) & (df['quarter'] == 'Q4')].copy()
     
-    # Calculate metrics for each period
-    pre_covid['period'] = 'Pre-COVID'
-    during_covid['period'] = 'During COVID'
-    recent['period'] = 'Recent'
+        # Calculate metrics for each period
+        pre_covid['period'] = 'Pre-COVID'
+        during_covid['period'] = 'During COVID'
+        recent['period'] = 'Recent'
     
-    # Combine periods
-    periods_df = pd.concat([pre_covid, during_covid, recent])
+        # Combine periods
+        periods_df = pd.concat([pre_covid, during_covid, recent])
     
     # Calculate market-level metrics
-    market_recovery = periods_df.groupby(['market', 'period']).agg({
-        'leasing': 'sum',
-        'internal_class_rent': 'mean',
-        'availability_proportion': 'mean'
-    }).reset_index()
+    with stage("recovery metrics by market", "aggregate"):
+        market_recovery = groupby_agg(periods_df, ['market', 'period'], {
+            'leasing': 'sum',
+            'internal_class_rent': 'mean',
+            'availability_proportion': 'mean'
+        })
     
-    # Calculate recovery percentages
-    recovery_metrics = []
+        # Calculate recovery percentages
+        recovery_metrics = []
     
-    # Get unique markets
-    markets = market_recovery['market'].unique()
+        # Get unique markets
+        markets = market_recovery['market'].unique()
     
-    for market in markets:
-        market_data = market_recovery[market_recovery['market'] == market]
+        for market in markets:
+            market_data = market_recovery[market_recovery['market'] == market]
         
-        # Check if we have data for all periods
-        if len(market_data) == 3:
-            pre = market_data[market_data['period'] == 'Pre-COVID'].iloc[0]
-            during = market_data[market_data['period'] == 'During COVID'].iloc[0]
-            recent = market_data[market_data['period'] == 'Recent'].iloc[0]
+            # Check if we have data for all periods
+            if len(market_data) == 3:
+                pre = market_data[market_data['period'] == 'Pre-COVID'].iloc[0]
+                during = market_data[market_data['period'] == 'During COVID'].iloc[0]
+                recent = market_data[market_data['period'] == 'Recent'].iloc[0]
             
-            # Calculate recovery metrics
-            leasing_drop = (during['leasing'] - pre['leasing']) / pre['leasing'] if pre['leasing'] > 0 else 0
-            leasing_recovery = (recent['leasing'] - during['leasing']) / during['leasing'] if during['leasing'] > 0 else 0
-            availability_increase = (during['availability_proportion'] - pre['availability_proportion'])
-            recent_availability_change = (recent['availability_proportion'] - during['availability_proportion'])
+                # Calculate recovery metrics
+                leasing_drop = (during['leasing'] - pre['leasing']) / pre['leasing'] if pre['leasing'] > 0 else 0
+                leasing_recovery = (recent['leasing'] - during['leasing']) / during['leasing'] if during['leasing'] > 0 else 0
+                availability_increase = (during['availability_proportion'] - pre['availability_proportion'])
+                recent_availability_change = (recent['availability_proportion'] - during['availability_proportion'])
             
-            recovery_metrics.append({
-                'market': market,
-                'leasing_drop': leasing_drop,
-                'leasing_recovery': leasing_recovery,
-                'availability_increase': availability_increase,
-                'recent_availability_change': recent_availability_change,
-                'pre_covid_rent': pre['internal_class_rent'],
-                'recent_rent': recent['internal_class_rent'],
-                'rent_growth': (recent['internal_class_rent'] - pre['internal_class_rent']) / pre['internal_class_rent']
-            })
-    
-    recovery_df = pd.DataFrame(recovery_metrics)
+                recovery_metrics.append({
+                    'market': market,
+                    'leasing_drop': leasing_drop,
+                    'leasing_recovery': leasing_recovery,
+                    'availability_increase': availability_increase,
+                    'recent_availability_change': recent_availability_change,
+                    'pre_covid_rent': pre['internal_class_rent'],
+                    'recent_rent': recent['internal_class_rent'],
+                    'rent_growth': (recent['internal_class_rent'] - pre['internal_class_rent']) / pre['internal_class_rent']
+                })
+    
+        recovery_df = pd.DataFrame(recovery_metrics)
     
     # Sort by recovery strength
     recovery_df_sorted = recovery_df.sort_values('leasing_recovery', ascending=False)
@@ -132,57 +131,58 @@ def analyze_covid_recovery():
         print(f"   - Availability change since COVID: {row['recent_availability_change']:.1%}")
         print(f"   - Rent growth since pre-COVID: {row['rent_growth']:.1%}")
 
+@instrument("analysis")
 def find_anomalies():
     """Find markets with unusual patterns or outliers"""
     print("\n===== MARKET ANOMALIES =====")
     
     # Load price and availability data
-    filepath = os.path.join(data_dir, "Price and Availability Data.csv")
-    df = pd.read_csv(filepath)
+    df = load_price_availability()
     
     # Aggregate to market level
-    market_metrics = df.groupby('market').agg({
-        'internal_class_rent': ['mean', 'std'],
-        'availability_proportion': ['mean', 'std'],
-        'leasing': ['sum', 'mean', 'std']
-    })
+    with stage("market variability metrics", "aggregate"):
+        market_metrics = groupby_agg(df, 'market', {
+            'internal_class_rent': ['mean', 'std'],
+            'availability_proportion': ['mean', 'std'],
+            'leasing': ['sum', 'mean', 'std']
+        })
     
-    # Flatten column names
-    market_metrics.columns = ['_'.join(col).strip() for col in market_metrics.columns.values]
-    market_metrics = market_metrics.reset_index()
+        # Flatten column names
+        market_metrics.columns = ['_'.join(col).strip('_') for col in market_metrics.columns.values]
     
-    # Calculate coefficient of variation for key metrics
-    market_metrics['rent_cv'] = market_metrics['internal_class_rent_std'] / market_metrics['internal_class_rent_mean']
-    market_metrics['availability_cv'] = market_metrics['availability_proportion_std'] / market_metrics['availability_proportion_mean']
-    market_metrics['leasing_cv'] = market_metrics['leasing_std'] / market_metrics['leasing_mean']
+        # Calculate coefficient of variation for key metrics
+        market_metrics['rent_cv'] = market_metrics['internal_class_rent_std'] / market_metrics['internal_class_rent_mean']
+        market_metrics['availability_cv'] = market_metrics['availability_proportion_std'] / market_metrics['availability_proportion_mean']
+        market_metrics['leasing_cv'] = market_metrics['leasing_std'] / market_metrics['leasing_mean']
     
     # Find markets with highest variability
     print("Markets with highest rent variability:")
-    for market, cv in market_metrics.sort_values('rent_cv', ascending=False)['market'].head(5).items():
-        print(f"- {cv}")
+    for _, row in market_metrics.sort_values('rent_cv', ascending=False).head(5).iterrows():
+        print(f"- {row['market']}: {row['rent_cv']:.3f}")
     
     print("\nMarkets with highest availability variability:")
-    for market, cv in market_metrics.sort_values('availability_cv', ascending=False)['market'].head(5).items():
-        print(f"- {cv}")
+    for _, row in market_metrics.sort_values('availability_cv', ascending=False).head(5).iterrows():
+        print(f"- {row['market']}: {row['availability_cv']:.3f}")
     
     print("\nMarkets with highest leasing variability:")
-    for market, cv in market_metrics.sort_values('leasing_cv', ascending=False)['market'].head(5).items():
-        print(f"- {cv}")
+    for _, row in market_metrics.sort_values('leasing_cv', ascending=False).head(5).iterrows():
+        print(f"- {row['market']}: {row['leasing_cv']:.3f}")
     
     # Look for markets with unusual relationships between metrics
     # Calculate correlations between rent and availability for each market
-    correlations = []
+    with stage("rent-availability correlations", "aggregate"):
+        correlations = []
     
-    for market in df['market'].unique():
-        market_data = df[df['market'] == market]
-        if len(market_data) >= 8:  # Ensure we have enough data points
-            corr = market_data['internal_class_rent'].corr(market_data['availability_proportion'])
-            correlations.append({
-                'market': market,
-                'rent_availability_correlation': corr
-            })
+        for market in df['market'].unique():
+            market_data = df[df['market'] == market]
+            if len(market_data) >= 8:  # Ensure we have enough data points
+                corr = market_data['internal_class_rent'].corr(market_data['availability_proportion'])
+                correlations.append({
+                    'market': market,
+                    'rent_availability_correlation': corr
+                })
     
-    corr_df = pd.DataFrame(correlations)
+        corr_df = pd.DataFrame(correlations)
     
     print("\nMarkets with strongest positive correlation between rent and availability:")
     for i, (_, row) in enumerate(corr_df.sort_values('rent_availability_correlation', ascending=False).head(5).iterrows()):
@@ -192,7 +192,16 @@ def find_anomalies():
     for i, (_, row) in enumerate(corr_df.sort_values('rent_availability_correlation').head(5).iterrows()):
         print(f"{i+1}. {row['market']}: {row['rent_availability_correlation']:.2f}")
 
-if __name__ == "__main__":
+    # Individual quarters that break from each series' own history
+    with stage("detect anomalous quarters", "transform"):
+        flagged = detect_anomalies(df)
+
+    print(f"\nMost unusual quarters ({len(flagged)} flagged across all market series):")
+    for _, row in flagged.head(10).iterrows():
+        print(f"- {row['market']} class {row['internal_class']} {row['metric']}, {row['year']} {row['quarter']}: "
+              f"{row['value']:,.3f} vs {row['expected']:,.3f} expected (score {row['score']:.1f}, {row['method']})")
+
+def main():
     print(f"Starting market analysis at {datetime.now()}")
     try:
         analyze_top_markets()
@@ -209,4 +218,7 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Error in anomalies analysis: {e}")
     
-    print(f"\nCompleted analysis at {datetime.now()}")
\ No newline at end of file
+    print(f"\nCompleted analysis at {datetime.now()}")
+
+if __name__ == "__main__":
+    main()
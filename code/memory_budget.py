@@ -0,0 +1,230 @@
+# memory_budget.py
+#
+# Runs an analysis over a whole dataset either in memory or in chunks, depending
+# on how big the loaded frame would be:
+#
+#     DATAFEST_MEMORY_BUDGET=2GB python code/cli.py analyze quality --full
+#     totals = grouped('leases', ['market', 'year'], {'leasedSF': 'sum'})
+#     profile = map_reduce('leases', partial, combine, usecols=[...])
+#
+# The in-memory size is estimated from the file catalog (catalog.py) without
+# reading the file: rows x the bytes per row of the selected columns, where a
+# numeric column costs 8 bytes and a string column a Python str object plus its
+# share of the text. If PEAK_FACTOR times that fits the budget the file is read
+# whole; otherwise it is read in chunks sized to fit.
+#
+# Either way the analysis is the same pair of functions: partial(frame) returns
+# something small and combinable, combine(partials) merges them. In memory there
+# is one partial of the whole frame, so the result doesn't depend on the plan.
+# grouped() does this for groupby_agg-style aggregations: per chunk it keeps
+# sums, counts, min/max and (count, mean, M2) for std/var, and merges the M2
+# terms with Chan's parallel formula, so chunked means and standard deviations
+# equal the in-memory ones up to floating point rounding.
+#
+# The budget comes from set_budget(), the --memory-budget CLI option or
+# DATAFEST_MEMORY_BUDGET ("512MB", "2GB", or bytes); the default is half of the
+# machine's physical memory.
+#
+# With parallel CSV parsing on (parallel_csv.py, --read-jobs) a file over the
+# budget is split into byte ranges instead of row chunks, enough of them that
+# one range per worker fits the budget at once, and map_reduce() runs partial in
+# the workers so only the partial results come back.
+import os
+import re
+import functools
+import numpy as np
+import pandas as pd
+import loaders
+import engine
+import parallel_csv
+from engine import groupby_agg
+from catalog import describe_file
+from instrumentation import stage
+
+# Parsing a chunk and grouping it needs more than the finished frame
+PEAK_FACTOR = 3
+# Python str object header plus the pointer to it in the column
+STRING_OVERHEAD = 57
+MIN_CHUNK_ROWS = 10_000
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+# Aggregations grouped() can split into chunks, and what each chunk keeps for them
+_PARTIALS = {'sum': ['sum'], 'count': ['count'], 'min': ['min'], 'max': ['max'],
+             'mean': ['sum', 'count'], 'std': ['count', 'mean', 'm2'], 'var': ['count', 'mean', 'm2']}
+
+def parse_size(size):
+    """Bytes from 2GB, 512MB, 1.5 GB or a plain number"""
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)B?\s*", str(size).upper())
+    if not match:
+        raise ValueError(f"memory budget must look like 512MB or 2GB, not {size!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+def physical_memory():
+    """Installed memory in bytes (None where sysconf can't tell)"""
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def _default_budget():
+    if os.environ.get("DATAFEST_MEMORY_BUDGET"):
+        return parse_size(os.environ["DATAFEST_MEMORY_BUDGET"])
+    memory = physical_memory()
+    return memory // 2 if memory else 4 * _UNITS['G']
+
+_budget = _default_budget()
+
+def set_budget(size):
+    """Set the memory budget (bytes or a size like 2GB)"""
+    global _budget
+    _budget = parse_size(size)
+
+def get_budget():
+    """Memory budget in bytes"""
+    return _budget
+
+def estimate_bytes(path, usecols=None):
+    """Estimated size of the loaded frame, from the catalog entry of the file"""
+    entry = describe_file(path)
+    columns = usecols or entry['columns']
+    # Average text per field on disk, a stand-in for the length of a string value
+    text_per_field = entry['size'] / max(entry['rows'], 1) / max(len(entry['columns']), 1)
+    row_bytes = 0
+    for column in columns:
+        dtype = entry['dtypes'].get(column, 'object')
+        if dtype in ('object', 'str', 'string'):
+            row_bytes += STRING_OVERHEAD + text_per_field
+        elif dtype == 'bool':
+            row_bytes += 1
+        else:
+            row_bytes += 8
+    return int(entry['rows'] * row_bytes), entry['rows']
+
+def plan(path, usecols=None, budget=None):
+    """Rows per chunk for reading a file within the budget, or None to read it whole"""
+    budget = budget or _budget
+    estimate, rows = estimate_bytes(path, usecols)
+    if estimate * PEAK_FACTOR <= budget:
+        return None
+    row_bytes = estimate / max(rows, 1)
+    return max(int(budget / (row_bytes * PEAK_FACTOR)), MIN_CHUNK_ROWS)
+
+def range_parts(path, usecols=None, budget=None):
+    """Byte ranges to parse a file in with parallel_csv, so that every worker's range fits the budget together"""
+    budget = budget or _budget
+    jobs = parallel_csv.get_jobs()
+    estimate, _ = estimate_bytes(path, usecols)
+    return max(jobs, int(np.ceil(estimate * PEAK_FACTOR * jobs / budget)))
+
+def read_frames(dataset, usecols=None, **kwargs):
+    """The dataset as one frame if it fits the budget, otherwise as chunks that do
+
+    With read jobs above 1 the chunks are byte ranges parsed in worker processes.
+    """
+    path = loaders.dataset_path(dataset)
+    chunk_rows = plan(path, usecols)
+    if chunk_rows is None:
+        yield loaders.load_dataset(dataset, usecols=usecols, **kwargs)
+        return
+    print(f"{os.path.basename(path)} is over the {_budget / _UNITS['M']:,.0f} MB memory budget; "
+          f"reading {chunk_rows:,} rows at a time")
+    if parallel_csv.use_parallel(path, kwargs):
+        with stage(f"read {os.path.basename(path)} in byte ranges", "load"):
+            yield from parallel_csv.map_ranges(path, usecols=usecols, parts=range_parts(path, usecols), **kwargs)
+        return
+    with stage(f"read {os.path.basename(path)} in chunks", "load"):
+        for chunk in engine.read_csv(path, usecols=usecols, chunksize=chunk_rows, **kwargs):
+            yield chunk
+
+def map_reduce(dataset, partial, combine, usecols=None, **kwargs):
+    """combine([partial(frame), ...]) over the dataset, whole or in chunks
+
+    With read jobs above 1 and a file over MIN_PARALLEL_BYTES, partial runs in
+    the worker processes next to the parsing, so it has to be picklable.
+    """
+    path = loaders.dataset_path(dataset)
+    if parallel_csv.use_parallel(path, kwargs):
+        parts = range_parts(path, usecols)
+        with stage(f"partial aggregates of {parts} byte ranges", "aggregate"):
+            partials = list(parallel_csv.map_ranges(path, partial, usecols, parts=parts, **kwargs))
+    else:
+        partials = []
+        for frame in read_frames(dataset, usecols, **kwargs):
+            with stage("partial aggregate", "aggregate"):
+                partials.append(partial(frame))
+    with stage("combine partial aggregates", "aggregate"):
+        return combine(partials)
+
+def _as_list(cols):
+    return [cols] if isinstance(cols, str) else list(cols)
+
+def _partial_groupby(frame, by, pairs):
+    """The partial statistics each aggregation needs, per group of one chunk"""
+    groups = engine.to_numpy_backed(frame).groupby(by, sort=True)
+    needed = {}
+    for col, func in pairs:
+        for statistic in _PARTIALS[func]:
+            needed.setdefault(statistic, []).append(col)
+    parts = {}
+    for statistic, columns in needed.items():
+        columns = list(dict.fromkeys(columns))
+        if statistic == 'm2':
+            parts[statistic] = groups[columns].var(ddof=0) * groups[columns].count()
+        elif statistic == 'sum':
+            parts[statistic] = groups[columns].sum(min_count=0)
+        else:
+            parts[statistic] = getattr(groups[columns], statistic)()
+    return pd.concat(parts, axis=1)
+
+def _combine_groupby(partials, by, pairs):
+    """Merge per-chunk partials into the final aggregations"""
+    stats = pd.concat(partials)
+    level = list(range(len(by)))
+
+    def per_group(values, how='sum'):
+        return getattr(values.groupby(level=level, sort=True), how)()
+
+    result = {}
+    for col, func in pairs:
+        if func in ('sum', 'count', 'min', 'max'):
+            result[(col, func)] = per_group(stats[(func, col)], func if func in ('min', 'max') else 'sum')
+        elif func == 'mean':
+            count = per_group(stats[('count', col)])
+            result[(col, func)] = per_group(stats[('sum', col)]) / count.where(count > 0)
+        else:
+            count = stats[('count', col)]
+            n = per_group(count)
+            mean = per_group(count * stats[('mean', col)].fillna(0)) / n.where(n > 0)
+            # Chan et al.: M2 = sum(M2_i + n_i * (mean_i - mean)^2)
+            spread = (stats[('mean', col)] - mean.reindex(stats.index)) ** 2 * count
+            variance = per_group(stats[('m2', col)].fillna(0) + spread.fillna(0)) / (n - 1).where(n > 1)
+            result[(col, func)] = np.sqrt(variance) if func == 'std' else variance
+    return pd.DataFrame(result)
+
+def grouped(dataset, by, agg, usecols=None, **kwargs):
+    """groupby_agg(dataset, by, agg) within the memory budget
+
+    agg supports sum, count, min, max, mean, std and var, and the result has
+    groupby_agg's layout. A dataset that fits is grouped in one pass by
+    groupby_agg itself.
+    """
+    by = _as_list(by)
+    pairs = [(col, func) for col, funcs in agg.items() for func in _as_list(funcs)]
+    unsupported = sorted({func for _, func in pairs if func not in _PARTIALS})
+    if unsupported:
+        raise ValueError(f"grouped() can't split {unsupported} into chunks; use {sorted(_PARTIALS)}")
+    usecols = usecols or list(dict.fromkeys(by + [col for col, _ in pairs]))
+
+    path = loaders.dataset_path(dataset)
+    if plan(path, usecols) is None:
+        return groupby_agg(loaders.load_dataset(dataset, usecols=usecols, **kwargs), by, agg)
+
+    result = map_reduce(dataset, functools.partial(_partial_groupby, by=by, pairs=pairs),
+                        functools.partial(_combine_groupby, by=by, pairs=pairs), usecols, **kwargs)
+    if all(isinstance(funcs, str) for funcs in agg.values()):
+        result.columns = [col for col, _ in pairs]
+    # With a list for any column the value columns stay (column, function) tuples
+    return result.reset_index()
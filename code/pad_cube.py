@@ -0,0 +1,238 @@
+# pad_cube.py
+#
+# A cube of additive PAD measures over (year, quarter, market, class), built once
+# and rolled up to any coarser view:
+#
+#     cube = load_cube('price_availability')
+#     cube.rollup('market')                                 # one row per market
+#     cube.rollup(['year', 'quarter'], where={'internal_class': 'A'})
+#     cube.rollup('year', relabel={'year': covid_period})   # merge labels first
+#
+# Each cell holds only things that add up: row counts, sums of space and leasing,
+# value x weight and weight sums for the rents, numerators and denominators for
+# the ratios. A rollup sums cells over the dimensions it drops (O(cells), the
+# cube is a dense NumPy array) and then derives
+#   sums      total RBA / space / leasing
+#   weighted  rents weighted by the space they're asked on, e.g.
+#             internal_class_rent = sum(rent x available_space) / sum(available_space)
+#   ratios    sum(numerator) / sum(denominator), e.g. availability_proportion =
+#             available space / RBA, so a national figure is space-weighted
+#   means     the plain average of the rows, as <column>_mean
+# Every pair is summed only over rows where both values are present, so the
+# quarters without direct/sublet figures don't dilute those columns. Rows missing
+# a dimension value have no cell; they are left out and their number printed.
+#
+# Cubes are cached in memory and in data/cubes/<dataset>.npz along with the
+# source file signature, and rebuilt when the CSV (or its entry in CUBES) changes.
+import os
+import json
+import numpy as np
+import pandas as pd
+import loaders
+from instrumentation import stage
+
+cache_dir = os.path.join(loaders.data_dir, "cubes")
+
+CUBES = {
+    'price_availability': {
+        'dims': ['year', 'quarter', 'market', 'internal_class'],
+        'sums': ['RBA', 'available_space', 'direct_available_space', 'sublet_available_space', 'leasing'],
+        'weighted': {'internal_class_rent': 'available_space',
+                     'direct_internal_class_rent': 'direct_available_space',
+                     'sublet_internal_class_rent': 'sublet_available_space'},
+        'ratios': {'availability_proportion': ('available_space', 'RBA'),
+                   'direct_availability_proportion': ('direct_available_space', 'RBA'),
+                   'sublet_availability_proportion': ('sublet_available_space', 'RBA'),
+                   'sublet_share': ('sublet_available_space', 'available_space'),
+                   'leasing_to_available_ratio': ('leasing', 'available_space'),
+                   'leasing_to_total_ratio': ('leasing', 'RBA')},
+        'means': ['internal_class_rent', 'availability_proportion', 'leasing'],
+    },
+    'cleaned_pad': {
+        'dims': ['year', 'quarter', 'market', 'is_premium_quality'],
+        'sums': ['total_space', 'available_space', 'direct_available_space', 'sublet_available_space', 'leasing'],
+        'weighted': {'internal_class_rent': 'available_space',
+                     'direct_internal_class_rent': 'direct_available_space',
+                     'sublet_internal_class_rent': 'sublet_available_space'},
+        'ratios': {'availability_proportion': ('available_space', 'total_space'),
+                   'direct_availability_proportion': ('direct_available_space', 'total_space'),
+                   'sublet_availability_proportion': ('sublet_available_space', 'total_space'),
+                   'sublet_share': ('sublet_available_space', 'available_space'),
+                   'leasing_to_available_ratio': ('leasing', 'available_space'),
+                   'leasing_to_total_ratio': ('leasing', 'total_space')},
+        'means': ['internal_class_rent', 'leasing'],
+    },
+}
+
+_memory = {}
+
+def _as_list(cols):
+    if cols is None:
+        return []
+    return [cols] if isinstance(cols, str) else list(cols)
+
+def _plain(value):
+    return value.item() if hasattr(value, 'item') else value
+
+def cell_measures(df, spec):
+    """Additive measures for each row: name -> float array (missing counts as zero)"""
+    def column(name):
+        return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=float)
+
+    def pair(a, b):
+        present = ~np.isnan(a) & ~np.isnan(b)
+        return np.where(present, a, 0.0), np.where(present, b, 0.0)
+
+    measures = {'rows': np.ones(len(df))}
+    for col in spec['sums']:
+        measures[col] = np.nan_to_num(column(col))
+    for col, weight in spec['weighted'].items():
+        value, weights = pair(column(col), column(weight))
+        measures[f"{col}_weighted_sum"], measures[f"{col}_weight"] = value * weights, weights
+    for name, (numerator, denominator) in spec['ratios'].items():
+        measures[f"{name}_numerator"], measures[f"{name}_denominator"] = pair(column(numerator), column(denominator))
+    for col in spec['means']:
+        values = column(col)
+        measures[f"{col}_sum"], measures[f"{col}_count"] = np.nan_to_num(values), (~np.isnan(values)).astype(float)
+    return measures
+
+class Cube:
+    """Dense array of additive measures, one axis per dimension plus one for the measures"""
+
+    def __init__(self, dataset, dims, labels, measures, values):
+        self.dataset = dataset
+        self.spec = CUBES[dataset]
+        self.dims = list(dims)
+        self.labels = [list(axis) for axis in labels]
+        self.measures = list(measures)
+        self.values = values
+
+    @property
+    def cells(self):
+        return int(np.prod(self.values.shape[:-1]))
+
+    def rollup(self, by=None, where=None, relabel=None):
+        """One row per combination of the by dimensions, with sums, weighted means and ratios
+
+        where keeps only some labels of a dimension ({'year': [2020, 2021]});
+        relabel maps a dimension's labels through a function before grouping,
+        merging the cells that get the same new label.
+        """
+        by = _as_list(by)
+        unknown = set(by) | set(where or {}) | set(relabel or {})
+        unknown -= set(self.dims)
+        if unknown:
+            raise ValueError(f"{self.dataset} cube has dimensions {self.dims}, not {sorted(unknown)}")
+        values, labels = self.values, list(self.labels)
+
+        for dim, wanted in (where or {}).items():
+            axis = self.dims.index(dim)
+            wanted = set(wanted) if isinstance(wanted, (list, tuple, set)) else {wanted}
+            keep = [i for i, label in enumerate(labels[axis]) if label in wanted]
+            values = np.take(values, keep, axis=axis)
+            labels[axis] = [labels[axis][i] for i in keep]
+
+        for dim, mapping in (relabel or {}).items():
+            axis = self.dims.index(dim)
+            codes, uniques = pd.factorize(pd.Series([mapping(label) for label in labels[axis]], dtype=object))
+            # Summing cells into their new labels is a product with a 0/1 matrix
+            merge = np.zeros((len(uniques), len(codes)))
+            merge[codes, np.arange(len(codes))] = 1
+            values = np.moveaxis(np.tensordot(merge, np.moveaxis(values, axis, 0), axes=1), 0, axis)
+            labels[axis] = list(uniques)
+
+        kept = sorted(self.dims.index(dim) for dim in by)
+        dropped = tuple(axis for axis in range(len(self.dims)) if axis not in kept)
+        with stage(f"roll up {self.dataset} cube to {', '.join(by) or 'total'}", "aggregate"):
+            totals = values.sum(axis=dropped)
+            order = [kept.index(self.dims.index(dim)) for dim in by]
+            totals = totals.transpose(order + [len(kept)]).reshape(-1, len(self.measures))
+
+        table = pd.DataFrame(totals, columns=self.measures)
+        if by:
+            grid = pd.MultiIndex.from_product([labels[self.dims.index(dim)] for dim in by], names=by)
+            table = pd.concat([grid.to_frame(index=False), table], axis=1)
+        table = table[table['rows'] > 0].reset_index(drop=True)
+        return finalize(table, self.spec, by)
+
+def finalize(table, spec, by):
+    """Turn summed measures into the reported columns"""
+    def divide(numerator, denominator):
+        return table[numerator] / table[denominator].where(table[denominator] > 0)
+
+    result = table[by].copy()
+    result['rows'] = table['rows'].astype(int)
+    for col in spec['sums']:
+        # Square footage sums stay whole numbers
+        whole = np.array_equal(table[col], np.round(table[col]))
+        result[col] = table[col].astype('int64') if whole else table[col]
+    for col in spec['weighted']:
+        result[col] = divide(f"{col}_weighted_sum", f"{col}_weight")
+    for name in spec['ratios']:
+        result[name] = divide(f"{name}_numerator", f"{name}_denominator")
+    for col in spec['means']:
+        result[f"{col}_mean"] = divide(f"{col}_sum", f"{col}_count")
+    return result
+
+def build_cube(dataset, df=None):
+    """Cube of one dataset (a short name in CUBES) from its CSV or a given frame"""
+    spec = CUBES[dataset]
+    if df is None:
+        df = loaders.load_dataset(dataset)
+    with stage(f"build {dataset} cube", "aggregate"):
+        codes, labels = [], []
+        for dim in spec['dims']:
+            code, uniques = pd.factorize(df[dim], sort=True)
+            codes.append(code)
+            labels.append([_plain(label) for label in uniques])
+        # Rows missing a dimension value (code -1) have no cell
+        complete = np.logical_and.reduce([code >= 0 for code in codes])
+        if not complete.all():
+            print(f"Left {int((~complete).sum()):,} {dataset} rows missing a {', '.join(spec['dims'])} value "
+                  f"out of the cube")
+            df = df[complete]
+            codes = [code[complete] for code in codes]
+        shape = tuple(len(axis) for axis in labels)
+        cell = np.ravel_multi_index(codes, shape)
+        measures = cell_measures(df, spec)
+        values = np.empty((int(np.prod(shape)), len(measures)))
+        for j, column in enumerate(measures.values()):
+            values[:, j] = np.bincount(cell, weights=column, minlength=values.shape[0])
+    return Cube(dataset, spec['dims'], labels, list(measures), values.reshape(shape + (len(measures),)))
+
+def _cache_path(dataset):
+    return os.path.join(cache_dir, f"{dataset}.npz")
+
+def save_cube(cube, signature):
+    os.makedirs(cache_dir, exist_ok=True)
+    meta = {'dims': cube.dims, 'labels': cube.labels, 'measures': cube.measures,
+            'signature': list(signature), 'spec': cube.spec}
+    with stage(f"write {cube.dataset} cube", "save"):
+        np.savez(_cache_path(cube.dataset), values=cube.values, meta=np.array(json.dumps(meta)))
+
+def load_cube(dataset='price_availability', refresh=False):
+    """The cube of a dataset, from memory, data/cubes/ or built fresh if the CSV changed"""
+    signature = list(loaders.source_signature(loaders.dataset_path(dataset)))
+    if not refresh and dataset in _memory and _memory[dataset][0] == signature:
+        return _memory[dataset][1]
+
+    cube = None
+    path = _cache_path(dataset)
+    if not refresh and os.path.exists(path):
+        with np.load(path) as stored:
+            meta = json.loads(str(stored['meta']))
+            if meta['signature'] == signature and meta['spec'] == json.loads(json.dumps(CUBES[dataset])):
+                cube = Cube(dataset, meta['dims'], meta['labels'], meta['measures'], stored['values'])
+    if cube is None:
+        cube = build_cube(dataset)
+        save_cube(cube, signature)
+
+    _memory[dataset] = (signature, cube)
+    return cube
+
+def clear_cache():
+    """Forget every cube, in memory and on disk"""
+    _memory.clear()
+    for dataset in CUBES:
+        if os.path.exists(_cache_path(dataset)):
+            os.remove(_cache_path(dataset))
@@ -0,0 +1,166 @@
+# parallel_csv.py
+#
+# Parses a large CSV on several cores by splitting it into byte ranges:
+#
+#     DATAFEST_READ_JOBS=8 python code/cli.py analyze quality --full
+#     python code/cli.py --read-jobs 8 bootstrap growth
+#     leases = read_csv_parallel("data/Leases.csv", usecols=['market', 'leasedSF'], jobs=8)
+#     partials = list(map_ranges("data/Leases.csv", partial, parts=32, jobs=8))
+#
+# The file is cut into `parts` roughly equal byte ranges, each moved forward to
+# the next record boundary: a newline preceded by an even number of quote
+# characters (the same rule catalog.scan_bytes counts records with), so a
+# quoted field with line breaks or "" escapes is never split. Finding the
+# boundaries is one buffered NumPy pass over the bytes; the parsing, which is
+# most of the time, happens in worker processes. Each worker reads its own range
+# from disk, puts the header line in front of it and parses it with
+# engine.read_csv, so every range gets the same columns and options. Columns the
+# catalog knows as text are read as str in every range; otherwise a range whose
+# values all look numeric would come back with a different dtype than the rest.
+#
+# read_csv_parallel() concatenates the ranges in file order, which gives the same
+# frame as one read_csv. map_ranges() instead runs partial(frame) in the worker
+# and yields only the (small) partial results, in file order, so a scan holds
+# `jobs` ranges in memory at a time instead of the whole file.
+#
+# loaders.load_dataset and memory_budget use this when the read jobs setting
+# (set_jobs(), --read-jobs or DATAFEST_READ_JOBS) is above 1 and the file is at
+# least MIN_PARALLEL_BYTES; the default of 1 keeps every read in-process.
+import io
+import os
+from collections import deque
+import numpy as np
+import pandas as pd
+import engine
+from concurrent.futures import ProcessPoolExecutor
+from catalog import describe_file, BLOCK_SIZE, NEWLINE, QUOTE
+from instrumentation import stage
+
+# Smaller files parse faster than a process pool starts
+MIN_PARALLEL_BYTES = 64 * 1024 * 1024
+
+# read_csv options that don't make sense per range
+UNSUPPORTED = {"nrows", "chunksize", "iterator", "skiprows", "skipfooter", "header", "names", "index_col"}
+
+def _default_jobs():
+    jobs = os.environ.get("DATAFEST_READ_JOBS")
+    return max(int(jobs), 1) if jobs else 1
+
+_jobs = _default_jobs()
+
+def set_jobs(jobs):
+    """Worker processes for parsing CSVs (1 reads in-process)"""
+    global _jobs
+    _jobs = max(int(jobs or os.cpu_count() or 1), 1)
+
+def get_jobs():
+    """Worker processes for parsing CSVs"""
+    return _jobs
+
+def use_parallel(path, kwargs=None):
+    """Whether loaders should read this file with read_csv_parallel"""
+    return (_jobs > 1 and not (UNSUPPORTED & set(kwargs or {}))
+            and os.path.getsize(path) >= MIN_PARALLEL_BYTES)
+
+def record_boundaries(path, parts, block_size=BLOCK_SIZE):
+    """Byte offsets of the first record after the header and of the records nearest each 1/parts of the file
+
+    Returns sorted offsets ending with the file size, so consecutive pairs are
+    the byte ranges (empty ranges are dropped).
+    """
+    size = os.path.getsize(path)
+    # Target 0 finds the end of the header record
+    targets = [size * i // parts for i in range(parts)]
+    boundaries = []
+    in_quotes = 0
+    offset = 0
+    with open(path, "rb", buffering=0) as f:
+        while len(boundaries) < len(targets):
+            block = f.read(block_size)
+            if not block:
+                break
+            data = np.frombuffer(block, dtype=np.uint8)
+            quotes = np.flatnonzero(data == QUOTE)
+            newlines = np.flatnonzero(data == NEWLINE)
+            # Newlines outside quoted fields end records
+            ends = newlines[(np.searchsorted(quotes, newlines) + in_quotes) % 2 == 0] + offset
+            while len(boundaries) < len(targets):
+                target = max(targets[len(boundaries)], boundaries[-1] if boundaries else 0)
+                position = np.searchsorted(ends, target)
+                if position == len(ends):
+                    break
+                boundaries.append(int(ends[position]) + 1)
+            in_quotes = (len(quotes) + in_quotes) % 2
+            offset += len(block)
+    boundaries = sorted(set(boundary for boundary in boundaries if boundary < size))
+    return boundaries + [size] if boundaries else [size, size]
+
+def schema(path, usecols=None, engine_name=None):
+    """dtype= option that keeps the catalog's text columns as strings in every range"""
+    entry = describe_file(path)
+    columns = usecols or entry['columns']
+    text = str
+    if (engine_name or engine.get_engine()) == "arrow":
+        import pyarrow as pa
+        text = pd.ArrowDtype(pa.string())
+    return {col: text for col in columns if entry['dtypes'].get(col) in ('object', 'str', 'string')}
+
+def read_range(path, header_end, start, end, engine_name=None, transform=None, kwargs=None):
+    """Parse the records in bytes [start, end) of a CSV, optionally passing the frame through transform"""
+    with open(path, "rb") as f:
+        header = f.read(header_end)
+        f.seek(start)
+        body = f.read(end - start)
+    frame = engine.read_csv(io.BytesIO(header + body), engine=engine_name, **(kwargs or {}))
+    return transform(frame) if transform is not None else frame
+
+def _options(path, usecols, engine_name, kwargs):
+    kwargs = dict(kwargs)
+    unsupported = UNSUPPORTED & kwargs.keys()
+    if unsupported:
+        raise ValueError(f"byte-range parsing doesn't support {sorted(unsupported)}")
+    if usecols is not None:
+        kwargs['usecols'] = usecols
+    # Explicit dtypes win over the catalog's
+    kwargs['dtype'] = {**schema(path, usecols, engine_name), **(kwargs.get('dtype') or {})}
+    return kwargs
+
+def _ranges(path, parts):
+    with stage(f"find record boundaries {os.path.basename(path)}", "load"):
+        boundaries = record_boundaries(path, parts)
+    return boundaries[0], list(zip(boundaries[:-1], boundaries[1:]))
+
+def map_ranges(path, transform=None, usecols=None, parts=None, jobs=None, engine_name=None, **kwargs):
+    """transform(frame) of every byte range of a CSV, yielded in file order
+
+    transform runs in the worker processes, so it must be picklable (a
+    module-level function or functools.partial of one). Without it the range
+    frames themselves are yielded.
+    """
+    jobs = jobs or _jobs
+    parts = parts or jobs
+    engine_name = engine_name or engine.get_engine()
+    kwargs = _options(path, usecols, engine_name, kwargs)
+    header_end, ranges = _ranges(path, parts)
+    arguments = [(path, header_end, start, end, engine_name, transform, kwargs) for start, end in ranges]
+    if jobs == 1 or len(ranges) == 1:
+        for args in arguments:
+            yield read_range(*args)
+        return
+    with ProcessPoolExecutor(max_workers=min(jobs, len(ranges))) as pool:
+        # Keep one range queued per worker, so results don't pile up ahead of the consumer
+        pending = deque()
+        for args in arguments:
+            pending.append(pool.submit(read_range, *args))
+            if len(pending) > jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def read_csv_parallel(path, usecols=None, jobs=None, engine_name=None, **kwargs):
+    """The whole CSV as one frame, its byte ranges parsed in jobs worker processes"""
+    jobs = jobs or _jobs
+    with stage(f"parse {os.path.basename(path)} in {jobs} processes", "load"):
+        frames = list(map_ranges(path, usecols=usecols, parts=jobs, jobs=jobs, engine_name=engine_name, **kwargs))
+    with stage("concatenate ranges", "load"):
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
@@ -0,0 +1,360 @@
+# pipeline.py
+#
+# The whole refresh as one task graph:
+#
+#     python code/cli.py pipeline                  # bring every output up to date
+#     python code/cli.py pipeline stacked_bars -j 4
+#     python code/cli.py pipeline --dry-run        # what would run, and why
+#
+# Each task in TASKS names the function that produces it and the files it reads
+# and writes. Dependencies come from those paths: a task that reads another
+# task's output runs after it. Independent tasks run in parallel worker
+# processes (-j), each with its output in data/pipeline/logs/<task>.log.
+#
+# A task's inputs are the files it reads plus its code: the module that defines
+# it and every module from code/ or visualizations/ that module imports, directly
+# or through other local modules (source_files()), so editing a chart script or
+# a loader it uses makes the task stale too.
+#
+# A task is skipped when the content hash of its inputs matches the last run and
+# its outputs are still the files it wrote. Otherwise, if an earlier run with
+# exactly these inputs was cached in data/pipeline/cache/, its outputs are copied
+# back instead of running it; only if neither applies does it run. So after an
+# edit only the tasks downstream of changed bytes do any work, and a task whose
+# rebuilt output is byte-identical stops the change from going further.
+#
+# Tasks whose source files aren't here (Leases.csv, the raw IRS countyoutflow
+# files) or that need an API key that isn't set keep their existing outputs.
+import os
+import sys
+import json
+import shutil
+import hashlib
+import contextlib
+import importlib
+import ast
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import loaders
+from instrumentation import stage, instrument
+
+pipeline_dir = os.path.join(loaders.data_dir, "pipeline")
+state_path = os.path.join(pipeline_dir, "state.json")
+cache_dir = os.path.join(pipeline_dir, "cache")
+log_dir = os.path.join(pipeline_dir, "logs")
+
+code_dir = os.path.dirname(os.path.abspath(__file__))
+visualizations_dir = os.path.join(code_dir, '..', 'visualizations')
+
+pngs = os.path.join("visualizations", "pngs")
+irs_dir = os.path.join(loaders.data_dir, "irs")
+IRS_YEARS = ["1819", "1920", "2021", "2122"]
+
+# name -> (module, function, kwargs) to run, the files it reads, the files or
+# directories it writes, and environment variables it needs
+TASKS = {
+    'address_info': {
+        'run': ('geocode', 'geocode_addresses', {}),
+        'inputs': [loaders.dataset_path('leases')],
+        'outputs': [loaders.dataset_path('address_info')],
+        'env': ['MAPBOX_API_KEY'],
+    },
+    'market_locations': {
+        'run': ('geocode', 'geocode_markets', {}),
+        'inputs': [loaders.dataset_path('leases')],
+        'outputs': [loaders.dataset_path('market_locations')],
+        'env': ['MAPBOX_API_KEY'],
+    },
+    'growth_rates': {
+        'run': ('geocode', 'build_growth_rates', {}),
+        'inputs': [loaders.dataset_path('leases'), loaders.dataset_path('market_locations')],
+        'outputs': [os.path.join(loaders.data_dir, "growth_rates.csv")],
+    },
+    'building_counties': {
+        'run': ('county_assignment', 'build_building_counties', {}),
+        'inputs': [loaders.dataset_path('address_info'), loaders.dataset_path('county_latlng')],
+        'outputs': [loaders.dataset_path('building_counties')],
+    },
+    'aggregates': {
+        'run': ('ingest', 'build_aggregates', {}),
+        'inputs': [loaders.dataset_path(name) for name in
+                   ['price_availability', 'cleaned_pad', 'occupancy', 'unemployment', 'inflation']],
+        'outputs': [os.path.join(loaders.data_dir, "aggregates")],
+    },
+    'stacked_bars': {
+        'run': ('space_utilization_bar_creator', 'main', {}),
+        'inputs': [loaders.dataset_path('cleaned_pad'), loaders.dataset_path('inflation')],
+        'outputs': [os.path.join(pngs, "stacked_bars")],
+    },
+    'adj_stacked_bars': {
+        'run': ('adj_space_utilization_bar_creator', 'main', {}),
+        'inputs': [loaders.dataset_path('cleaned_pad'), loaders.dataset_path('occupancy'),
+                   os.path.join(loaders.data_dir, "aggregates")],
+        'outputs': [os.path.join(pngs, "adj_stacked_bars")],
+    },
+    'relative_direct_rents': {
+        'run': ('relative_direct_rents', 'main', {}),
+        'inputs': [loaders.dataset_path('cleaned_pad'), os.path.join(loaders.data_dir, "aggregates")],
+        'outputs': [os.path.join(pngs, "relative_direct_rent_premium.png")],
+    },
+    'relative_sublet_rents': {
+        'run': ('relative_sublet_rents', 'main', {}),
+        'inputs': [loaders.dataset_path('cleaned_pad'), os.path.join(loaders.data_dir, "aggregates")],
+        'outputs': [os.path.join(pngs, "relative_sublet_rent_premium.png")],
+    },
+    'occupancy_chart': {
+        'run': ('occupancy_line_chart', 'main', {}),
+        'inputs': [loaders.dataset_path('occupancy')],
+        'outputs': [os.path.join(pngs, "city_occupancy_trend.png")],
+    },
+}
+
+for year in IRS_YEARS:
+    TASKS[f'irs_outflow_{year}'] = {
+        'run': ('population_flow', 'geocode_outflow', {'year': year}),
+        'inputs': [os.path.join(irs_dir, f"countyoutflow{year}.csv"), loaders.dataset_path('county_latlng')],
+        'outputs': [os.path.join(irs_dir, f"la_countyoutflow_geocoded_{year}.csv")],
+    }
+
+def _files(path):
+    """The files under a path (just the path itself for a file), sorted"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    return [path] if os.path.exists(path) else []
+
+def _file_hash(path, known):
+    """Content hash of a file, reusing known[path] while its size and mtime are unchanged"""
+    signature = list(loaders.source_signature(path))
+    entry = known.get(path)
+    if entry and entry[:2] == signature:
+        return entry[2]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    known[path] = signature + [digest.hexdigest()]
+    return known[path][2]
+
+def content_hash(paths, known, extra=None):
+    """One hash over the contents of files and directories (and their relative names)"""
+    digest = hashlib.blake2b(digest_size=16)
+    if extra is not None:
+        digest.update(json.dumps(extra, sort_keys=True).encode())
+    for path in paths:
+        for file_path in _files(path):
+            digest.update(os.path.relpath(file_path, path).encode())
+            digest.update(_file_hash(file_path, known).encode())
+    return digest.hexdigest()
+
+def _local_module(name):
+    """Source file of a module in code/ or visualizations/ (None for anything else)"""
+    for directory in (code_dir, visualizations_dir):
+        path = os.path.normpath(os.path.join(directory, f"{name}.py"))
+        if os.path.exists(path):
+            return path
+    return None
+
+def source_files(module_name):
+    """The module's source file and those of the local modules it imports, transitively, sorted"""
+    found, pending = set(), [module_name]
+    while pending:
+        path = _local_module(pending.pop())
+        if path is None or path in found:
+            continue
+        found.add(path)
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), path)
+        # Imports anywhere in the file count, including the ones inside functions
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                pending.append(node.module.split('.')[0])
+    return sorted(found)
+
+def producers(tasks=TASKS):
+    """output path -> task that writes it"""
+    return {output: name for name, task in tasks.items() for output in task['outputs']}
+
+def upstream(name, tasks=TASKS):
+    """Tasks whose outputs the task reads"""
+    made_by = producers(tasks)
+    return sorted({made_by[path] for path in tasks[name]['inputs'] if path in made_by})
+
+def select(targets=None, tasks=TASKS):
+    """The targets and everything they depend on, in dependency order"""
+    unknown = set(targets or []) - set(tasks)
+    if unknown:
+        raise ValueError(f"unknown tasks {sorted(unknown)}; see 'cli.py pipeline --list'")
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"task graph has a cycle through {name!r}")
+        visiting.add(name)
+        for dependency in upstream(name, tasks):
+            visit(dependency)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in targets or tasks:
+        visit(name)
+    return order
+
+def _load_state():
+    if not os.path.exists(state_path):
+        return {'tasks': {}, 'files': {}}
+    with open(state_path) as f:
+        return json.load(f)
+
+def _save_state(state):
+    os.makedirs(pipeline_dir, exist_ok=True)
+    with open(state_path, "w") as f:
+        json.dump(state, f, indent=1)
+
+def _copy(source, destination):
+    if os.path.isdir(source):
+        if os.path.exists(destination):
+            shutil.rmtree(destination)
+        shutil.copytree(source, destination)
+    else:
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        shutil.copy2(source, destination)
+
+def _cache_entry(name, input_hash):
+    return os.path.join(cache_dir, name, input_hash)
+
+def _store(name, task, input_hash):
+    """Copy a task's outputs into the cache under its input hash"""
+    entry = _cache_entry(name, input_hash)
+    for i, output in enumerate(task['outputs']):
+        _copy(output, os.path.join(entry, str(i)))
+
+def _restore(name, task, input_hash):
+    """Copy cached outputs back into place; False if there is no complete cache entry"""
+    entry = _cache_entry(name, input_hash)
+    cached = [os.path.join(entry, str(i)) for i in range(len(task['outputs']))]
+    if not all(os.path.exists(path) for path in cached):
+        return False
+    for path, output in zip(cached, task['outputs']):
+        _copy(path, output)
+    return True
+
+def _execute(name, module_name, function_name, kwargs):
+    """Run one task in a worker process, with its output going to its log file"""
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    for path in (code_dir, visualizations_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    os.makedirs(log_dir, exist_ok=True)
+    with open(os.path.join(log_dir, f"{name}.log"), "w") as log:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            function = getattr(importlib.import_module(module_name), function_name)
+            try:
+                function(**kwargs)
+            except SystemExit as e:
+                # Some scripts exit() when there's nothing to do; only a non-zero code is a failure
+                if e.code not in (None, 0):
+                    raise RuntimeError(f"exited with {e.code}")
+
+def _check(name, task, state, made_by, force):
+    """(status, input hash) for a task whose upstream tasks have finished
+
+    status is 'current', 'kept' (can't be rebuilt here, existing outputs kept),
+    'missing' (can't be rebuilt and has no outputs) or 'stale'.
+    """
+    outputs_exist = all(os.path.exists(output) for output in task['outputs'])
+    absent = [path for path in task['inputs'] if path not in made_by and not os.path.exists(path)]
+    unset = [variable for variable in task.get('env', []) if not os.environ.get(variable)]
+    if absent or unset:
+        reason = f"needs {', '.join(absent + ['$' + variable for variable in unset])}"
+        return ('kept' if outputs_exist else 'missing'), reason
+
+    input_hash = content_hash(task['inputs'] + source_files(task['run'][0]), state['files'], extra=task['run'])
+    last = state['tasks'].get(name, {})
+    if (not force and outputs_exist and last.get('inputs') == input_hash
+            and last.get('outputs') == content_hash(task['outputs'], state['files'])):
+        return 'current', input_hash
+    return 'stale', input_hash
+
+@instrument("analysis")
+def run_pipeline(targets=None, jobs=None, force=False, dry_run=False):
+    """Bring the targets (default: every task) up to date; returns {task: status}"""
+    order = select(targets)
+    made_by = producers()
+    state = _load_state()
+    status = {}
+
+    if dry_run:
+        # Anything downstream of a stale task would be checked again after it ran
+        for name in order:
+            if any(status[dependency] in ('run', 'after upstream') for dependency in upstream(name)):
+                result, detail = 'after upstream', None
+            else:
+                result, detail = _check(name, TASKS[name], state, made_by, force)
+            status[name] = 'run' if result == 'stale' else result
+            print(f"{name:28} {status[name]}" + (f" ({detail})" if result in ('kept', 'missing') else ""))
+        return status
+
+    pending = list(order)
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        while pending or running:
+            for name in list(pending):
+                dependencies = upstream(name)
+                if any(dependency not in status for dependency in dependencies):
+                    continue
+                pending.remove(name)
+                task = TASKS[name]
+                if any(status[dependency] in ('failed', 'missing', 'blocked') for dependency in dependencies):
+                    status[name] = 'blocked'
+                    print(f"{name:28} blocked by a failed upstream task")
+                    continue
+
+                with stage(f"check {name}", "load"):
+                    result, detail = _check(name, task, state, made_by, force)
+                if result in ('current', 'kept', 'missing'):
+                    status[name] = result
+                    print(f"{name:28} {result}" + (f" ({detail})" if result != 'current' else ""))
+                elif not force and _restore(name, task, detail):
+                    status[name] = 'restored'
+                    state['tasks'][name] = {'inputs': detail, 'outputs': content_hash(task['outputs'], state['files'])}
+                    print(f"{name:28} restored from cache")
+                else:
+                    print(f"{name:28} running")
+                    running[pool.submit(_execute, name, *task['run'])] = (name, detail)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, input_hash = running.pop(future)
+                task = TASKS[name]
+                try:
+                    future.result()
+                except BaseException as e:
+                    status[name] = 'failed'
+                    print(f"{name:28} failed: {e} (see {os.path.join(log_dir, name + '.log')})")
+                    continue
+                status[name] = 'ran'
+                state['tasks'][name] = {'inputs': input_hash, 'outputs': content_hash(task['outputs'], state['files'])}
+                with stage(f"cache {name} outputs", "save"):
+                    _store(name, task, input_hash)
+                print(f"{name:28} done")
+                _save_state(state)
+
+    _save_state(state)
+    counts = {}
+    for result in status.values():
+        counts[result] = counts.get(result, 0) + 1
+    print(f"\nPipeline: {', '.join(f'{count} {result}' for result, count in sorted(counts.items()))}")
+    return status
+
+def print_tasks():
+    """Each task with what it reads, writes and waits for"""
+    for name in select():
+        task = TASKS[name]
+        after = upstream(name)
+        print(f"{name}\n  reads   {', '.join(task['inputs'])}\n  writes  {', '.join(task['outputs'])}"
+              + (f"\n  after   {', '.join(after)}" if after else ""))
@@ -0,0 +1,50 @@
+# population_flow.py
+#
+# Script version of population_flow.ipynb: keeps the IRS county-to-county moves out
+# of Los Angeles County for one tax-year pair (e.g. "2122") and attaches the
+# destination county's coordinates.
+import pandas as pd
+import os
+from instrumentation import stage, instrument
+
+irs_dir = os.path.join("data", "irs")
+county_latlng_path = os.path.join(irs_dir, "us_county_latlng.csv")
+
+# Source county: Los Angeles, California
+source_statefips = 6
+source_countyfips = 37
+
+def la_county_outflow(data):
+    """Moves out of Los Angeles County to real destination counties, with a 5-digit FIPS key"""
+    data = data[
+        (data['y1_statefips'] == source_statefips) &   # source state is California
+        (data['y1_countyfips'] == source_countyfips) & # source county is Los Angeles
+        (data['y2_statefips'] <= 56) &                  # destination state is real
+        (~((data['y2_statefips'] == source_statefips) & (data['y2_countyfips'] == source_countyfips)))  # destination county is not Los Angeles
+    ].copy()
+
+    # Same as formatting "SSCCC" and parsing it back, without a per-row apply
+    data['y2_fips'] = data['y2_statefips'] * 1000 + data['y2_countyfips']
+    return data
+
+@instrument("analysis")
+def geocode_outflow(year):
+    """Build la_countyoutflow_geocoded_<year>.csv from countyoutflow<year>.csv"""
+    with stage(f"read countyoutflow{year}.csv", "load"):
+        data = pd.read_csv(os.path.join(irs_dir, f"countyoutflow{year}.csv"))
+        county_fips = pd.read_csv(county_latlng_path)
+
+    with stage("filter Los Angeles outflow", "transform"):
+        data = la_county_outflow(data)
+
+    with stage("join county coordinates", "transform"):
+        merged = pd.merge(data, county_fips, left_on='y2_fips', right_on='fips_code')
+
+    output_path = os.path.join(irs_dir, f"la_countyoutflow_geocoded_{year}.csv")
+    with stage(f"write la_countyoutflow_geocoded_{year}.csv", "save"):
+        merged.to_csv(output_path)
+    print(f"Wrote {len(merged):,} destination counties to {output_path}")
+    return merged
+
+if __name__ == "__main__":
+    geocode_outflow("2122")
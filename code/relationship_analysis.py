@@ -1,22 +1,21 @@
 # relationship_analysis.py
-import pandas as pd
-import numpy as np
-import os
-import matplotlib.pyplot as plt
 from datetime import datetime
-
-data_dir = "data"
+from instrumentation import stage, instrument
+from engine import groupby_agg
+from loaders import load_price_availability
+from resample import resampled
+from pad_cube import load_cube
 
 def load_unemployment_data():
     """Load and aggregate unemployment data by state and quarter"""
-    filepath = os.path.join(data_dir, "Unemployment.csv")
-    unemployment = pd.read_csv(filepath)
-    
-    # Aggregate to quarterly level (average of months in quarter)
-    quarterly_unemployment = unemployment.groupby(['year', 'quarter', 'state'])['unemployment_rate'].mean().reset_index()
+    # Quarterly level (average of months in quarter), cached by resample.py
+    with stage("quarterly unemployment by state", "aggregate"):
+        quarterly_unemployment = resampled('unemployment', 'quarter', by='state', how='mean',
+                                           columns=['unemployment_rate'])
     
     return quarterly_unemployment
 
+@instrument("analysis")
 def analyze_market_unemployment_relation():
     """Analyze the relationship between market metrics and unemployment"""
     print("\n===== MARKET AND UNEMPLOYMENT RELATION =====")
@@ -25,8 +24,7 @@ def analyze_market_unemployment_relation():
     unemployment = load_unemployment_data()
     
     # Load price and availability data
-    price_filepath = os.path.join(data_dir, "Price and Availability Data.csv")
-    price_data = pd.read_csv(price_filepath)
+    price_data = load_price_availability()
     
     # Get state from market (for matching with unemployment)
     # Create a mapping of markets to states - this is approximate and may need refinement
@@ -57,93 +55,79 @@ def analyze_market_unemployment_relation():
     }
     
     # Map markets to states where possible
-    price_data['state'] = price_data['market'].map(market_to_state)
+    with stage("map markets to states and merge unemployment", "transform"):
+        price_data['state'] = price_data['market'].map(market_to_state)
     
-    # Filter to only data with state mappings
-    price_data_with_state = price_data[~price_data['state'].isna()]
+        # Filter to only data with state mappings
+        price_data_with_state = price_data[~price_data['state'].isna()]
     
-    # Merge price data with unemployment
-    merged_data = price_data_with_state.merge(
-        unemployment,
-        on=['year', 'quarter', 'state'],
-        how='inner'
-    )
+        # Merge price data with unemployment
+        merged_data = price_data_with_state.merge(
+            unemployment,
+            on=['year', 'quarter', 'state'],
+            how='inner'
+        )
     
     print(f"Successfully merged {len(merged_data)} rows")
     
     # Analyze relationship between rent and unemployment
     print("\nCorrelation between unemployment and rent metrics:")
-    correlations = merged_data[['unemployment_rate', 'internal_class_rent', 'overall_rent']].corr()
+    with stage("unemployment-rent correlations", "aggregate"):
+        correlations = merged_data[['unemployment_rate', 'internal_class_rent', 'overall_rent']].corr()
     print(correlations.loc['unemployment_rate', ['internal_class_rent', 'overall_rent']])
     
     # Analyze by building class
     print("\nAverage metrics by building class:")
-    class_metrics = merged_data.groupby('internal_class').agg({
-        'internal_class_rent': 'mean',
-        'unemployment_rate': 'mean',
-        'availability_proportion': 'mean'
-    }).reset_index()
+    with stage("metrics by building class", "aggregate"):
+        class_metrics = groupby_agg(merged_data, 'internal_class', {
+            'internal_class_rent': 'mean',
+            'unemployment_rate': 'mean',
+            'availability_proportion': 'mean'
+        })
     print(class_metrics)
     
     # Analyze by year
     print("\nYearly trends (average across all markets):")
-    year_metrics = merged_data.groupby('year').agg({
-        'internal_class_rent': 'mean',
-        'unemployment_rate': 'mean',
-        'availability_proportion': 'mean'
-    }).reset_index()
+    with stage("metrics by year", "aggregate"):
+        year_metrics = groupby_agg(merged_data, 'year', {
+            'internal_class_rent': 'mean',
+            'unemployment_rate': 'mean',
+            'availability_proportion': 'mean'
+        })
     print(year_metrics)
 
+@instrument("analysis")
 def analyze_lease_activity():
     """Analyze the trends in leasing activity over time"""
     print("\n===== LEASE ACTIVITY TRENDS =====")
     
-    # Load price and availability data (which has aggregated leasing activity)
-    filepath = os.path.join(data_dir, "Price and Availability Data.csv")
-    pa_data = pd.read_csv(filepath)
+    # Leasing, space and RBA totals per year, quarter and class come from the PAD cube
+    cube = load_cube('price_availability')
     
-    # Group by year and quarter to see trends
-    leasing_by_time = pa_data.groupby(['year', 'quarter']).agg({
-        'leasing': 'sum',
-        'available_space': 'sum',
-        'RBA': 'sum'  # Rentable Building Area
-    }).reset_index()
-    
-    # Calculate proportion of space leased relative to available and total
-    leasing_by_time['leasing_to_available_ratio'] = leasing_by_time['leasing'] / leasing_by_time['available_space']
-    leasing_by_time['leasing_to_total_ratio'] = leasing_by_time['leasing'] / leasing_by_time['RBA']
+    # Group by year and quarter to see trends; the ratios are ratios of the
+    # summed space, i.e. leasing / available space and leasing / RBA
+    leasing_by_time = cube.rollup(['year', 'quarter'])
     
     print("\nQuarterly leasing activity:")
     print(leasing_by_time[['year', 'quarter', 'leasing', 'leasing_to_available_ratio', 'leasing_to_total_ratio']])
     
     # Analyze by building class
-    class_leasing = pa_data.groupby(['internal_class']).agg({
-        'leasing': 'sum',
-        'available_space': 'sum',
-        'RBA': 'sum'
-    }).reset_index()
-    
-    class_leasing['leasing_to_available_ratio'] = class_leasing['leasing'] / class_leasing['available_space']
-    class_leasing['leasing_to_total_ratio'] = class_leasing['leasing'] / class_leasing['RBA']
+    class_leasing = cube.rollup('internal_class')[['internal_class', 'leasing', 'available_space', 'RBA',
+                                                   'leasing_to_available_ratio', 'leasing_to_total_ratio']]
     
     print("\nLeasing activity by building class:")
     print(class_leasing)
     
     # COVID impact analysis - Compare pre-COVID, COVID, and post-COVID
     print("\nCOVID impact analysis (yearly averages):")
-    pa_data['period'] = pa_data['year'].apply(
-        lambda y: 'Pre-COVID' if y < 2020 else ('COVID' if y == 2020 else 'Post-COVID')
-    )
-    
-    period_metrics = pa_data.groupby('period').agg({
-        'leasing': 'mean',
-        'availability_proportion': 'mean',
-        'internal_class_rent': 'mean'
-    }).reset_index()
+    period_metrics = cube.rollup('year', relabel={
+        'year': lambda y: 'Pre-COVID' if y < 2020 else ('COVID' if y == 2020 else 'Post-COVID')
+    })[['year', 'leasing_mean', 'availability_proportion', 'internal_class_rent']]
+    period_metrics = period_metrics.rename(columns={'year': 'period', 'leasing_mean': 'leasing'})
     
     print(period_metrics)
 
-if __name__ == "__main__":
+def main():
     print(f"Starting relationship analysis at {datetime.now()}")
     try:
         analyze_market_unemployment_relation()
@@ -155,4 +139,7 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Error in lease activity analysis: {e}")
     
-    print(f"\nCompleted analysis at {datetime.now()}")
\ No newline at end of file
+    print(f"\nCompleted analysis at {datetime.now()}")
+
+if __name__ == "__main__":
+    main()
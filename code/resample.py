@@ -0,0 +1,198 @@
+# resample.py
+#
+# Converts any dataset between monthly, quarterly and annual granularity, so
+# everything can be joined at the same grain:
+#
+#     quarterly = resampled('unemployment', 'quarter', by='state')
+#     yearly_rent = resampled('price_availability', 'year', by='market',
+#                             how='weighted', columns=['internal_class_rent'], weight='RBA')
+#
+# The datasets encode time differently: Unemployment has year/quarter/month,
+# PAD and occupancy have year and a "Q1".."Q4" quarter, and inflation has an
+# integer quarter. The grain is read from the columns (month > quarter > year)
+# and both quarter styles are understood; results use "Q1".."Q4" quarters, like
+# most of the data, unless quarter_labels=False.
+#
+# Going down to a coarser grain aggregates with how=
+#   mean      average of the sub-periods
+#   sum       total of the sub-periods
+#   last      end-of-period value (the latest sub-period present)
+#   first     start-of-period value
+#   weighted  average weighted by the weight= column
+# Going up to a finer grain repeats each value over its sub-periods ('sum'
+# spreads it evenly instead).
+#
+# resampled() caches every result by dataset and options, in memory and as a CSV
+# in data/resampled/ (meta.json records the source file signature each was built
+# from), so asking for the same view again, in this process or the next, is a
+# lookup rather than another groupby until the source CSV changes.
+import os
+import json
+import hashlib
+import shutil
+import numpy as np
+import pandas as pd
+import loaders
+from engine import groupby_agg
+from instrumentation import stage
+
+cache_dir = os.path.join(loaders.data_dir, "resampled")
+
+GRAINS = ['month', 'quarter', 'year']
+TIME_COLUMNS = {'month': ['year', 'quarter', 'month'], 'quarter': ['year', 'quarter'], 'year': ['year']}
+MONTHS_PER = {'month': 1, 'quarter': 3, 'year': 12}
+HOW = ['mean', 'sum', 'last', 'first', 'weighted']
+
+_memory = {}
+
+def _as_list(cols):
+    if cols is None:
+        return []
+    return [cols] if isinstance(cols, str) else list(cols)
+
+def grain_of(df):
+    """Finest time grain present in a frame's columns"""
+    for grain in GRAINS:
+        if grain in df.columns:
+            return grain
+    raise ValueError("frame has no year, quarter or month column")
+
+def quarter_number(quarters):
+    """Quarters as integers 1-4 from either "Q1".."Q4" labels or numbers"""
+    quarters = pd.Series(quarters)
+    if quarters.dtype == object or pd.api.types.is_string_dtype(quarters):
+        quarters = quarters.astype(str).str.lstrip('Q')
+    return pd.to_numeric(quarters).to_numpy(dtype=int)
+
+def _month_index(df, grain):
+    """Months since year 0 of the first month of each row's period"""
+    month = np.zeros(len(df), dtype=int)
+    if grain == 'quarter':
+        month = (quarter_number(df['quarter']) - 1) * 3
+    elif grain == 'month':
+        month = df['month'].to_numpy(dtype=int) - 1
+    return df['year'].to_numpy(dtype=int) * 12 + month
+
+def _time_frame(month_index, grain, quarter_labels=True):
+    """year / quarter / month columns for months-since-year-0 at a grain"""
+    year, month = np.divmod(month_index, 12)
+    frame = {'year': year}
+    if grain in ('quarter', 'month'):
+        quarter = month // 3 + 1
+        frame['quarter'] = [f"Q{q}" for q in quarter] if quarter_labels else quarter
+    if grain == 'month':
+        frame['month'] = month + 1
+    return pd.DataFrame(frame)
+
+def resample(df, to, by=None, how='mean', columns=None, weight=None, quarter_labels=True):
+    """df at the grain to ('month', 'quarter' or 'year'), one row per (time, *by)
+
+    columns are the values to carry over (default: every numeric column that
+    isn't time, by or weight).
+    """
+    if to not in GRAINS:
+        raise ValueError(f"grain must be one of {GRAINS}, not {to!r}")
+    if how not in HOW:
+        raise ValueError(f"how must be one of {HOW}, not {how!r}")
+    if how == 'weighted' and weight is None:
+        raise ValueError("how='weighted' needs a weight= column")
+    by = _as_list(by)
+    source = grain_of(df)
+    time = TIME_COLUMNS[to]
+    if columns is None:
+        skip = set(TIME_COLUMNS['month']) | set(by) | {weight}
+        columns = [col for col in df.columns if col not in skip and pd.api.types.is_numeric_dtype(df[col])]
+    columns = _as_list(columns)
+
+    months = _month_index(df, source)
+    ratio = MONTHS_PER[to] / MONTHS_PER[source]
+
+    with stage(f"resample {source} to {to}", "aggregate"):
+        if ratio < 1:
+            # Finer grain: one row per sub-period, each starting month offset
+            steps = int(round(1 / ratio))
+            expanded = df.loc[df.index.repeat(steps), by + columns].reset_index(drop=True)
+            offsets = np.tile(np.arange(steps) * MONTHS_PER[to], len(df))
+            if how == 'sum':
+                expanded[columns] = expanded[columns] / steps
+            times = _time_frame(np.repeat(months, steps) + offsets, to, quarter_labels)
+            result = pd.concat([times, expanded], axis=1)
+            return result.sort_values(time + by, kind='stable').reset_index(drop=True)
+
+        # Same or coarser grain: group sub-periods into their target period
+        target = months - months % MONTHS_PER[to]
+        frame = df[by + columns].reset_index(drop=True)
+        frame['_period'] = target
+        if how in ('mean', 'sum'):
+            result = groupby_agg(frame, ['_period'] + by, {col: how for col in columns})
+        elif how == 'weighted':
+            weights = df[weight].to_numpy(dtype=float)
+            for col in columns:
+                values = frame[col].to_numpy(dtype=float)
+                present = ~np.isnan(values) & ~np.isnan(weights)
+                frame[f"_{col}_weighted"] = np.where(present, values * weights, 0)
+                frame[f"_{col}_weight"] = np.where(present, weights, 0)
+            sums = groupby_agg(frame, ['_period'] + by, {name: 'sum' for name in frame.columns
+                                                         if name.startswith('_') and name != '_period'})
+            result = sums[['_period'] + by].copy()
+            for col in columns:
+                weight_sum = sums[f"_{col}_weight"]
+                result[col] = sums[f"_{col}_weighted"] / weight_sum.where(weight_sum > 0)
+        else:
+            frame['_month'] = months
+            frame = frame.sort_values('_month', kind='stable')
+            keep = 'last' if how == 'last' else 'first'
+            result = frame.drop_duplicates(['_period'] + by, keep=keep).sort_values(['_period'] + by)
+            result = result[['_period'] + by + columns]
+
+        times = _time_frame(result['_period'].to_numpy(), to, quarter_labels)
+        result = pd.concat([times, result.drop(columns='_period').reset_index(drop=True)], axis=1)
+        return result.sort_values(time + by, kind='stable').reset_index(drop=True)
+
+def _cache_key(dataset, to, by, how, columns, weight, quarter_labels):
+    spec = {'dataset': dataset, 'to': to, 'by': _as_list(by), 'how': how, 'columns': _as_list(columns) or None,
+            'weight': weight, 'quarter_labels': quarter_labels}
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+    return f"{dataset}_{to}_{digest}"
+
+def _meta_path():
+    return os.path.join(cache_dir, "meta.json")
+
+def _load_meta():
+    if not os.path.exists(_meta_path()):
+        return {}
+    with open(_meta_path()) as f:
+        return json.load(f)
+
+def resampled(dataset, to, by=None, how='mean', columns=None, weight=None, quarter_labels=True):
+    """A dataset (short name from loaders.DATASETS) resampled to a grain, cached
+
+    A cached result is reused until the dataset's CSV changes.
+    """
+    key = _cache_key(dataset, to, by, how, columns, weight, quarter_labels)
+    signature = list(loaders.source_signature(loaders.dataset_path(dataset)))
+    if key in _memory and _memory[key][0] == signature:
+        return _memory[key][1].copy()
+
+    path = os.path.join(cache_dir, f"{key}.csv")
+    meta = _load_meta()
+    if os.path.exists(path) and meta.get(key) == signature:
+        with stage(f"read cached {key}", "load"):
+            result = pd.read_csv(path, dtype={'quarter': str} if quarter_labels else None)
+    else:
+        result = resample(loaders.load_dataset(dataset), to, by, how, columns, weight, quarter_labels)
+        os.makedirs(cache_dir, exist_ok=True)
+        with stage(f"write {key}", "save"):
+            result.to_csv(path, index=False)
+        meta[key] = signature
+        with open(_meta_path(), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    _memory[key] = (signature, result)
+    return result.copy()
+
+def clear_cache():
+    """Forget every cached resample, in memory and on disk"""
+    _memory.clear()
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
@@ -0,0 +1,217 @@
+# scenarios.py
+#
+# What-if grid for the adjusted space utilization behind the adj-stacked-bars
+# charts, for every market, quality and quarter in one pass:
+#
+#     python code/cli.py scenarios --occupancy-shift 0 -0.05 -0.1 --sublet-conversion 0 0.25
+#     result = run_scenarios({'occupancy_shift': [0, -0.05], 'inflation_shift': [0, 0.5]})
+#     result['values']     # scenarios x markets x qualities x quarters x OUTPUTS
+#
+# The chart splits used space (total - available) into adjusted used space
+# (used x starting occupancy) and underutilized space (the rest), next to direct
+# and sublet availability, and deflates rents by cumulative inflation rebased to
+# the first quarter. Here every input is a dense markets x qualities x quarters
+# array, each assumption in ASSUMPTIONS is an axis of the grid, and the outputs
+# are computed once over the broadcast (scenario, market, quality, quarter)
+# shape. The assumptions:
+#   occupancy_shift    added to starting occupancy (clipped to 0..1), e.g. -0.05
+#   missing_occupancy  occupancy for markets/quarters without occupancy data; the
+#                      chart uses 1.0 (fully utilized)
+#   inflation_shift    percentage points added to every quarter's inflation rate
+#   sublet_conversion  share of sublet availability taken up by subtenants and
+#                      counted as used space
+# The scenario with every assumption at its DEFAULTS value reproduces the chart.
+import itertools
+import numpy as np
+import pandas as pd
+import loaders
+from resample import quarter_number
+from instrumentation import stage, instrument
+
+ASSUMPTIONS = ['occupancy_shift', 'missing_occupancy', 'inflation_shift', 'sublet_conversion']
+DEFAULTS = {'occupancy_shift': 0.0, 'missing_occupancy': 1.0, 'inflation_shift': 0.0, 'sublet_conversion': 0.0}
+
+# Last axis of result['values']
+OUTPUTS = ['adjusted_used_space', 'underutilized_space', 'direct_available_space', 'sublet_available_space',
+           'adjusted_used_share', 'underutilized_share', 'direct_share', 'sublet_share',
+           'real_direct_rent', 'real_sublet_rent']
+
+SPACE_COLUMNS = ['total_space', 'available_space', 'direct_available_space', 'sublet_available_space']
+RENT_COLUMNS = ['direct_internal_class_rent', 'sublet_internal_class_rent']
+
+def _dense(df, keys, columns):
+    """Columns of a frame as dense arrays over the unique values of keys (NaN where a cell has no row)"""
+    codes, labels = [], []
+    for key in keys:
+        code, uniques = pd.factorize(df[key], sort=True)
+        codes.append(code)
+        labels.append(list(uniques))
+    shape = tuple(len(axis) for axis in labels)
+    arrays = {}
+    for column in columns:
+        values = np.full(shape, np.nan)
+        values[tuple(codes)] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+        arrays[column] = values
+    return labels, arrays
+
+def load_inputs():
+    """Dense markets x qualities x periods arrays of space, rent and occupancy, plus the inflation rates"""
+    with stage("read Cleaned PAD, occupancy and inflation", "load"):
+        pad = loaders.load_cleaned_pad()
+        occupancy = loaders.load_occupancy()
+        inflation = loaders.load_inflation()
+
+    with stage("dense scenario inputs", "transform"):
+        pad = pad.assign(_period=pad['year'].to_numpy(dtype=int) * 4 + quarter_number(pad['quarter']) - 1)
+        (markets, qualities, period_codes), arrays = _dense(pad, ['market', 'is_premium_quality', '_period'],
+                                                            SPACE_COLUMNS + RENT_COLUMNS)
+        periods = np.array(period_codes)
+
+        # Occupancy joins on the exact market name, as in the chart; other markets get missing_occupancy
+        occupancy = occupancy.assign(_period=occupancy['year'].to_numpy(dtype=int) * 4
+                                     + quarter_number(occupancy['quarter']) - 1)
+        starting = np.full((len(markets), len(periods)), np.nan)
+        market_index = {market: i for i, market in enumerate(markets)}
+        period_index = {period: i for i, period in enumerate(periods)}
+        for market, period, value in occupancy[['market', '_period', 'starting_occupancy_proportion']].itertuples(index=False):
+            if market in market_index and period in period_index:
+                starting[market_index[market], period_index[period]] = value
+
+        # Quarterly inflation rate per period; periods without one compound nothing
+        inflation = inflation.assign(_period=inflation['year'].to_numpy(dtype=int) * 4
+                                     + quarter_number(inflation['quarter']) - 1)
+        rates = inflation.set_index('_period')['inflation_rate'].reindex(periods).to_numpy(dtype=float)
+
+    return {'markets': markets, 'qualities': qualities, 'periods': periods,
+            'present': ~np.isnan(arrays['total_space']), 'starting_occupancy': starting,
+            'inflation_rate': rates, **arrays}
+
+def scenario_grid(grid=None):
+    """Every combination of the assumption values, one row per scenario
+
+    grid maps assumption -> list of values; assumptions left out stay at DEFAULTS.
+    """
+    grid = dict(grid or {})
+    unknown = set(grid) - set(ASSUMPTIONS)
+    if unknown:
+        raise ValueError(f"assumptions must be among {ASSUMPTIONS}, not {sorted(unknown)}")
+    axes = [list(np.atleast_1d(grid.get(name, DEFAULTS[name]))) for name in ASSUMPTIONS]
+    return pd.DataFrame(list(itertools.product(*axes)), columns=ASSUMPTIONS, dtype=float)
+
+def deflators(rates, shifts):
+    """Rebased cumulative inflation (100 in the first period) per shift: shifts x periods
+
+    Same compounding as ingest.build_deflator, with each rate raised by the shift;
+    periods without a rate carry the previous level.
+    """
+    factors = 1 + (np.nan_to_num(rates)[np.newaxis, :] + shifts[:, np.newaxis] * ~np.isnan(rates)) / 100.0
+    factors[:, 0] = 1.0
+    return 100.0 * np.cumprod(factors, axis=1)
+
+@instrument("analysis")
+def run_scenarios(grid=None, inputs=None):
+    """Utilization and real rents for every scenario, market, quality and quarter
+
+    Returns a dict with the scenarios frame, the markets, qualities and periods
+    (year * 4 + quarter - 1) along the axes, OUTPUTS, and values shaped
+    scenarios x markets x qualities x periods x outputs (NaN where PAD has no row).
+    """
+    scenarios = scenario_grid(grid)
+    inputs = inputs or load_inputs()
+
+    def assumption(name):
+        # Broadcasts against markets x qualities x periods
+        return scenarios[name].to_numpy()[:, np.newaxis, np.newaxis, np.newaxis]
+
+    with stage(f"evaluate {len(scenarios)} scenarios", "aggregate"):
+        direct = np.nan_to_num(inputs['direct_available_space'])
+        sublet = np.nan_to_num(inputs['sublet_available_space'])
+        used = np.nan_to_num(inputs['total_space'] - inputs['available_space'])
+
+        converted = sublet * assumption('sublet_conversion')
+        used = used + converted
+        sublet = sublet - converted
+
+        starting = inputs['starting_occupancy'][np.newaxis, :, np.newaxis, :]
+        occupancy = np.where(np.isnan(starting), assumption('missing_occupancy'), starting)
+        occupancy = np.clip(occupancy + assumption('occupancy_shift'), 0, 1)
+        adjusted_used = used * occupancy
+        underutilized = used - adjusted_used
+
+        shape = adjusted_used.shape
+        direct = np.broadcast_to(direct, shape)
+        sublet = np.broadcast_to(sublet, shape)
+        total = adjusted_used + underutilized + direct + sublet
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shares = [100 * part / total for part in (adjusted_used, underutilized, direct, sublet)]
+
+        unique_shifts, shift_index = np.unique(scenarios['inflation_shift'].to_numpy(), return_inverse=True)
+        factor = (100.0 / deflators(inputs['inflation_rate'], unique_shifts))[shift_index][:, np.newaxis, np.newaxis, :]
+        real_direct = np.broadcast_to(inputs['direct_internal_class_rent'] * factor, shape)
+        real_sublet = np.broadcast_to(inputs['sublet_internal_class_rent'] * factor, shape)
+
+        values = np.stack([adjusted_used, underutilized, direct, sublet, *shares, real_direct, real_sublet], axis=-1)
+        values[~np.broadcast_to(inputs['present'], shape)] = np.nan
+
+    return {'scenarios': scenarios, 'markets': inputs['markets'], 'qualities': inputs['qualities'],
+            'periods': inputs['periods'], 'outputs': OUTPUTS, 'values': values}
+
+def _period_label(period):
+    return f"{int(period) // 4} Q{int(period) % 4 + 1}"
+
+def summary_table(result, period=None):
+    """One row per scenario: all-market space shares in a period (default: the last) and real rent change
+
+    Shares are of summed space over every market and quality; real rent change
+    is the space-weighted real rent in that period over the first period.
+    """
+    values = result['values']
+    t = len(result['periods']) - 1 if period is None else int(np.flatnonzero(result['periods'] == period)[0])
+    index = {name: i for i, name in enumerate(OUTPUTS)}
+
+    def total(name, at):
+        return np.nansum(values[:, :, :, at, index[name]], axis=(1, 2))
+
+    def real_rent(kind, at):
+        space = values[:, :, :, at, index[f'{kind}_available_space']]
+        rent = values[:, :, :, at, index[f'real_{kind}_rent']]
+        present = ~np.isnan(rent) & ~np.isnan(space)
+        return (np.where(present, rent * space, 0).sum(axis=(1, 2))
+                / np.where(present, space, 0).sum(axis=(1, 2)))
+
+    spaces = ['adjusted_used_space', 'underutilized_space', 'direct_available_space', 'sublet_available_space']
+    grand = sum(total(name, t) for name in spaces)
+    table = result['scenarios'].copy()
+    for name, label in zip(spaces, ['adjusted_used_share', 'underutilized_share', 'direct_share', 'sublet_share']):
+        table[label] = 100 * total(name, t) / grand
+    for kind in ['direct', 'sublet']:
+        table[f'real_{kind}_rent'] = real_rent(kind, t)
+        table[f'real_{kind}_rent_change'] = real_rent(kind, t) / real_rent(kind, 0) - 1
+    table.attrs['period'] = _period_label(result['periods'][t])
+    return table
+
+def market_table(result, output='underutilized_share', period=None):
+    """One output in one period (default: the last) as rows of market and quality, a column per scenario"""
+    t = len(result['periods']) - 1 if period is None else int(np.flatnonzero(result['periods'] == period)[0])
+    values = result['values'][:, :, :, t, OUTPUTS.index(output)]
+    index = pd.MultiIndex.from_product([result['markets'], result['qualities']], names=['market', 'is_premium_quality'])
+    return pd.DataFrame(values.reshape(len(values), -1).T, index=index,
+                        columns=[f"scenario {i}" for i in range(len(values))]).dropna(how='all')
+
+def to_frame(result):
+    """Long table: one row per scenario, market, quality and period, a column per output"""
+    values = result['values']
+    s, m, q, t, _ = values.shape
+    frame = pd.DataFrame(values.reshape(-1, len(OUTPUTS)), columns=OUTPUTS)
+    frame.insert(0, 'scenario', np.repeat(np.arange(s), m * q * t))
+    frame.insert(1, 'market', np.tile(np.repeat(result['markets'], q * t), s))
+    frame.insert(2, 'is_premium_quality', np.tile(np.repeat(result['qualities'], t), s * m))
+    frame.insert(3, 'year', np.tile(result['periods'] // 4, s * m * q))
+    frame.insert(4, 'quarter', np.tile([f"Q{p % 4 + 1}" for p in result['periods']], s * m * q))
+    return frame.dropna(subset=['adjusted_used_space']).reset_index(drop=True)
+
+def print_summary(result):
+    table = summary_table(result)
+    print(f"\n===== SCENARIOS ({len(table)}), {table.attrs['period']} =====")
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(table.round(3).to_string())
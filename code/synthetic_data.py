@@ -0,0 +1,337 @@
+# synthetic_data.py
+import pandas as pd
+import numpy as np
+import os
+import argparse
+
+data_dir = "data"
+codebook_path = os.path.join(data_dir, "Data Set and Variable Codebook.xlsx")
+leases_path = os.path.join(data_dir, "Leases.csv")
+pad_path = os.path.join(data_dir, "Price and Availability Data.csv")
+
+# Columns that are the same for every lease in a (year, quarter, market, internal_class) cell
+MARKET_LEVEL_COLUMNS = [
+    'RBA', 'available_space', 'availability_proportion', 'internal_class_rent',
+    'overall_rent', 'direct_available_space', 'direct_availability_proportion',
+    'direct_internal_class_rent', 'direct_overall_rent', 'sublet_available_space',
+    'sublet_availability_proportion', 'sublet_internal_class_rent',
+    'sublet_overall_rent', 'leasing'
+]
+
+# Columns that describe the building rather than the lease
+BUILDING_COLUMNS = [
+    'building_name', 'building_id', 'address', 'region', 'city', 'state', 'zip',
+    'internal_submarket', 'internal_market_cluster', 'costarID', 'CBD_suburban'
+]
+
+# Lease-level categorical columns sampled per market
+CATEGORICAL_COLUMNS = ['transaction_type', 'internal_industry', 'space_type']
+
+# Fallback category frequencies (from the codebook descriptions) used when no Leases sample exists
+DEFAULT_CATEGORIES = {
+    'transaction_type': {
+        'New': 0.35, 'Renewal': 0.30, 'Expansion': 0.08, 'Relocation': 0.12,
+        'Renewal and Expansion': 0.06, 'Restructure': 0.04, 'Sale - Leaseback': 0.01,
+        'TBD': 0.04
+    },
+    'internal_industry': {
+        None: 0.55,
+        'Technology, Advertising, Media, and Information': 0.12,
+        'Financial Services and Insurance': 0.10,
+        'Legal Services': 0.07,
+        'Business, Professional, and Consulting Services': 0.06,
+        'Healthcare': 0.03,
+        'Real Estate': 0.03,
+        'Government': 0.02,
+        'Manufacturing': 0.02,
+    },
+    'space_type': {'Relet': 0.80, 'New': 0.12, 'Sublet': 0.08},
+}
+
+# Rough city/state/region for PAD market names, used to fill building columns without a sample
+MARKET_LOCATIONS = {
+    'Atlanta': ('Atlanta', 'GA', 'South'),
+    'Austin': ('Austin', 'TX', 'South'),
+    'Baltimore': ('Baltimore', 'MD', 'Northeast'),
+    'Boston': ('Boston', 'MA', 'Northeast'),
+    'Charlotte': ('Charlotte', 'NC', 'South'),
+    'Chicago Suburbs': ('Schaumburg', 'IL', 'Midwest/Central'),
+    'Dallas-Ft. Worth': ('Dallas', 'TX', 'South'),
+    'Denver-Boulder': ('Denver', 'CO', 'West'),
+    'Detroit': ('Detroit', 'MI', 'Midwest/Central'),
+    'Downtown Chicago': ('Chicago', 'IL', 'Midwest/Central'),
+    'Houston': ('Houston', 'TX', 'South'),
+    'Los Angeles': ('Los Angeles', 'CA', 'West'),
+    'Manhattan': ('New York', 'NY', 'Northeast'),
+    'Nashville': ('Nashville', 'TN', 'South'),
+    'Northern New Jersey': ('Newark', 'NJ', 'Northeast'),
+    'Northern Virginia': ('Arlington', 'VA', 'South'),
+    'Orange County (CA)': ('Irvine', 'CA', 'West'),
+    'Philadelphia': ('Philadelphia', 'PA', 'Northeast'),
+    'Phoenix': ('Phoenix', 'AZ', 'West'),
+    'Raleigh-Durham': ('Raleigh', 'NC', 'South'),
+    'Salt Lake City': ('Salt Lake City', 'UT', 'West'),
+    'San Diego': ('San Diego', 'CA', 'West'),
+    'San Francisco': ('San Francisco', 'CA', 'West'),
+    'Seattle': ('Seattle', 'WA', 'West'),
+    'South Bay': ('San Jose', 'CA', 'West'),
+    'South Florida': ('Miami', 'FL', 'South'),
+    'Suburban Maryland': ('Bethesda', 'MD', 'Northeast'),
+    'Tampa': ('Tampa', 'FL', 'South'),
+    'Washington DC': ('Washington', 'DC', 'Northeast'),
+}
+
+def leases_schema():
+    """Return the Leases column order, from a real sample if present, otherwise the codebook"""
+    if os.path.exists(leases_path):
+        return pd.read_csv(leases_path, nrows=0).columns.tolist()
+
+    codebook = pd.read_excel(codebook_path)
+    in_leases = codebook['Data File'].fillna('').str.contains('Leases')
+    return codebook.loc[in_leases, 'Name'].tolist()
+
+def _category_table(df, column):
+    """Per-market category probabilities for one column (missing values kept as None)"""
+    values = df[column].astype(object).where(df[column].notna(), None)
+    counts = pd.crosstab(df['market'], values.fillna('__missing__'))
+    probs = counts.div(counts.sum(axis=1), axis=0)
+    probs.columns = [None if c == '__missing__' else c for c in probs.columns]
+    return probs
+
+def _learn_from_sample(sample_rows):
+    """Learn distributions from the first sample_rows rows of Leases.csv"""
+    print(f"Learning distributions from {sample_rows:,} rows of {leases_path}...")
+    df = pd.read_csv(leases_path, nrows=sample_rows, low_memory=False)
+    df = df[df['market'].notna() & df['internal_class'].notna()]
+
+    cell_keys = ['year', 'quarter', 'market', 'internal_class']
+    cells = df.groupby(cell_keys).size().rename('weight').reset_index()
+    context = df.groupby(cell_keys)[MARKET_LEVEL_COLUMNS].first().reset_index()
+    cells = cells.merge(context, on=cell_keys, how='left')
+
+    log_sf = np.log(df['leasedSF'].clip(lower=1))
+    size_params = log_sf.groupby([df['market'], df['internal_class']]).agg(['mean', 'std'])
+    size_params['std'] = size_params['std'].fillna(log_sf.std())
+
+    buildings = df.drop_duplicates('building_id')[['market', 'internal_class'] + BUILDING_COLUMNS]
+    tenants = df.groupby('market')['company_name'].agg(lambda s: s.dropna().unique())
+
+    return {
+        'cells': cells,
+        'size_params': size_params,
+        'categories': {col: _category_table(df, col) for col in CATEGORICAL_COLUMNS},
+        'buildings': buildings.reset_index(drop=True),
+        'tenants': tenants.to_dict(),
+    }
+
+def _learn_from_pad(buildings_per_market=400, tenants_per_market=2000):
+    """Fallback distributions built from the market-level PAD file and codebook categories"""
+    print(f"No Leases sample found, learning market mix from {pad_path}...")
+    pad = pd.read_csv(pad_path)
+    pad = pad[pad['market'] != 'US National']
+
+    cells = pad[['year', 'quarter', 'market', 'internal_class'] + MARKET_LEVEL_COLUMNS].copy()
+    # Leasing volume decides how many leases land in each cell
+    cells['weight'] = pad['leasing'].clip(lower=1).astype(float)
+
+    markets = sorted(cells['market'].unique())
+    size_params = pd.DataFrame(
+        [(m, c, 8.6 if c == 'A' else 8.3, 1.2) for m in markets for c in ['A', 'O']],
+        columns=['market', 'internal_class', 'mean', 'std']
+    ).set_index(['market', 'internal_class'])
+
+    categories = {}
+    for col, freqs in DEFAULT_CATEGORIES.items():
+        probs = np.array(list(freqs.values()))
+        categories[col] = pd.DataFrame([probs / probs.sum()] * len(markets),
+                                       index=markets, columns=list(freqs.keys()))
+
+    rows = []
+    for market in markets:
+        city, state, region = MARKET_LOCATIONS.get(market, (market, None, None))
+        slug = market.replace(' ', '')
+        for k in range(buildings_per_market):
+            internal_class = 'A' if k % 3 == 0 else 'O'
+            submarket = f"{market} {k % 12 + 1}"
+            address = f"{100 + k} Main St"
+            rows.append({
+                'market': market,
+                'internal_class': internal_class,
+                'building_name': f"{slug} Tower {k}",
+                'building_id': f"{market}_{submarket}_{city}_{slug} Tower {k}_{address}",
+                'address': address,
+                'region': region,
+                'city': city,
+                'state': state,
+                'zip': None,
+                'internal_submarket': submarket,
+                'internal_market_cluster': None,
+                'costarID': None,
+                'CBD_suburban': 'CBD' if k % 4 == 0 else 'Suburban',
+            })
+    buildings = pd.DataFrame(rows)
+    tenants = {m: np.array([f"{m} Tenant {k}" for k in range(tenants_per_market)]) for m in markets}
+
+    return {
+        'cells': cells.reset_index(drop=True),
+        'size_params': size_params,
+        'categories': categories,
+        'buildings': buildings,
+        'tenants': tenants,
+    }
+
+def learn_lease_distributions(sample_rows=500000):
+    """Learn marginal and per-market distributions for synthetic Leases rows"""
+    if os.path.exists(leases_path):
+        dist = _learn_from_sample(sample_rows)
+    else:
+        dist = _learn_from_pad()
+    dist['columns'] = leases_schema()
+    dist['cells']['weight'] = dist['cells']['weight'] / dist['cells']['weight'].sum()
+    return dist
+
+def _market_groups(markets):
+    """Map each market in a chunk to the row positions it occupies"""
+    codes, uniques = pd.factorize(markets)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+    return dict(zip(uniques, np.split(order, bounds)))
+
+def _sample_categories(rng, groups, n, table):
+    """Draw one category per row from that row's market distribution"""
+    out = np.empty(n, dtype=object)
+    for market, rows in groups.items():
+        if market in table.index:
+            probs = table.loc[market].to_numpy(dtype=float)
+        else:
+            probs = table.mean().to_numpy(dtype=float)
+        picks = rng.choice(len(table.columns), size=len(rows), p=probs / probs.sum())
+        out[rows] = np.asarray(table.columns, dtype=object)[picks]
+    return out
+
+def _generate_chunk(rng, dist, n):
+    """Generate n synthetic lease rows as a DataFrame in the Leases schema"""
+    cells = dist['cells']
+    picks = rng.choice(len(cells), size=n, p=cells['weight'].to_numpy())
+    chunk = cells.iloc[picks].drop(columns='weight').reset_index(drop=True)
+    groups = _market_groups(chunk['market'].to_numpy())
+
+    # Month signed falls inside the sampled quarter
+    quarter_num = chunk['quarter'].astype(str).str.replace('Q', '').astype(int).to_numpy()
+    chunk['monthsigned'] = (quarter_num - 1) * 3 + rng.integers(1, 4, size=n)
+
+    # Lease size is lognormal per (market, class)
+    params = dist['size_params'].reindex(pd.MultiIndex.from_frame(chunk[['market', 'internal_class']]))
+    mu = params['mean'].fillna(dist['size_params']['mean'].mean()).to_numpy()
+    sigma = params['std'].fillna(dist['size_params']['std'].mean()).to_numpy()
+    chunk['leasedSF'] = np.maximum(np.round(np.exp(rng.normal(mu, sigma))), 100).astype(int)
+
+    for col, table in dist['categories'].items():
+        chunk[col] = _sample_categories(rng, groups, n, table)
+
+    # Buildings are drawn from the pool with the lease's market and class
+    buildings = dist['buildings']
+    building_keys = (buildings['market'] + '|' + buildings['internal_class']).to_numpy()
+    building_rows = np.zeros(n, dtype=int)
+    class_groups = _market_groups((chunk['market'] + '|' + chunk['internal_class']).to_numpy())
+    for key, rows in class_groups.items():
+        pool = np.flatnonzero(building_keys == key)
+        if len(pool) == 0:
+            pool = np.flatnonzero(buildings['market'].to_numpy() == key.split('|')[0])
+        if len(pool) == 0:
+            pool = np.arange(len(buildings))
+        building_rows[rows] = rng.choice(pool, size=len(rows))
+
+    # Tenants are drawn from each market's pool
+    company = np.empty(n, dtype=object)
+    for market, rows in groups.items():
+        names = dist['tenants'].get(market)
+        if names is not None and len(names) > 0:
+            # Zipf-like weights so a few tenants sign many leases
+            weights = 1.0 / np.arange(1, len(names) + 1)
+            company[rows] = np.asarray(names, dtype=object)[
+                rng.choice(len(names), size=len(rows), p=weights / weights.sum())
+            ]
+    building_data = buildings.iloc[building_rows][BUILDING_COLUMNS].reset_index(drop=True)
+    for col in BUILDING_COLUMNS:
+        chunk[col] = building_data[col]
+    chunk['company_name'] = company
+
+    return chunk[dist['columns']]
+
+def generate_leases(n_rows, output_path, seed=2025, chunk_size=250000, dist=None):
+    """Write n_rows synthetic leases to output_path in chunks of chunk_size rows
+
+    The output is reproducible for a given seed and chunk_size. Only one chunk
+    is held in memory at a time.
+    """
+    if dist is None:
+        dist = learn_lease_distributions()
+
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < n_rows:
+        n = min(chunk_size, n_rows - written)
+        chunk = _generate_chunk(rng, dist, n)
+        chunk.to_csv(output_path, mode='w' if written == 0 else 'a',
+                     header=written == 0, index=False)
+        written += n
+        print(f"Wrote {written:,}/{n_rows:,} rows to {output_path}")
+    return written
+
+def generate_pad(n_rows, output_path, source_path=pad_path, seed=2025):
+    """Write a PAD-style file with about n_rows rows by cloning markets with noise
+
+    Works for both 'Price and Availability Data.csv' and 'Cleaned PAD.csv'
+    layouts. Each synthetic market copies a real market's series, scaling
+    space columns and rents by random factors so proportions stay consistent.
+    """
+    source = pd.read_csv(source_path)
+    source = source[source['market'] != 'US National']
+    markets = sorted(source['market'].unique())
+    rows_per_market = len(source) // len(markets)
+    n_markets = int(np.ceil(n_rows / rows_per_market))
+
+    space_columns = [c for c in source.columns
+                     if c in ('RBA', 'total_space', 'leasing') or c.endswith('available_space')]
+    rent_columns = [c for c in source.columns if c.endswith('_rent')]
+
+    rng = np.random.default_rng(seed)
+    for k in range(n_markets):
+        base = markets[k % len(markets)]
+        block = source[source['market'] == base].copy()
+        block['market'] = f"{base} {k // len(markets) + 1}"
+
+        size_factor = rng.lognormal(0, 0.5)
+        rent_factor = rng.lognormal(0, 0.2)
+        for col in space_columns:
+            block[col] = (block[col] * size_factor).round()
+        block['leasing'] = (block['leasing'] * rng.lognormal(0, 0.1, size=len(block))).round()
+        # Keep integer columns integer so the schema matches the source file
+        for col in space_columns:
+            if pd.api.types.is_integer_dtype(source[col]):
+                block[col] = block[col].astype(source[col].dtype)
+        for col in rent_columns:
+            block[col] = (block[col] * rent_factor).round(2)
+
+        block.to_csv(output_path, mode='w' if k == 0 else 'a', header=k == 0, index=False)
+
+    print(f"Wrote {n_markets * rows_per_market:,} rows ({n_markets:,} markets) to {output_path}")
+    return n_markets * rows_per_market
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Leases/PAD files for load testing")
+    parser.add_argument("kind", choices=["leases", "pad", "cleaned-pad"])
+    parser.add_argument("rows", type=float, help="number of rows, e.g. 5e6")
+    parser.add_argument("output")
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--chunk-size", type=int, default=250000)
+    args = parser.parse_args()
+
+    if args.kind == "leases":
+        generate_leases(int(args.rows), args.output, seed=args.seed, chunk_size=args.chunk_size)
+    elif args.kind == "pad":
+        generate_pad(int(args.rows), args.output, seed=args.seed)
+    else:
+        generate_pad(int(args.rows), args.output,
+                     source_path=os.path.join(data_dir, "Cleaned PAD.csv"), seed=args.seed)
@@ -0,0 +1,286 @@
+# token_index.py
+#
+# Inverted index from normalized internal_industry and company_name tokens to the
+# Leases.csv rows that contain them, so industry/tenant slices like
+#
+#     Technology AND NOT Media
+#     tenant:amazon OR tenant:google
+#     (legal OR financial) AND NOT tenant:"wells fargo"
+#
+# resolve to row sets without scanning the string columns. Build it once with
+# build_token_index() (or `python code/cli.py index build`); it is saved to
+# data/token_index.npz and rebuilt automatically when Leases.csv changes.
+#
+# Each token's rows are stored as a sorted uint32 row-id list when the token is
+# rare, or as a packed bitmap (np.packbits) when it covers more than 1/32 of the
+# rows, whichever is smaller; the .npz is zlib-compressed on top of that.
+# Queries combine packed bitmaps with bitwise AND/OR/NOT.
+#
+# Matching is by whole token, not substring: "Tech" does not match
+# "Technology", but the prefix query "tech*" does.
+import os
+import re
+import bisect
+import numpy as np
+import pandas as pd
+import loaders
+import engine
+from instrumentation import stage
+
+index_path = os.path.join(loaders.data_dir, "token_index.npz")
+
+# Query field name -> Leases column
+FIELDS = {
+    'industry': 'internal_industry',
+    'tenant': 'company_name',
+}
+DEFAULT_FIELD = 'industry'
+
+# Words dropped from field values; AND/OR/NOT are also query operators
+STOPWORDS = {'and', 'or', 'not', 'of', 'the', '&'}
+
+# Tokens covering more than 1/BITMAP_DENSITY of the rows are stored as bitmaps
+BITMAP_DENSITY = 32
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens of a field value, without stopwords"""
+    return [token for token in re.findall(r"[a-z0-9]+", str(text).lower()) if token not in STOPWORDS]
+
+class TokenIndex:
+    """Token -> row set lookup for one Leases file"""
+
+    def __init__(self, keys, kinds, offsets, row_ids, bitmaps, n_rows, signature=None):
+        self.keys = keys            # sorted "field:token" strings
+        self.kinds = kinds          # 0 = row-id list, 1 = packed bitmap
+        self.offsets = offsets      # (len(keys), 2) start/end into row_ids or bitmaps
+        self.row_ids = row_ids
+        self.bitmaps = bitmaps
+        self.n_rows = int(n_rows)
+        self.signature = signature
+        self._positions = {key: i for i, key in enumerate(keys)}
+
+    def save(self, path=index_path):
+        with stage(f"write {os.path.basename(path)}", "save"):
+            np.savez_compressed(path, keys=self.keys, kinds=self.kinds, offsets=self.offsets,
+                                row_ids=self.row_ids, bitmaps=self.bitmaps,
+                                n_rows=self.n_rows, signature=self.signature)
+
+    @classmethod
+    def load(cls, path=index_path):
+        with stage(f"read {os.path.basename(path)}", "load"):
+            with np.load(path) as data:
+                return cls(data['keys'].tolist(), data['kinds'], data['offsets'],
+                           data['row_ids'], data['bitmaps'], data['n_rows'], data['signature'])
+
+    def _empty(self):
+        return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+
+    def _token_bitmap(self, key):
+        """Packed bitmap of the rows containing one "field:token" key"""
+        i = self._positions.get(key)
+        if i is None:
+            return self._empty()
+        start, end = self.offsets[i]
+        if self.kinds[i]:
+            return self.bitmaps[start:end]
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.row_ids[start:end]] = True
+        return np.packbits(mask)
+
+    def term(self, field, text):
+        """Packed bitmap for one query term; several words must all match, a trailing * is a prefix"""
+        words = tokenize(text.rstrip('*'))
+        if not words:
+            raise ValueError(f"query term {text!r} has no searchable words")
+
+        result = None
+        for n, word in enumerate(words):
+            if text.endswith('*') and n == len(words) - 1:
+                # Every key starting with the prefix is a contiguous run of the sorted keys
+                prefix = f"{field}:{word}"
+                lo = bisect.bisect_left(self.keys, prefix)
+                hi = bisect.bisect_left(self.keys, prefix + '\uffff')
+                bitmap = self._empty()
+                for key in self.keys[lo:hi]:
+                    bitmap |= self._token_bitmap(key)
+            else:
+                bitmap = self._token_bitmap(f"{field}:{word}")
+            result = bitmap.copy() if result is None else result & bitmap
+        return result
+
+    def invert(self, bitmap):
+        """NOT of a packed bitmap, keeping the padding bits past n_rows clear"""
+        inverted = ~bitmap
+        spare = len(inverted) * 8 - self.n_rows
+        if spare:
+            inverted[-1] &= np.uint8(0xFF << spare & 0xFF)
+        return inverted
+
+    def mask(self, query):
+        """Boolean mask over the Leases rows matching a query"""
+        return np.unpackbits(_QueryParser(self, query).parse(), count=self.n_rows).astype(bool)
+
+    def rows(self, query):
+        """Sorted row positions (for .iloc) matching a query"""
+        return np.flatnonzero(self.mask(query))
+
+    def count(self, query):
+        """Number of rows matching a query"""
+        return int(np.unpackbits(_QueryParser(self, query).parse(), count=self.n_rows).sum())
+
+    def vocabulary(self, field=DEFAULT_FIELD):
+        """Indexed tokens of one field with their row counts"""
+        prefix = f"{field}:"
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + '\uffff')
+        counts = [int(np.unpackbits(self._token_bitmap(key), count=self.n_rows).sum())
+                  for key in self.keys[lo:hi]]
+        return pd.Series(counts, index=[key[len(prefix):] for key in self.keys[lo:hi]],
+                         name='rows').sort_values(ascending=False)
+
+class _QueryParser:
+    """Recursive descent over: expr := and (OR and)*; and := not (AND? not)*; not := NOT not | atom"""
+
+    TOKEN = re.compile(r'\s*(?:(\()|(\))|(?:(\w+):)?"([^"]*)"|([^\s()"]+))')
+
+    def __init__(self, index, query):
+        self.index = index
+        self.tokens = []
+        pos = 0
+        query = query.strip()
+        while pos < len(query):
+            match = self.TOKEN.match(query, pos)
+            if not match:
+                raise ValueError(f"can't parse query at {query[pos:]!r}")
+            pos = match.end()
+            self.tokens.append(match.groups())
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _operator(self, name):
+        token = self._peek()
+        return token is not None and token[4] is not None and token[4].upper() == name
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("empty query")
+        result = self._or()
+        if self._peek() is not None:
+            raise ValueError("unbalanced parentheses in query")
+        return result
+
+    def _or(self):
+        result = self._and()
+        while self._operator('OR'):
+            self.pos += 1
+            result = result | self._and()
+        return result
+
+    def _and(self):
+        result = self._not()
+        while True:
+            token = self._peek()
+            if token is None or token[1] is not None or self._operator('OR'):
+                return result
+            if self._operator('AND'):
+                self.pos += 1
+            result = result & self._not()
+
+    def _not(self):
+        if self._operator('NOT'):
+            self.pos += 1
+            return self.index.invert(self._not())
+        return self._atom()
+
+    def _atom(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("query ends where a term was expected")
+        self.pos += 1
+        open_paren, close_paren, quoted_field, quoted, word = token
+        if open_paren:
+            result = self._or()
+            if self._peek() is None or self._peek()[1] is None:
+                raise ValueError("missing ) in query")
+            self.pos += 1
+            return result
+        if close_paren:
+            raise ValueError("unexpected ) in query")
+
+        if quoted is not None:
+            field, text = quoted_field or DEFAULT_FIELD, quoted
+        elif ':' in word:
+            field, text = word.split(':', 1)
+        else:
+            field, text = DEFAULT_FIELD, word
+        if field not in FIELDS:
+            raise ValueError(f"unknown field {field!r}; use one of {sorted(FIELDS)}")
+        return self.index.term(field, text)
+
+def _token_rows(codes, uniques, field):
+    """{"field:token": row ids} from a factorized column, tokenizing each distinct value once"""
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    token_codes = {}
+    for code, value in enumerate(uniques):
+        for token in set(tokenize(value)):
+            token_codes.setdefault(f"{field}:{token}", []).append(code)
+
+    return {key: np.sort(np.concatenate([order[bounds[c]:bounds[c + 1]] for c in value_codes]))
+            for key, value_codes in token_codes.items()}
+
+def build_token_index(path=None, output_path=index_path):
+    """Index the industry and tenant tokens of a Leases file and save it"""
+    path = path or loaders.dataset_path('leases')
+    leases = engine.read_csv(path, usecols=list(FIELDS.values()))
+    n_rows = len(leases)
+
+    with stage("tokenize industry and tenant fields", "transform"):
+        postings = {}
+        for field, column in FIELDS.items():
+            codes, uniques = pd.factorize(leases[column])
+            postings.update(_token_rows(codes, uniques, field))
+
+    with stage("compress postings", "transform"):
+        keys = sorted(postings)
+        kinds = np.zeros(len(keys), dtype=np.uint8)
+        offsets = np.zeros((len(keys), 2), dtype=np.int64)
+        id_parts, bitmap_parts = [], []
+        id_end = bitmap_end = 0
+        for i, key in enumerate(keys):
+            rows = postings[key]
+            if len(rows) * BITMAP_DENSITY > n_rows:
+                mask = np.zeros(n_rows, dtype=bool)
+                mask[rows] = True
+                packed = np.packbits(mask)
+                kinds[i] = 1
+                offsets[i] = bitmap_end, bitmap_end + len(packed)
+                bitmap_end += len(packed)
+                bitmap_parts.append(packed)
+            else:
+                offsets[i] = id_end, id_end + len(rows)
+                id_end += len(rows)
+                id_parts.append(rows.astype(np.uint32))
+
+        index = TokenIndex(keys, kinds, offsets,
+                           np.concatenate(id_parts) if id_parts else np.zeros(0, dtype=np.uint32),
+                           np.concatenate(bitmap_parts) if bitmap_parts else np.zeros(0, dtype=np.uint8),
+                           n_rows, loaders.source_signature(path))
+
+    if output_path:
+        index.save(output_path)
+        print(f"Indexed {len(keys):,} tokens over {n_rows:,} leases into {output_path}")
+    return index
+
+def open_token_index(path=None, index_file=index_path):
+    """Load the saved index, rebuilding it first if Leases.csv changed since it was built"""
+    path = path or loaders.dataset_path('leases')
+    if os.path.exists(index_file):
+        index = TokenIndex.load(index_file)
+        if np.array_equal(index.signature, loaders.source_signature(path)):
+            return index
+        print(f"{path} changed since {index_file} was built; rebuilding")
+    return build_token_index(path, index_file)
@@ -0,0 +1,78 @@
+# trends.py
+#
+# Index grouped time series to a base period, e.g. leasedSF by (market, year,
+# industry) relative to 2018, or rent by (market, year, quarter) relative to the
+# previous quarter. The base value for every row is found with one join on
+# (group keys, base period) instead of re-filtering the frame per row, so it is
+# linear in the number of rows whatever the grouping depth.
+import pandas as pd
+from engine import groupby_agg
+
+def _as_list(cols):
+    if cols is None:
+        return []
+    return [cols] if isinstance(cols, str) else list(cols)
+
+def _period_index(frame, time):
+    """Sorted unique periods, as an Index (one time column) or MultiIndex (several)"""
+    periods = frame[time].drop_duplicates().dropna().sort_values(time)
+    if len(time) == 1:
+        return pd.Index(periods[time[0]])
+    return pd.MultiIndex.from_frame(periods)
+
+def _row_periods(frame, time):
+    if len(time) == 1:
+        return pd.Index(frame[time[0]])
+    return pd.MultiIndex.from_frame(frame[time])
+
+def index_to_base(df, value, time, by=None, base=None, rolling=None, agg=None,
+                  scale=1.0, output=None):
+    """Divide value by its value in a base period within each group
+
+    time     period column, or list of columns (e.g. ['year', 'quarter'])
+    by       group column(s); None indexes a single series
+    base     fixed base period (2018, or (2018, 'Q1') for several time columns);
+             None uses the first period present in each group
+    rolling  base is the period this many periods earlier (1 = period over period)
+    agg      aggregate value over by + time first ('sum', 'mean', ...) for
+             frames with several rows per group and period, e.g. raw leases
+    scale    multiply the index, e.g. 100 for "2018 = 100"
+
+    Returns a tidy frame with by + time, value, base_<value> and the index column
+    (output, default "<value>_index"). Groups without a base value get NaN.
+    """
+    time = _as_list(time)
+    by = _as_list(by)
+    output = output or f"{value}_index"
+    if base is not None and rolling is not None:
+        raise ValueError("pass either base or rolling, not both")
+
+    if agg is not None:
+        frame = groupby_agg(df, by + time, {value: agg})
+    else:
+        frame = df[by + time + [value]].reset_index(drop=True)
+        if frame.duplicated(by + time).any():
+            raise ValueError(f"several rows per {by + time}; pass agg= to aggregate them first")
+
+    periods = _period_index(frame, time)
+    ordinal = pd.Series(periods.get_indexer(_row_periods(frame, time)), index=frame.index)
+
+    if rolling is not None:
+        base_ordinal = ordinal - rolling
+    elif base is not None:
+        if base not in periods:
+            raise ValueError(f"base period {base!r} is not in the data")
+        base_ordinal = pd.Series(periods.get_loc(base), index=frame.index)
+    elif by:
+        base_ordinal = ordinal.groupby([frame[col] for col in by], dropna=False).transform('min')
+    else:
+        base_ordinal = pd.Series(ordinal.min(), index=frame.index)
+
+    # One lookup table of (group, period) -> value, joined back on the base period
+    base_column = f"base_{value}"
+    lookup = frame[by + [value]].assign(_period=ordinal).rename(columns={value: base_column})
+    keys = frame[by].assign(_period=base_ordinal)
+    frame[base_column] = keys.merge(lookup, on=by + ['_period'], how='left')[base_column].to_numpy()
+
+    frame[output] = frame[value] / frame[base_column] * scale
+    return frame
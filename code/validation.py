@@ -0,0 +1,418 @@
+# validation.py
+#
+# Declarative checks over every dataset, evaluated as vectorized column
+# operations, with a JSON report (data/validation_report.json).
+#
+# Each rule is a dict in RULES[dataset]:
+#
+#   range       column values within [min, max]
+#   allowed     column values in a fixed set (catches e.g. quarter 1 vs 'Q1')
+#   not_null    column has no missing values
+#   populated   column is not entirely missing in any group (e.g. a whole year)
+#   unique      no two rows share the key columns
+#   continuous  every series (by) has every period between its first and last
+#   coverage    every value of column appears in another dataset's column
+#
+# Rules default to severity 'error'; 'warning' rules are reported but don't
+# fail the run. Datasets whose file isn't present are reported as skipped.
+#
+# Runs are incremental, with the state kept in data/validation_state.npz. A
+# dataset whose file, and the files its coverage rules point at, have the same
+# (size, mtime) as on the last run, and whose rules haven't changed, isn't
+# loaded at all: its previous results are reported again. In a dataset that
+# did change, row-level rules (range, allowed, not_null) are only evaluated on
+# rows whose hash wasn't seen before, using the kept hashes of each row's
+# checked columns and of failing rows. The whole-dataset rules only need key
+# columns and are re-run in full.
+import os
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import loaders
+from instrumentation import stage, instrument
+
+report_path = os.path.join(loaders.data_dir, "validation_report.json")
+state_path = os.path.join(loaders.data_dir, "validation_state.npz")
+
+QUARTERS = ['Q1', 'Q2', 'Q3', 'Q4']
+PAD_KEY = ['year', 'quarter', 'market', 'internal_class']
+PAD_RENTS = ['internal_class_rent', 'overall_rent', 'direct_internal_class_rent', 'direct_overall_rent',
+             'sublet_internal_class_rent', 'sublet_overall_rent']
+PAD_PROPORTIONS = ['availability_proportion', 'direct_availability_proportion', 'sublet_availability_proportion']
+PAD_DIRECT_SUBLET = ['direct_available_space', 'direct_availability_proportion', 'direct_internal_class_rent',
+                     'direct_overall_rent', 'sublet_available_space', 'sublet_availability_proportion',
+                     'sublet_internal_class_rent', 'sublet_overall_rent']
+CLEANED_PAD_RENTS = ['internal_class_rent', 'direct_internal_class_rent', 'sublet_internal_class_rent']
+
+RULES = {
+    'leases': [
+        {'rule': 'range', 'column': 'year', 'min': 2018, 'max': 2024},
+        {'rule': 'allowed', 'column': 'quarter', 'values': QUARTERS},
+        {'rule': 'range', 'column': 'monthsigned', 'min': 1, 'max': 12},
+        {'rule': 'allowed', 'column': 'internal_class', 'values': ['A', 'O']},
+        {'rule': 'range', 'column': 'leasedSF', 'min': 1},
+        {'rule': 'not_null', 'column': ['market', 'building_id', 'leasedSF']},
+        {'rule': 'range', 'column': ['availability_proportion', 'direct_availability_proportion',
+                                     'sublet_availability_proportion'], 'min': 0, 'max': 1},
+        {'rule': 'coverage', 'column': 'market', 'reference': 'market_locations', 'severity': 'warning'},
+    ],
+    'price_availability': [
+        {'rule': 'range', 'column': 'year', 'min': 2018, 'max': 2024},
+        {'rule': 'allowed', 'column': 'quarter', 'values': QUARTERS},
+        {'rule': 'allowed', 'column': 'internal_class', 'values': ['A', 'O']},
+        {'rule': 'range', 'column': PAD_PROPORTIONS, 'min': 0, 'max': 1},
+        {'rule': 'range', 'column': PAD_RENTS, 'min': 0, 'max': 250},
+        {'rule': 'range', 'column': ['RBA', 'available_space', 'leasing'], 'min': 0},
+        {'rule': 'not_null', 'column': PAD_DIRECT_SUBLET, 'severity': 'warning'},
+        {'rule': 'populated', 'column': PAD_DIRECT_SUBLET, 'by': 'year', 'severity': 'warning'},
+        {'rule': 'unique', 'column': PAD_KEY},
+        {'rule': 'continuous', 'time': ['year', 'quarter'], 'freq': 'quarter', 'by': ['market', 'internal_class']},
+    ],
+    'cleaned_pad': [
+        {'rule': 'range', 'column': 'year', 'min': 2019, 'max': 2024},
+        {'rule': 'allowed', 'column': 'quarter', 'values': QUARTERS},
+        {'rule': 'allowed', 'column': 'is_premium_quality', 'values': [0, 1]},
+        {'rule': 'range', 'column': CLEANED_PAD_RENTS, 'min': 0, 'max': 250},
+        {'rule': 'not_null', 'column': CLEANED_PAD_RENTS, 'severity': 'warning'},
+        {'rule': 'unique', 'column': ['year', 'quarter', 'market', 'is_premium_quality']},
+        {'rule': 'continuous', 'time': ['year', 'quarter'], 'freq': 'quarter', 'by': ['market', 'is_premium_quality']},
+        {'rule': 'coverage', 'column': 'market', 'reference': 'price_availability'},
+    ],
+    'occupancy': [
+        {'rule': 'allowed', 'column': 'quarter', 'values': QUARTERS},
+        {'rule': 'range', 'column': ['occupancy_proportion', 'starting_occupancy_proportion',
+                                     'avg_occupancy_proportion'], 'min': 0, 'max': 1},
+        {'rule': 'unique', 'column': ['year', 'quarter', 'market']},
+        {'rule': 'continuous', 'time': ['year', 'quarter'], 'freq': 'quarter', 'by': 'market', 'severity': 'warning'},
+        {'rule': 'coverage', 'column': 'market', 'reference': 'leases', 'severity': 'warning'},
+    ],
+    'unemployment': [
+        {'rule': 'allowed', 'column': 'quarter', 'values': QUARTERS},
+        {'rule': 'range', 'column': 'month', 'min': 1, 'max': 12},
+        {'rule': 'range', 'column': 'unemployment_rate', 'min': 0, 'max': 100},
+        {'rule': 'unique', 'column': ['year', 'month', 'state']},
+        {'rule': 'continuous', 'time': ['year', 'month'], 'freq': 'month', 'by': 'state'},
+    ],
+    'inflation': [
+        {'rule': 'allowed', 'column': 'quarter', 'values': [1, 2, 3, 4]},
+        {'rule': 'unique', 'column': ['year', 'quarter']},
+        {'rule': 'continuous', 'time': ['year', 'quarter'], 'freq': 'quarter'},
+    ],
+    'address_info': [
+        {'rule': 'range', 'column': 'latitude', 'min': 17, 'max': 72, 'severity': 'warning'},
+        {'rule': 'range', 'column': 'longitude', 'min': -180, 'max': -60, 'severity': 'warning'},
+        {'rule': 'not_null', 'column': ['latitude', 'longitude'], 'severity': 'warning'},
+        {'rule': 'coverage', 'column': 'id', 'reference': 'leases', 'reference_column': 'building_id'},
+    ],
+}
+
+ROW_RULES = {'range', 'allowed', 'not_null'}
+
+# Failing rows/groups listed per rule in the report, identified by these columns
+MAX_EXAMPLES = 5
+EXAMPLE_KEYS = ['year', 'quarter', 'month', 'market', 'state', 'internal_class', 'is_premium_quality', 'id']
+
+def _as_list(cols):
+    if cols is None:
+        return []
+    return [cols] if isinstance(cols, (str, int)) else list(cols)
+
+def _expand(rules):
+    """One rule per column for row-level rules given a list of columns"""
+    expanded = []
+    for rule in rules:
+        if rule['rule'] in ROW_RULES or rule['rule'] == 'populated':
+            for column in _as_list(rule['column']):
+                expanded.append({**rule, 'column': column})
+        else:
+            expanded.append(rule)
+    return expanded
+
+def _rule_columns(rule):
+    return _as_list(rule.get('column')) + _as_list(rule.get('time')) + _as_list(rule.get('by'))
+
+def _rule_key(rule):
+    return json.dumps(rule, sort_keys=True, default=str)
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+def _records(frame):
+    return [{col: _json_value(value) for col, value in row.items()} for row in frame.to_dict(orient='records')]
+
+def _examples(df, mask, columns):
+    return _records(df.loc[mask, columns].head(MAX_EXAMPLES))
+
+# Row-level checks: boolean mask of failing rows
+
+def _check_range(df, rule):
+    values = df[rule['column']]
+    failed = pd.Series(False, index=df.index)
+    if 'min' in rule:
+        failed |= values < rule['min']
+    if 'max' in rule:
+        failed |= values > rule['max']
+    return failed & values.notna()
+
+def _check_allowed(df, rule):
+    values = df[rule['column']]
+    return values.notna() & ~values.isin(rule['values'])
+
+def _check_not_null(df, rule):
+    return df[rule['column']].isna()
+
+ROW_CHECKS = {
+    'range': _check_range,
+    'allowed': _check_allowed,
+    'not_null': _check_not_null,
+}
+
+# Whole-dataset checks: (checked, failed, examples)
+
+def _check_unique(df, rule, frames):
+    columns = _as_list(rule['column'])
+    duplicated = df.duplicated(columns, keep=False)
+    return len(df), int(duplicated.sum()), _examples(df, duplicated, columns)
+
+def _check_coverage(df, rule, frames):
+    reference = frames.get(rule['reference'])
+    if reference is None:
+        return None
+    column = rule['column']
+    known = reference[rule.get('reference_column', column)].dropna().unique()
+    values = df[column].dropna().unique()
+    missing = values[~pd.Series(values).isin(known).to_numpy()]
+    return len(values), len(missing), [{column: _json_value(value)} for value in sorted(missing)[:MAX_EXAMPLES]]
+
+def _check_populated(df, rule, frames):
+    by = _as_list(rule['by'])
+    present = df[rule['column']].notna().groupby([df[col] for col in by]).any()
+    empty = present[~present]
+    return len(present), len(empty), _records(empty.head(MAX_EXAMPLES).index.to_frame(index=False))
+
+def _period_ordinal(df, time, freq):
+    """Integer period number, so consecutive periods differ by 1"""
+    year = df[time[0]].astype(int)
+    if freq == 'year':
+        return year
+    sub = df[time[1]]
+    if sub.dtype == object:
+        sub = pd.to_numeric(sub.str.lstrip('Q'), errors='coerce')
+    per_year = 4 if freq == 'quarter' else 12
+    return year * per_year + sub - 1
+
+def _period_label(ordinal, per_year):
+    if per_year == 1:
+        return str(ordinal)
+    return f"{ordinal // per_year} {'Q' if per_year == 4 else 'M'}{ordinal % per_year + 1}"
+
+def _check_continuous(df, rule, frames):
+    time = _as_list(rule['time'])
+    by = _as_list(rule.get('by'))
+    per_year = {'year': 1, 'quarter': 4, 'month': 12}[rule.get('freq', 'year')]
+    periods = df.assign(_period=_period_ordinal(df, time, rule.get('freq', 'year')))
+    periods = periods.dropna(subset=['_period'])
+
+    if by:
+        spans = periods.groupby(by)['_period'].agg(['min', 'max', 'nunique'])
+    else:
+        spans = pd.DataFrame({'min': [periods['_period'].min()], 'max': [periods['_period'].max()],
+                              'nunique': [periods['_period'].nunique()]})
+    spans['missing'] = spans['max'] - spans['min'] + 1 - spans['nunique']
+    gaps = spans[spans['missing'] > 0]
+
+    # Name the missing periods for the first few series with gaps
+    examples = _records(gaps.head(MAX_EXAMPLES).reset_index()[by]) if by else [{}]
+    for example in examples[:len(gaps)]:
+        series = periods
+        for col, value in example.items():
+            series = series[series[col] == value]
+        seen = set(series['_period'])
+        missing = [p for p in range(int(series['_period'].min()), int(series['_period'].max()) + 1) if p not in seen]
+        example['missing'] = [_period_label(p, per_year) for p in missing[:8]]
+    return len(spans), int(gaps['missing'].sum()), examples[:len(gaps)]
+
+SET_CHECKS = {
+    'unique': _check_unique,
+    'coverage': _check_coverage,
+    'populated': _check_populated,
+    'continuous': _check_continuous,
+}
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}, {}
+    with np.load(path) as data:
+        index = json.loads(str(data['index']))
+        arrays = {name: data[name] for name in data.files if name != 'index'}
+    return index, arrays
+
+def _save_state(path, index, arrays):
+    np.savez_compressed(path, index=json.dumps(index, default=_json_value), **arrays)
+
+def _signatures(rules, name):
+    """(size, mtime) of a dataset's file and of the files its coverage rules read, None if it's missing"""
+    inputs = [name] + [rule['reference'] for rule in rules.get(name, []) if rule['rule'] == 'coverage']
+    signatures = {}
+    for dataset in inputs:
+        path = loaders.dataset_path(dataset)
+        signatures[dataset] = list(loaders.source_signature(path)) if os.path.exists(path) else None
+    return signatures
+
+def _unchanged(previous, signatures, rule_keys):
+    """Whether a dataset's previous results still hold: same files and same rules"""
+    return (signatures[next(iter(signatures))] is not None and previous.get('signatures') == signatures
+            and previous.get('rule_keys') == rule_keys and 'results' in previous)
+
+def _load_frames(rules, names):
+    """Each present dataset, reading only the columns its rules (and coverage rules pointing at it) use"""
+    columns = {}
+    for name in names:
+        for rule in rules.get(name, []):
+            columns.setdefault(name, set()).update(_rule_columns(rule))
+            if rule['rule'] == 'coverage':
+                columns.setdefault(rule['reference'], set()).add(rule.get('reference_column', rule['column']))
+
+    frames = {}
+    for name, needed in columns.items():
+        if not os.path.exists(loaders.dataset_path(name)):
+            continue
+        if name == 'market_locations':
+            frames[name] = loaders.load_market_locations()
+        else:
+            header = loaders.load_dataset(name, nrows=0).columns
+            frames[name] = loaders.load_dataset(name, usecols=[col for col in header if col in needed])
+    return frames
+
+def _evaluate_row_rule(df, rule, hashes, new_rows, previous_failures):
+    """Failing-row mask, re-using the previous run's result for rows seen before"""
+    if previous_failures is None:
+        return ROW_CHECKS[rule['rule']](df, rule).to_numpy()
+    failed = np.isin(hashes, previous_failures)
+    if new_rows.any():
+        failed[new_rows] = ROW_CHECKS[rule['rule']](df[new_rows], rule).to_numpy()
+    return failed
+
+@instrument("analysis")
+def validate(datasets=None, rules=RULES, output_path=report_path, state_file=state_path, incremental=True):
+    """Run the rules over every present dataset, write the JSON report and return it"""
+    names = datasets or list(rules)
+    index, arrays = _load_state(state_file) if incremental else ({}, {})
+    new_index, new_arrays = {}, {}
+
+    # Datasets whose files and rules are as on the last run aren't loaded
+    signatures = {name: _signatures(rules, name) for name in names}
+    rule_keys = {name: [_rule_key(rule) for rule in _expand(rules.get(name, []))] for name in names}
+    unchanged = [name for name in names if _unchanged(index.get(name, {}), signatures[name], rule_keys[name])]
+    with stage("load datasets for validation", "load"):
+        frames = _load_frames(rules, [name for name in names if name not in unchanged])
+
+    report = {'generated': datetime.now().isoformat(timespec='seconds'), 'datasets': {}, 'results': []}
+    for name in names:
+        dataset_rules = _expand(rules.get(name, []))
+        if name in unchanged:
+            previous = index[name]
+            report['datasets'][name] = {'status': 'checked', 'rows': previous['rows'], 'changed_rows': 0,
+                                        'unchanged': True}
+            report['results'].extend(previous['results'])
+            continue
+        df = frames.get(name)
+        if df is None:
+            report['datasets'][name] = {'status': 'skipped', 'reason': f"{loaders.dataset_path(name)} not found"}
+            for rule in dataset_rules:
+                report['results'].append({'dataset': name, **rule, 'status': 'skipped'})
+            continue
+
+        with stage(f"validate {name}", "transform"):
+            hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+            previous = index.get(name, {})
+            seen = arrays.get(previous.get('hashes'))
+            new_rows = ~np.isin(hashes, seen) if seen is not None else np.ones(len(df), dtype=bool)
+            new_index[name] = {'hashes': f"{name}.hashes", 'rules': {}, 'signatures': signatures[name],
+                               'rule_keys': rule_keys[name], 'rows': len(df)}
+            new_arrays[f"{name}.hashes"] = np.unique(hashes)
+            report['datasets'][name] = {'status': 'checked', 'rows': len(df), 'changed_rows': int(new_rows.sum())}
+
+            for i, rule in enumerate(dataset_rules):
+                key = _rule_key(rule)
+                result = {'dataset': name, **rule, 'severity': rule.get('severity', 'error')}
+                if rule['rule'] in ROW_RULES:
+                    previous_failures = arrays.get(previous.get('rules', {}).get(key)) if seen is not None else None
+                    failed = _evaluate_row_rule(df, rule, hashes, new_rows, previous_failures)
+                    array_name = f"{name}.{i}"
+                    new_index[name]['rules'][key] = array_name
+                    new_arrays[array_name] = np.unique(hashes[failed])
+                    columns = [col for col in EXAMPLE_KEYS + [rule['column']] if col in df.columns]
+                    result.update(checked=len(df), failed=int(failed.sum()),
+                                  examples=_examples(df, failed, list(dict.fromkeys(columns))))
+                else:
+                    outcome = SET_CHECKS[rule['rule']](df, rule, frames)
+                    if outcome is None:
+                        result['status'] = 'skipped'
+                        report['results'].append(result)
+                        continue
+                    checked, failed_count, examples = outcome
+                    result.update(checked=checked, failed=failed_count, examples=examples)
+                result['status'] = 'pass' if result['failed'] == 0 else (
+                    'fail' if result['severity'] == 'error' else 'warn')
+                report['results'].append(result)
+            new_index[name]['results'] = [result for result in report['results'] if result['dataset'] == name]
+
+    statuses = pd.Series([result['status'] for result in report['results']], dtype=object)
+    report['summary'] = {status: int((statuses == status).sum()) for status in ('pass', 'warn', 'fail', 'skipped')}
+
+    if output_path:
+        with stage(f"write {os.path.basename(output_path)}", "save"):
+            with open(output_path, "w") as f:
+                json.dump(report, f, indent=2, default=_json_value)
+    if state_file:
+        # Keep the state of datasets that weren't checked or were unchanged this time
+        kept = {name: entry for name, entry in index.items() if name not in new_index}
+        kept_arrays = {array: arrays[array] for entry in kept.values()
+                       for array in [entry['hashes']] + list(entry['rules'].values())}
+        _save_state(state_file, {**kept, **new_index}, {**kept_arrays, **new_arrays})
+    return report
+
+def _describe_rule(result):
+    column = result.get('column', result.get('time'))
+    if isinstance(column, list):
+        column = ", ".join(column)
+    return f"{result['rule']} {column}"
+
+def print_report(report):
+    """Readable summary of a validation report"""
+    print("\n===== DATA VALIDATION =====")
+    for name, info in report['datasets'].items():
+        if info['status'] == 'skipped':
+            print(f"- {name}: skipped ({info['reason']})")
+        elif info.get('unchanged'):
+            print(f"- {name}: {info['rows']:,} rows (unchanged since the last run)")
+        else:
+            print(f"- {name}: {info['rows']:,} rows ({info['changed_rows']:,} new or changed)")
+
+    problems = [result for result in report['results'] if result['status'] in ('fail', 'warn')]
+    if problems:
+        print("\nProblems found:")
+    for result in problems:
+        print(f"- [{result['status'].upper()}] {result['dataset']}: {_describe_rule(result)} "
+              f"({result['failed']:,} of {result['checked']:,})")
+        for example in result['examples'][:3]:
+            print(f"    {example}")
+
+    summary = report['summary']
+    print(f"\n{summary['pass']} passed, {summary['warn']} warnings, {summary['fail']} failed, "
+          f"{summary['skipped']} skipped")
+
+def main():
+    report = validate()
+    print_report(report)
+    print(f"\nReport written to {report_path}")
+    return report
+
+if __name__ == "__main__":
+    main()
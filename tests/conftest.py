@@ -0,0 +1,5 @@
+# The modules in code/ import each other by bare name, as when run from code/
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
@@ -0,0 +1,95 @@
+# Both engines must load the same data and give the same aggregations
+import numpy as np
+import pandas as pd
+import pytest
+import engine
+from engine import groupby_agg, frames_equal
+
+CSV = """year,quarter,market,internal_class,leasedSF,rent,company_name
+2019,Q1,Austin,A,1200,45.5,Acme Corp
+2019,Q1,Austin,O,800,,Beta LLC
+2019,Q2,Boston,A,15000,60.25,"Gamma, Inc."
+2019,Q2,,A,300,30.0,Delta
+2020,Q1,Boston,O,,52.0,
+2020,Q1,Austin,A,2500,47.75,Acme Corp
+2020,Q2,Chicago,,640,38.5,Epsilon
+2020,Q2,Chicago,O,900,39.0,Zeta
+"""
+
+AGGREGATIONS = [
+    (['year', 'quarter'], {'leasedSF': 'sum', 'rent': 'mean'}),
+    ('market', {'leasedSF': ['sum', 'count', 'min', 'max'], 'rent': ['mean', 'std']}),
+    (['market', 'internal_class'], {'rent': 'var', 'company_name': 'nunique'}),
+    ('internal_class', {'leasedSF': 'mean'}),
+]
+
+def engine_params():
+    # The arrow engine needs pyarrow; without it only pandas is tested
+    return [pytest.param(name, marks=pytest.mark.skipif(name == 'arrow' and not engine.arrow_available(),
+                                                        reason="pyarrow is not installed"))
+            for name in engine.ENGINES]
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "leases.csv"
+    path.write_text(CSV)
+    return str(path)
+
+@pytest.mark.parametrize('name', engine_params())
+def test_read_csv_matches_pandas(csv_path, name):
+    df = engine.read_csv(csv_path, engine=name)
+    expected = pd.read_csv(csv_path)
+    same, message = frames_equal(df, expected)
+    assert same, message
+    # Missing strings stay missing, not "None" or ""
+    loaded = engine.to_numpy_backed(df)
+    assert loaded['market'].isna().sum() == 1
+    assert loaded['company_name'].iloc[2] == "Gamma, Inc."
+
+@pytest.mark.parametrize('name', engine_params())
+def test_read_csv_usecols(csv_path, name):
+    df = engine.read_csv(csv_path, engine=name, usecols=['market', 'leasedSF'])
+    same, message = frames_equal(df, pd.read_csv(csv_path, usecols=['market', 'leasedSF']))
+    assert same, message
+
+@pytest.mark.parametrize('name', engine_params())
+@pytest.mark.parametrize('by, agg', AGGREGATIONS)
+def test_groupby_agg_matches_pandas(csv_path, name, by, agg):
+    df = engine.read_csv(csv_path, engine=name)
+    result = groupby_agg(df, by, agg, engine=name)
+    expected = pd.read_csv(csv_path).groupby(by, sort=True).agg(agg).reset_index()
+    same, message = frames_equal(result, expected)
+    assert same, message
+
+@pytest.mark.parametrize('name', engine_params())
+def test_groupby_agg_drops_missing_keys(csv_path, name):
+    df = engine.read_csv(csv_path, engine=name)
+    result = groupby_agg(df, 'market', {'leasedSF': 'sum'}, engine=name)
+    assert list(result['market']) == ['Austin', 'Boston', 'Chicago']
+    assert not result['market'].isna().any()
+    # A group whose values are all missing sums to 0, as in pandas
+    result = groupby_agg(df, ['market', 'year'], {'leasedSF': 'sum'}, engine=name)
+    boston_2020 = result[(result['market'] == 'Boston') & (result['year'] == 2020)]['leasedSF']
+    assert boston_2020.tolist() == [0]
+
+@pytest.mark.parametrize('name', engine_params())
+def test_results_are_numpy_backed(csv_path, name):
+    df = engine.read_csv(csv_path, engine=name)
+    result = groupby_agg(df, 'market', {'rent': 'mean'}, engine=name)
+    assert not any(isinstance(dtype, pd.ArrowDtype) for dtype in result.dtypes)
+    assert result['rent'].dtype == np.float64
+
+@pytest.mark.parametrize('name', engine_params())
+def test_contains_treats_missing_as_no_match(csv_path, name):
+    df = engine.read_csv(csv_path, engine=name)
+    matches = engine.contains(df['company_name'], "acme", case=False)
+    assert matches.tolist() == [True, False, False, False, False, True, False, False]
+
+def test_engines_agree(csv_path):
+    if not engine.arrow_available():
+        pytest.skip("pyarrow is not installed")
+    for by, agg in AGGREGATIONS:
+        results = [groupby_agg(engine.read_csv(csv_path, engine=name), by, agg, engine=name)
+                   for name in engine.ENGINES]
+        same, message = frames_equal(*results)
+        assert same, message
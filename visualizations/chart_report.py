@@ -0,0 +1,125 @@
+# chart_report.py
+#
+# Renders a whole chart batch into one report file instead of one PNG per chart:
+#
+#     python code/cli.py charts stacked-bars --report visualizations/market_book.pdf
+#
+# A .pdf report is a multi-page PDF (one page per chart); a .html report is one
+# page of inline SVGs. Either way the file is opened once, every chart shares
+# one style, fonts are loaded once for the batch, and pages are written as
+# vectors at the figure's own size, so there is no 300 dpi rasterizing, PNG
+# encoding or tight-bbox pass per chart. The first page is a table of contents
+# by market and quality; a chart that fails is replaced by a placeholder page so
+# the page numbers in the contents stay right.
+import io
+import html
+import os
+import sys
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from instrumentation import stage
+
+# Applied to every page of a report
+REPORT_STYLE = {
+    'pdf.compression': 6,
+    'pdf.fonttype': 3,        # glyph subsets are collected over all pages and written once at close
+    'svg.fonttype': 'none',   # keep text as text instead of paths
+    'figure.max_open_warning': 0,
+}
+
+FORMATS = {'.pdf': 'pdf', '.html': 'html', '.htm': 'html'}
+
+class ChartReport:
+    """Multi-page chart report with a table of contents, used as a context manager
+
+    entries are the (section, label) pairs the batch will add, in order, e.g.
+    ('Austin', 'Standard'); they fill in the contents before any chart is drawn.
+    """
+
+    def __init__(self, path, title, entries, style=REPORT_STYLE):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise ValueError(f"report must be one of {sorted(FORMATS)}, not {path!r}")
+        self.path = path
+        self.format = FORMATS[extension]
+        self.title = title
+        self.entries = list(entries)
+        self.style = style
+        self.pages = 0
+
+    def __enter__(self):
+        self._style = mpl.rc_context(self.style)
+        self._style.__enter__()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.format == 'pdf':
+            self._pdf = PdfPages(self.path, metadata={'Title': self.title})
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>{html.escape(self.title)}</title>"
+                             "<style>body{background:#141414;color:white;font-family:sans-serif}"
+                             "a{color:#8BE9FD}svg{display:block;margin:2em auto;max-width:100%;height:auto}</style>"
+                             "</head><body>\n")
+        self._contents()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.format == 'pdf':
+            self._pdf.close()
+        else:
+            self._file.write("</body></html>\n")
+            self._file.close()
+        self._style.__exit__(*exc_info)
+        print(f"Wrote {self.pages} pages to {self.path}")
+        return False
+
+    def _contents(self):
+        """Table of contents: one line per section with the page of each of its charts"""
+        sections = {}
+        for page, (section, label) in enumerate(self.entries, start=2):
+            sections.setdefault(section, []).append((label, page))
+
+        if self.format == 'html':
+            items = "".join(
+                f"<li>{html.escape(section)}: "
+                + ", ".join(f"<a href='#page-{page}'>{html.escape(label)}</a>" for label, page in charts)
+                + "</li>" for section, charts in sections.items())
+            self._file.write(f"<h1>{html.escape(self.title)}</h1>\n<ol>{items}</ol>\n")
+            self.pages += 1
+            return
+
+        fig = plt.figure(figsize=(8.5, 11))
+        fig.text(0.08, 0.95, self.title, fontsize=16, fontweight='bold', va='top')
+        line_height = min(0.03, 0.85 / max(len(sections), 1))
+        for i, (section, charts) in enumerate(sections.items()):
+            y = 0.9 - i * line_height
+            fig.text(0.08, y, section, fontsize=10, va='top')
+            fig.text(0.5, y, ",  ".join(f"{label} p. {page}" for label, page in charts), fontsize=10, va='top')
+        self._pdf.savefig(fig)
+        plt.close(fig)
+        self.pages += 1
+
+    def add(self, fig=None):
+        """Write a figure (default: the current one) as the next page and close it"""
+        fig = fig or plt.gcf()
+        with stage("write report page", "save"):
+            if self.format == 'pdf':
+                self._pdf.savefig(fig, facecolor=fig.get_facecolor())
+            else:
+                svg = io.StringIO()
+                fig.savefig(svg, format='svg', facecolor=fig.get_facecolor())
+                # Drop the XML prolog so the SVG can sit inline in the page
+                body = svg.getvalue()
+                self._file.write(f"<div id='page-{self.pages + 1}'>{body[body.index('<svg'):]}</div>\n")
+        plt.close(fig)
+        self.pages += 1
+
+    def skip(self, message):
+        """Placeholder page for a chart that couldn't be drawn"""
+        fig = plt.figure(figsize=(8.5, 2))
+        fig.text(0.5, 0.5, message, ha='center', va='center', fontsize=12)
+        self.add(fig)
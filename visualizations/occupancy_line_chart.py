@@ -2,73 +2,104 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import sys
 
-# File path 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from instrumentation import stage, instrument
+
+# File path
 file_path = 'data/Major Market Occupancy Data.csv'
 
-# Read the CSV file
-df = pd.read_csv(file_path)
+def load_data():
+    """Load the occupancy data and print a short summary"""
+    # Read the CSV file
+    with stage("read Major Market Occupancy Data.csv", "load"):
+        df = pd.read_csv(file_path)
 
-# Print information about the data for verification
-print(f"Data shape: {df.shape}")
-print(f"Columns: {df.columns.tolist()}")
-print(f"Number of markets (cities): {df['market'].nunique()}")
-print(f"Years range: {df['year'].min()} to {df['year'].max()}")
+    # Print information about the data for verification
+    print(f"Data shape: {df.shape}")
+    print(f"Columns: {df.columns.tolist()}")
+    print(f"Number of markets (cities): {df['market'].nunique()}")
+    print(f"Years range: {df['year'].min()} to {df['year'].max()}")
 
-# Create a time label for x-axis by combining year and quarter
-df['time_label'] = df['year'].astype(str) + ' Q' + df['quarter'].astype(str)
+    return df
 
-# Sort the data by year and quarter to ensure proper timeline
-df = df.sort_values(['year', 'quarter'])
+def prepare_timeline(df):
+    """Add time labels and sort the data into timeline order"""
+    # Create a time label for x-axis by combining year and quarter
+    df['time_label'] = df['year'].astype(str) + ' Q' + df['quarter'].astype(str)
 
-# Get unique time labels for x-axis
-time_labels = df['time_label'].unique()
+    # Sort the data by year and quarter to ensure proper timeline
+    df = df.sort_values(['year', 'quarter'])
 
-# Create a figure with a larger size for better readability
-plt.figure(figsize=(14, 8))
+    return df
 
-# Plot a line for each city with different colors
-markets = df['market'].unique()
-colors = plt.cm.tab10(np.linspace(0, 1, len(markets)))  # Generate distinct colors
+def plot_occupancy(df):
+    """Draw one occupancy line per market and return the figure"""
+    # Get unique time labels for x-axis
+    time_labels = df['time_label'].unique()
 
-for i, market in enumerate(markets):
-    market_data = df[df['market'] == market]
-    plt.plot(
-        market_data['time_label'], 
-        market_data['starting_occupancy_proportion'] * 100,  # Convert to percentage
-        marker='o',
-        linestyle='-',
-        color=colors[i],
-        linewidth=2,
-        markersize=5,
-        label=market
-    )
+    # Create a figure with a larger size for better readability
+    fig = plt.figure(figsize=(14, 8))
 
-# Set chart title and labels
-plt.title('Occupancy Percentage by City Over Time', fontsize=16)
-plt.xlabel('Time Period', fontsize=12)
-plt.ylabel('Occupancy Percentage (%)', fontsize=12)
+    # Plot a line for each city with different colors
+    markets = df['market'].unique()
+    colors = plt.cm.tab10(np.linspace(0, 1, len(markets)))  # Generate distinct colors
 
-# Add a grid for better readability
-plt.grid(True, linestyle='--', alpha=0.7)
+    for i, market in enumerate(markets):
+        market_data = df[df['market'] == market]
+        plt.plot(
+            market_data['time_label'],
+            market_data['starting_occupancy_proportion'] * 100,  # Convert to percentage
+            marker='o',
+            linestyle='-',
+            color=colors[i],
+            linewidth=2,
+            markersize=5,
+            label=market
+        )
 
-# Format x-axis labels to be vertical if there are many time periods
-if len(time_labels) > 8:
-    plt.xticks(rotation=90)
+    # Set chart title and labels
+    plt.title('Occupancy Percentage by City Over Time', fontsize=16)
+    plt.xlabel('Time Period', fontsize=12)
+    plt.ylabel('Occupancy Percentage (%)', fontsize=12)
 
-# Add a legend with the city names
-plt.legend(title='Cities', bbox_to_anchor=(1.05, 1), loc='upper left')
+    # Add a grid for better readability
+    plt.grid(True, linestyle='--', alpha=0.7)
 
-# Adjust layout to make room for the legend
-plt.tight_layout()
+    # Format x-axis labels to be vertical if there are many time periods
+    if len(time_labels) > 8:
+        plt.xticks(rotation=90)
 
-# Create directory if it doesn't exist
-import os
-output_dir = os.path.join('visualizations', 'pngs')
-os.makedirs(output_dir, exist_ok=True)
+    # Add a legend with the city names
+    plt.legend(title='Cities', bbox_to_anchor=(1.05, 1), loc='upper left')
+
+    # Adjust layout to make room for the legend
+    plt.tight_layout()
+
+    return fig
+
+@instrument("chart")
+def main():
+    df = load_data()
+
+    with stage("build occupancy timeline", "transform"):
+        df = prepare_timeline(df)
+
+    with stage("draw occupancy chart", "render"):
+        fig = plot_occupancy(df)
+
+    # Create directory if it doesn't exist
+    output_dir = os.path.join('visualizations', 'pngs')
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Save the figure to the specified directory
+    output_path = os.path.join(output_dir, 'city_occupancy_trend.png')
+    with stage("save city_occupancy_trend.png", "save"):
+        plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close(fig)
 
-# Save the figure to the specified directory
-output_path = os.path.join(output_dir, 'city_occupancy_trend.png')
-plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    print(f"Plot saved successfully to {output_path}")
 
-print(f"Plot saved successfully to {output_path}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,17 @@
+import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
-import numpy as np
 import matplotlib as mpl
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from instrumentation import stage, instrument
+from ingest import AGGREGATES, summarize, finalize, load_aggregate
+
 # Set up dark mode theme
-plt.style.use('dark_background')
 dark_bg_color = '#141414'  # Changed to a more proper dark-grey
 text_color = 'white'
 
-# Load the data
-df = pd.read_csv("data/Cleaned PAD.csv")
-
-# Filter for premium quality properties
-premium_df = df[df['is_premium_quality'] == 1].copy()
-
-# Create a new column for year_quarter for easier grouping
-premium_df.loc[:, 'year_quarter'] = premium_df['year'].astype(str) + '-Q' + premium_df['quarter'].astype(str)
-
-# Create a list of all year_quarter combinations for sorting
-year_quarters = sorted(premium_df['year_quarter'].unique())
-
-# Print available date range in dataset
-print(f"Available date range in dataset: {year_quarters[0]} to {year_quarters[-1]}")
-
-# Calculate the weighted average national direct rent for each quarter and year
-national_avg_results = []
-for yq in year_quarters:
-    subset = premium_df[premium_df['year_quarter'] == yq]
-    numerator = np.sum(subset['direct_available_space'] * subset['direct_internal_class_rent'])
-    denominator = np.sum(subset['direct_available_space'])
-    avg = numerator / denominator if denominator > 0 else np.nan
-    national_avg_results.append({'year_quarter': yq, 'avg_national_direct_rent': avg})
-
-national_avg_df = pd.DataFrame(national_avg_results)
-
-# Merge the national average back to the premium dataframe
-premium_df = pd.merge(premium_df, national_avg_df, on='year_quarter')
-
-# Calculate each market's direct rent relative to the national average
-premium_df['relative_direct_rent'] = premium_df['direct_internal_class_rent'] / premium_df['avg_national_direct_rent']
-
 # List of all markets
 markets = [
     "Atlanta", "Austin", "Baltimore", "Boston", "Charlotte", "Chicago Suburbs",
@@ -53,122 +25,189 @@ markets = [
 # Updated list of highlighted markets
 highlighted_markets = ["Manhattan", "San Francisco", "Boston", "Detroit", "Dallas-Ft. Worth"] 
 
-# Filter for only the markets we want to plot
-plot_df = premium_df[premium_df['market'].isin(markets)]
+def load_data():
+    """Load the cleaned PAD data"""
+    with stage("read Cleaned PAD.csv", "load"):
+        # Load the data
+        df = pd.read_csv("data/Cleaned PAD.csv")
+    return df
 
-# Create the plot with dark background
-plt.figure(figsize=(18, 10))
-fig = plt.gcf()
-ax = plt.gca()
-fig.patch.set_facecolor(dark_bg_color)
-ax.set_facecolor(dark_bg_color)
+def compute_relative_direct_rent(df, national=None):
+    """Compute each market's direct rent relative to the space-weighted national average"""
+    # Filter for premium quality properties
+    premium_df = df[df['is_premium_quality'] == 1].copy()
 
-# Define color palette for highlighted markets
-highlighted_colors = ['#FF5555', '#50FA7B', '#8BE9FD', '#F1FA8C', '#FF5733'] 
+    # Create a new column for year_quarter for easier grouping
+    premium_df.loc[:, 'year_quarter'] = premium_df['year'].astype(str) + '-Q' + premium_df['quarter'].astype(str)
 
-# Add a horizontal line at y=1 (national average)
-plt.axhline(y=1, color='#F8F8F2', linestyle='-', linewidth=2.5, alpha=0.8, label='National Average')
+    # Create a list of all year_quarter combinations for sorting
+    year_quarters = sorted(premium_df['year_quarter'].unique())
 
-# Plot all non-highlighted markets in grey first (so they're in the background)
-for market in markets:
-    if market not in highlighted_markets:
-        market_data = plot_df[plot_df['market'] == market]
+    # Print available date range in dataset
+    print(f"Available date range in dataset: {year_quarters[0]} to {year_quarters[-1]}")
+
+    # Space-weighted national average direct rent for each quarter and year; main() passes the
+    # running totals kept by ingest.py, otherwise they are summed from df
+    if national is None:
+        national = finalize(summarize(df, AGGREGATES['national_rents']), AGGREGATES['national_rents']).reset_index()
+    national_avg_df = national[national['is_premium_quality'] == 1][['year', 'quarter', 'avg_national_direct_internal_class_rent']]
+    national_avg_df = national_avg_df.rename(columns={'avg_national_direct_internal_class_rent': 'avg_national_direct_rent'})
+
+    # Merge the national average back to the premium dataframe
+    premium_df = pd.merge(premium_df, national_avg_df, on=['year', 'quarter'])
+
+    # Calculate each market's direct rent relative to the national average
+    premium_df['relative_direct_rent'] = premium_df['direct_internal_class_rent'] / premium_df['avg_national_direct_rent']
+
+    return premium_df, year_quarters
+
+def plot_relative_direct_rent(premium_df, year_quarters, highlighted=None):
+    """Draw the relative direct rent chart on a new figure and return it"""
+    # Markets drawn in color; the rest are grey
+    highlighted = highlighted or highlighted_markets
+
+    plt.style.use('dark_background')
+
+    # Filter for only the markets we want to plot
+    plot_df = premium_df[premium_df['market'].isin(markets)]
+
+    # Create the plot with dark background
+    plt.figure(figsize=(18, 10))
+    fig = plt.gcf()
+    ax = plt.gca()
+    fig.patch.set_facecolor(dark_bg_color)
+    ax.set_facecolor(dark_bg_color)
+
+    # Define color palette for highlighted markets
+    highlighted_colors = ['#FF5555', '#50FA7B', '#8BE9FD', '#F1FA8C', '#FF5733'] 
+
+    # Add a horizontal line at y=1 (national average)
+    plt.axhline(y=1, color='#F8F8F2', linestyle='-', linewidth=2.5, alpha=0.8, label='National Average')
+
+    # Plot all non-highlighted markets in grey first (so they're in the background)
+    for market in markets:
+        if market not in highlighted:
+            market_data = plot_df[plot_df['market'] == market]
         
-        # Skip if market has no data
-        if market_data.empty:
-            continue
+            # Skip if market has no data
+            if market_data.empty:
+                continue
         
-        # Sort by year_quarter to ensure proper line connectivity
-        market_data = market_data.sort_values('year_quarter')
+            # Sort by year_quarter to ensure proper line connectivity
+            market_data = market_data.sort_values('year_quarter')
         
-        # Convert year_quarter to numeric indices for plotting
-        x_indices = [year_quarters.index(yq) for yq in market_data['year_quarter']]
+            # Convert year_quarter to numeric indices for plotting
+            x_indices = [year_quarters.index(yq) for yq in market_data['year_quarter']]
         
-        # Updated to make grey lines more noticeable
-        plt.plot(x_indices, market_data['relative_direct_rent'].values, 
-                 color='#B3B3B3', alpha=0.2, linewidth=1.5)
+            # Updated to make grey lines more noticeable
+            plt.plot(x_indices, market_data['relative_direct_rent'].values, 
+                     color='#B3B3B3', alpha=0.2, linewidth=1.5)
 
-# Now plot highlighted markets with distinct colors
-for i, market in enumerate(highlighted_markets):
-    market_data = plot_df[plot_df['market'] == market]
+    # Now plot highlighted markets with distinct colors
+    for i, market in enumerate(highlighted):
+        market_data = plot_df[plot_df['market'] == market]
     
-    # Skip if market has no data
-    if market_data.empty:
-        continue
+        # Skip if market has no data
+        if market_data.empty:
+            continue
     
-    # Sort by year_quarter to ensure proper line connectivity
-    market_data = market_data.sort_values('year_quarter')
+        # Sort by year_quarter to ensure proper line connectivity
+        market_data = market_data.sort_values('year_quarter')
     
-    # Convert year_quarter to numeric indices for plotting
-    x_indices = [year_quarters.index(yq) for yq in market_data['year_quarter']]
+        # Convert year_quarter to numeric indices for plotting
+        x_indices = [year_quarters.index(yq) for yq in market_data['year_quarter']]
     
-    # Plot with a distinct color from our palette
-    plt.plot(x_indices, market_data['relative_direct_rent'].values, 
-             color=highlighted_colors[i % len(highlighted_colors)], 
-             linewidth=2.5,  # Increased linewidth for highlighted markets
-             label=market)
-
-# Add a vertical line for COVID-19 (around Q1 2020)
-if '2020-Q1' in year_quarters:
-    idx = year_quarters.index('2020-Q1')
-    plt.axvline(x=idx, color='#FF5555', linestyle='--', 
-                linewidth=2.0, alpha=0.7, label='COVID-19 Start (Q1 2020)')
-
-# Customize the plot with increased font sizes and bold text
-plt.title('Market Direct Rent Relative to National Average (Premium Properties)', 
-          fontsize=26, color=text_color, weight='bold', pad=40)
-plt.xlabel('Year-Quarter', fontsize=20, color=text_color, weight='bold')
-plt.ylabel('Relative\n Direct\n Rent', fontsize=20, color=text_color, weight='bold', rotation=0)
-ax.yaxis.set_label_coords(-0.125, 0.4)
-
-# Set grid for horizontal lines only - more visible now
-plt.grid(True, axis='y', linestyle='--', alpha=0.4, color='#CCCCCC')
-plt.grid(False, axis='x')
-
-# Update tick colors and sizes
-plt.tick_params(axis='both', colors=text_color, labelsize=18)
-for spine in ax.spines.values():
-    spine.set_color(text_color)
-    spine.set_linewidth(1.5)  # Make the axis lines more visible
-
-# Format x-axis labels to show YYYY-Q# for first quarter, Q# for subsequent quarters in the same year
-formatted_labels = []
-prev_year = None
-
-for yq in year_quarters:
-    # Extract year and quarter from the year_quarter string
-    if '-Q' in yq:
-        year, quarter = yq.split('-Q')
-    else:
-        # Fallback for unexpected format
-        formatted_labels.append(yq)
-        continue
+        # Plot with a distinct color from our palette
+        plt.plot(x_indices, market_data['relative_direct_rent'].values, 
+                 color=highlighted_colors[i % len(highlighted_colors)], 
+                 linewidth=2.5,  # Increased linewidth for highlighted markets
+                 label=market)
+
+    # Add a vertical line for COVID-19 (around Q1 2020)
+    if '2020-Q1' in year_quarters:
+        idx = year_quarters.index('2020-Q1')
+        plt.axvline(x=idx, color='#FF5555', linestyle='--', 
+                    linewidth=2.0, alpha=0.7, label='COVID-19 Start (Q1 2020)')
+
+    # Customize the plot with increased font sizes and bold text
+    plt.title('Market Direct Rent Relative to National Average (Premium Properties)', 
+              fontsize=26, color=text_color, weight='bold', pad=40)
+    plt.xlabel('Year-Quarter', fontsize=20, color=text_color, weight='bold')
+    plt.ylabel('Relative\n Direct\n Rent', fontsize=20, color=text_color, weight='bold', rotation=0)
+    ax.yaxis.set_label_coords(-0.125, 0.4)
+
+    # Set grid for horizontal lines only - more visible now
+    plt.grid(True, axis='y', linestyle='--', alpha=0.4, color='#CCCCCC')
+    plt.grid(False, axis='x')
+
+    # Update tick colors and sizes
+    plt.tick_params(axis='both', colors=text_color, labelsize=18)
+    for spine in ax.spines.values():
+        spine.set_color(text_color)
+        spine.set_linewidth(1.5)  # Make the axis lines more visible
+
+    # Format x-axis labels to show YYYY-Q# for first quarter, Q# for subsequent quarters in the same year
+    formatted_labels = []
+    prev_year = None
+
+    for yq in year_quarters:
+        # Extract year and quarter from the year_quarter string
+        if '-Q' in yq:
+            year, quarter = yq.split('-Q')
+        else:
+            # Fallback for unexpected format
+            formatted_labels.append(yq)
+            continue
     
-    # For the first quarter of each year or the first element, show YYYY-Q#
-    if year != prev_year:
-        formatted_labels.append(f"{year} {quarter}")
-        prev_year = year
-    else:
-        # For subsequent quarters in the same year, just show Q#
-        formatted_labels.append(f"{quarter}")
-
-plt.xticks(range(len(year_quarters)), 
-           formatted_labels, 
-           rotation=45, ha='right', color=text_color, fontsize=18, fontweight='bold')
-
-plt.xticks(range(len(year_quarters)), 
-           formatted_labels, 
-           rotation=45, ha='right', color=text_color, fontsize=18, fontweight='bold')
-
-# Add legend - only include highlighted markets and national average
-handles, labels = plt.gca().get_legend_handles_labels()
-plt.legend(handles, labels, loc='upper left', bbox_to_anchor=(1.01, 1), 
-           borderaxespad=0., fontsize=20, facecolor=dark_bg_color, edgecolor='gray',
-           labelcolor=text_color, framealpha=0.9)
-
-# Adjust layout
-plt.tight_layout()
-
-# Save the figure to the specified path
-plt.savefig('visualizations/pngs/relative_direct_rent_premium.png', 
-            dpi=300, bbox_inches='tight', facecolor=dark_bg_color)
\ No newline at end of file
+        # For the first quarter of each year or the first element, show YYYY-Q#
+        if year != prev_year:
+            formatted_labels.append(f"{year} {quarter}")
+            prev_year = year
+        else:
+            # For subsequent quarters in the same year, just show Q#
+            formatted_labels.append(f"{quarter}")
+
+    plt.xticks(range(len(year_quarters)), 
+               formatted_labels, 
+               rotation=45, ha='right', color=text_color, fontsize=18, fontweight='bold')
+
+    plt.xticks(range(len(year_quarters)), 
+               formatted_labels, 
+               rotation=45, ha='right', color=text_color, fontsize=18, fontweight='bold')
+
+    # Add legend - only include highlighted markets and national average
+    handles, labels = plt.gca().get_legend_handles_labels()
+    plt.legend(handles, labels, loc='upper left', bbox_to_anchor=(1.01, 1), 
+               borderaxespad=0., fontsize=20, facecolor=dark_bg_color, edgecolor='gray',
+               labelcolor=text_color, framealpha=0.9)
+
+    # Adjust layout
+    plt.tight_layout()
+
+    return fig
+
+@instrument("chart")
+def main(highlight=None):
+    """Draw the chart; highlight='clusters' colors one representative market per trajectory cluster"""
+    df = load_data()
+
+    highlighted = None
+    if highlight == 'clusters':
+        from clustering import representative_markets
+        highlighted = representative_markets(['relative_direct_rent'], k=5, markets=markets)
+        print(f"Highlighting cluster representatives: {', '.join(highlighted)}")
+
+    with stage("relative direct rent", "aggregate"):
+        premium_df, year_quarters = compute_relative_direct_rent(df, load_aggregate('national_rents'))
+
+    with stage("draw relative direct rent chart", "render"):
+        fig = plot_relative_direct_rent(premium_df, year_quarters, highlighted)
+
+    with stage("save relative_direct_rent_premium.png", "save"):
+        # Save the figure to the specified path
+        plt.savefig('visualizations/pngs/relative_direct_rent_premium.png', 
+                    dpi=300, bbox_inches='tight', facecolor=dark_bg_color)
+    plt.close(fig)
+
+if __name__ == "__main__":
+    main()
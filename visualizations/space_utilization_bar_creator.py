@@ -1,6 +1,14 @@
+import os
+import sys
+from contextlib import nullcontext
 from space_utilization_and_rent_trends import space_utlization_bar
 
-def main():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from instrumentation import instrument
+from chart_report import ChartReport
+
+@instrument("chart", name="stacked bar batch")
+def main(selected_markets=None, report=None):
     # List of all markets to process
     markets = [
         "Atlanta",
@@ -32,6 +40,10 @@ def main():
         "Tampa"
     ]
     
+    # Only process the requested markets, if any were given
+    if selected_markets:
+        markets = list(selected_markets)
+    
     # Quality levels: 0 for standard, 1 for premium
     quality_levels = [0, 1]
     
@@ -40,23 +52,30 @@ def main():
     processed = 0
     
     print(f"Starting to generate {total_charts} visualizations...")
+
+    # With a report path every chart becomes a page of one PDF/HTML file instead of a PNG
+    entries = [(market, "Premium" if quality == 1 else "Standard") for market in markets for quality in quality_levels]
+    book = ChartReport(report, "Space Utilization and Rent by Market", entries) if report else nullcontext()
     
     # Process each market with both quality levels
-    for market in markets:
-        for quality in quality_levels:
-            # Create a descriptive string for the quality level
-            quality_str = "Premium" if quality == 1 else "Standard"
+    with book:
+        for market in markets:
+            for quality in quality_levels:
+                # Create a descriptive string for the quality level
+                quality_str = "Premium" if quality == 1 else "Standard"
             
-            # Show progress
-            processed += 1
-            print(f"[{processed}/{total_charts}] Processing {market} ({quality_str})")
+                # Show progress
+                processed += 1
+                print(f"[{processed}/{total_charts}] Processing {market} ({quality_str})")
             
-            try:
-                # Call the visualization function
-                space_utlization_bar(market, quality)
-                print(f"✓ Successfully created visualization for {market} ({quality_str})")
-            except Exception as e:
-                print(f"✗ Error creating visualization for {market} ({quality_str}): {str(e)}")
+                try:
+                    # Call the visualization function
+                    space_utlization_bar(market, quality, report=book if report else None)
+                    print(f"✓ Successfully created visualization for {market} ({quality_str})")
+                except Exception as e:
+                    print(f"✗ Error creating visualization for {market} ({quality_str}): {str(e)}")
+                    if report:
+                        book.skip(f"{market} ({quality_str}): {e}")
     
     print(f"\nCompleted generating {processed}/{total_charts} visualizations.")
 